@@ -19,6 +19,7 @@ from .connection import get_connection
 from .query import query, return_random
 from .scenario import scenario
 from .query_result import QueryResult
+from .fanout import gather
 
 
 __version__ = "0.8.6"
@@ -0,0 +1,223 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Asyncio engine for large populations of lightweight virtual users.
+
+Virtual users of :class:`AsyncRunner` are coroutines on a single event
+loop, so thousands of them cost little more than their think times.
+JDBC calls block, so they are dispatched to a thread pool executor with
+as many threads as the connection pool has connections. Every call
+borrows a pooled connection only for its own duration.
+
+Scenarios declared with ``async def`` receive an :class:`AsyncConnection`
+and await the queries they run::
+
+    @scenario
+    async def browse(connection):
+        products = await connection.query(select_products)
+        await asyncio.sleep(2.0)
+        await connection.query(select_product_details, products.rows[0][0])
+
+Plain scenarios can be run by the async engine as well, each invocation
+taking one pooled connection on an executor thread.
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+from .connection import ConnectionPool
+from .context_singleton import get_context
+from .runner import Runner
+from .exceptions import ScenarioExecutionError
+
+
+class AsyncConnection:
+    """Handle through which async scenarios run blocking database calls.
+
+    It is not a connection itself: every call borrows a connection from
+    the pool on an executor thread and returns it when done, so
+    consecutive calls may run on different connections. Use :meth:`run`
+    to execute several statements in one transaction.
+
+    Args:
+        pool (ConnectionPool): Pool to borrow connections from.
+        executor (ThreadPoolExecutor): Executor running the blocking
+            calls, sized to the pool.
+    """
+
+    def __init__(self, pool: ConnectionPool, executor: ThreadPoolExecutor) -> None:
+        self.pool = pool
+        self.executor = executor
+        self._closed = False
+
+    def _borrow(self, function: Callable, *args, **kwargs) -> Any:
+        with self.pool.connection() as connection:
+            return function(connection, *args, **kwargs)
+
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """Call ``function(connection, *args, **kwargs)`` on an executor thread."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(self._borrow, function, *args, **kwargs),
+        )
+
+    async def query(self, query_function: Callable, *args, **kwargs) -> Any:
+        """Run function decorated by :meth:`~dbload.query.query` on a fresh cursor."""
+
+        def _query(connection):
+            with connection.cursor() as cursor:
+                return query_function(cursor, *args, **kwargs)
+
+        return await self.run(_query)
+
+
+def run_scenario(function: Callable, *args, pool_size: int = 1, **kwargs) -> Any:
+    """Run a scenario outside of a runner, e.g. from ``dbload scenario``.
+
+    Async scenarios get their own event loop and a small pool.
+    """
+
+    if not inspect.iscoroutinefunction(function):
+        return function(*args, **kwargs)
+
+    async def _main():
+        pool = ConnectionPool(size=pool_size)
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            try:
+                return await function(AsyncConnection(pool, executor), *args, **kwargs)
+            finally:
+                pool.close()
+
+    return asyncio.run(_main())
+
+
+class AsyncRunner(Runner):
+    """Closed-loop runner with virtual users as coroutines.
+
+    Accepts the same arguments as :class:`~dbload.runner.Runner`, except
+    that the connection pool is not sized to the number of users: a
+    small pool serves any number of them.
+
+    Args:
+        pool_size (int): Size of the connection pool created when no
+            ``pool`` is given, and of the executor.
+    """
+
+    def __init__(
+        self,
+        scenarios: List[str],
+        users: int = 1,
+        pool: Optional[ConnectionPool] = None,
+        pool_size: int = 8,
+        **kwargs,
+    ) -> None:
+        super().__init__(
+            scenarios,
+            users=users,
+            pool=pool or ConnectionPool(size=pool_size),
+            **kwargs,
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def _think(self) -> None:
+        try:
+            await asyncio.wait_for(self._async_stop.wait(), self.think_time)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _async_user(self, index: int, connection: AsyncConnection) -> None:
+        ctx = get_context()
+        functions = [ctx.scenarios[name].function for name in self.scenarios]
+
+        active = False
+        try:
+            i = index
+            while not self._async_stop.is_set():
+                # Users above the target of the load shape stay idle
+                if active != (index < self.target_users):
+                    active = not active
+                    self._active += 1 if active else -1
+                if not active:
+                    await asyncio.sleep(0.05)
+                    continue
+                if not self._next_iteration():
+                    break
+
+                function = functions[i % len(functions)]
+                i += 1
+                try:
+                    if inspect.iscoroutinefunction(function):
+                        await function(connection, ignore=self.ignore)
+                    else:
+                        await connection.run(function, ignore=self.ignore)
+                except ScenarioExecutionError as e:
+                    # Already counted in metrics by the scenario
+                    logger.debug(f"Virtual user {index}: {e}")
+                if self.think_time:
+                    await self._think()
+        finally:
+            if active:
+                self._active -= 1
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._async_stop = asyncio.Event()
+        if self._stop.is_set():
+            self._async_stop.set()
+
+        with ThreadPoolExecutor(
+            max_workers=self.pool.size, thread_name_prefix="dbload-executor"
+        ) as executor:
+            connection = AsyncConnection(self.pool, executor)
+            await asyncio.gather(
+                *(self._async_user(i, connection) for i in range(self.users))
+            )
+
+    def start(self) -> None:
+        """Start the event loop with all virtual users in a background thread."""
+
+        self.metrics.register_gauge("pool.size", lambda: self.pool.size)
+        self.metrics.register_gauge("pool.in_use", lambda: self.pool.in_use)
+        self.metrics.register_gauge("users.active", lambda: self._active)
+        self.metrics.register_gauge("users.target", lambda: self.target_users)
+
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self._main(),), name="dbload-event-loop", daemon=True
+        )
+        self._threads.append(self._thread)
+        self._thread.start()
+        logger.debug(f"Started {self.users} asynchronous virtual users.")
+
+    def stop(self) -> None:
+        """Ask virtual users to finish after their current scenario."""
+
+        self._stop.set()
+        if self._loop is not None and self._async_stop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_stop.set)
+            except RuntimeError:
+                # Event loop is already closed
+                pass
@@ -0,0 +1,290 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Create the dramatiq broker from ``broker_url``.
+
+Supported URL schemes:
+
+* ``amqp://``, ``amqps://`` – RabbitMQ;
+* ``redis://``, ``rediss://`` – Redis, requires the ``redis`` package;
+* ``local://`` – in-process broker, messages are executed by a pool of
+  worker threads in the same process. ``local://?threads=16`` sets the
+  size of the pool, 8 by default. Failed messages are not retried,
+  unless ``max_retries`` is set for their actor;
+* ``stub://`` – dramatiq stub broker without workers, for tests.
+
+All of them require the optional ``dramatiq`` package.
+
+Actors of queries and scenarios accept these options, taken from the
+``actors`` config section or from ``option: key=value`` annotations of
+queries:
+
+* ``queue`` – name of the queue, so that slow scenarios can be served
+  by dedicated workers (``dbload worker --queues``);
+* ``priority`` – dramatiq priority, lower values are processed first;
+* ``max_concurrency`` – maximum number of messages of the actor
+  processed at once in a worker process. Messages over the limit are
+  put back with a short delay instead of occupying a worker thread;
+* ``time_limit`` – seconds, or a duration like ``2m``;
+* ``max_retries`` – number of retries of failed messages.
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+from .load_shape import parse_duration
+from .exceptions import ActorOptionError, UnsupportedBrokerError
+
+
+BROKER_SCHEMES = ("amqp", "amqps", "redis", "rediss", "local", "stub")
+
+# Schemes of brokers without a broker service, whose messages never
+# reach separate worker processes
+LOCAL_SCHEMES = ("local", "stub")
+
+# Seconds to wait for messages of a local broker on shutdown
+JOIN_TIMEOUT = 600.0
+
+# Option names accepted in config and annotations and their dramatiq names
+ACTOR_OPTIONS = {
+    "queue": "queue_name",
+    "queue_name": "queue_name",
+    "priority": "priority",
+    "max_concurrency": "max_concurrency",
+    "time_limit": "time_limit",
+    "max_retries": "max_retries",
+}
+
+
+def _local_broker_class():
+    from dramatiq import Worker
+    from dramatiq.brokers.stub import StubBroker
+    from dramatiq.middleware import Retries
+
+    class LocalBroker(StubBroker):
+        """Stub broker executing its messages in the same process.
+
+        The worker pool starts with the first enqueued message.
+        """
+
+        def __init__(self, threads: int = 8, middleware=None) -> None:
+            super().__init__(middleware=middleware)
+            self.threads = threads
+            self.worker: Optional[Worker] = None
+            # Retries with backoff would keep join_all() waiting for days
+            for m in self.middleware:
+                if isinstance(m, Retries):
+                    m.max_retries = 0
+
+        def start_worker(self) -> None:
+            if self.worker is not None:
+                return
+            self.emit_after("process_boot")
+            self.worker = Worker(self, worker_threads=self.threads, worker_timeout=100)
+            self.worker.start()
+            logger.debug(f"Started in-process worker with {self.threads} threads.")
+
+        def enqueue(self, message, *, delay=None):
+            self.start_worker()
+            return super().enqueue(message, delay=delay)
+
+        def join_all(self, timeout: Optional[int] = None) -> None:
+            """Wait until all queues are empty and their messages done."""
+
+            for queue_name in list(self.queues):
+                self.join(queue_name, timeout=timeout)
+
+        def close(self) -> None:
+            if self.worker is not None:
+                self.worker.stop()
+                self.worker = None
+            super().close()
+
+    return LocalBroker
+
+
+def broker_scheme(url: str) -> str:
+    """Lowercase scheme of broker ``url``, e.g. ``amqp``."""
+
+    return urlsplit(url).scheme.lower()
+
+
+def is_local_url(url: str) -> bool:
+    """Whether ``url`` selects a broker without a broker service."""
+
+    return broker_scheme(url) in LOCAL_SCHEMES
+
+
+def get_broker(url: Optional[str] = None, middleware: Optional[List] = None):
+    """Create broker for ``url``, the ``broker_url`` config by default.
+
+    Raises:
+        UnsupportedBrokerError: when the URL scheme is not supported.
+    """
+
+    if url is None:
+        from .config_singleton import get_config
+
+        url = get_config().broker_url
+
+    parts = urlsplit(url)
+    scheme = broker_scheme(url)
+    if scheme in ("amqp", "amqps"):
+        from dramatiq.brokers.rabbitmq import RabbitmqBroker
+
+        return RabbitmqBroker(url=url, middleware=middleware)
+    if scheme in ("redis", "rediss"):
+        from dramatiq.brokers.redis import RedisBroker
+
+        return RedisBroker(url=url, middleware=middleware)
+    if scheme == "local":
+        query = parse_qs(parts.query)
+        threads = int(query.get("threads", ["8"])[0])
+        return _local_broker_class()(threads=threads, middleware=middleware)
+    if scheme == "stub":
+        from dramatiq.brokers.stub import StubBroker
+
+        return StubBroker(middleware=middleware)
+    raise UnsupportedBrokerError(url, BROKER_SCHEMES)
+
+
+def is_local(broker) -> bool:
+    """Whether messages of ``broker`` are executed in this process."""
+
+    return hasattr(broker, "join_all") and hasattr(broker, "start_worker")
+
+
+def normalize_actor_options(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert actor options of config and annotations for dramatiq.
+
+    Raises:
+        ActorOptionError: when an option is unknown or has a bad value.
+    """
+
+    normalized: Dict[str, Any] = {}
+    for key, value in options.items():
+        option = ACTOR_OPTIONS.get(key)
+        if option is None:
+            raise ActorOptionError(name, key, f"supported options are {sorted(ACTOR_OPTIONS)}")
+        try:
+            if option == "queue_name":
+                normalized[option] = str(value)
+            elif option == "time_limit":
+                normalized[option] = int(parse_duration(value) * 1000)
+            else:
+                normalized[option] = int(value)
+        except ValueError as e:
+            raise ActorOptionError(name, key, f"{e}") from None
+    return normalized
+
+
+def _concurrency_limit_class():
+    from dramatiq import Middleware
+    from dramatiq.middleware import SkipMessage
+
+    class ConcurrencyLimit(Middleware):
+        """Limit messages of an actor processed at once in this process.
+
+        Args:
+            backoff (int): Delay in milliseconds of messages put back
+                because their actor is at its limit.
+        """
+
+        def __init__(self, backoff: int = 100) -> None:
+            self.backoff = backoff
+            self._lock = threading.Lock()
+            self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+            self._held = threading.local()
+
+        @property
+        def actor_options(self):
+            return {"max_concurrency"}
+
+        def _semaphore(self, name: str, limit: int) -> threading.BoundedSemaphore:
+            with self._lock:
+                semaphore = self._semaphores.get(name)
+                if semaphore is None:
+                    semaphore = self._semaphores[name] = threading.BoundedSemaphore(limit)
+                return semaphore
+
+        def before_process_message(self, broker, message):
+            self._held.semaphore = None
+            actor = broker.get_actor(message.actor_name)
+            limit = actor.options.get("max_concurrency")
+            if not limit:
+                return
+            semaphore = self._semaphore(actor.actor_name, limit)
+            if not semaphore.acquire(blocking=False):
+                broker.enqueue(message, delay=self.backoff)
+                raise SkipMessage()
+            self._held.semaphore = semaphore
+
+        def after_process_message(self, broker, message, *, result=None, exception=None):
+            semaphore = getattr(self._held, "semaphore", None)
+            if semaphore is not None:
+                self._held.semaphore = None
+                semaphore.release()
+
+        after_skip_message = after_process_message
+
+    return ConcurrencyLimit
+
+
+def register_actor(broker, function: Callable, options: Optional[Dict[str, Any]] = None):
+    """Register ``function`` as an actor of ``broker`` with ``options``.
+
+    Options are normalized by :func:`normalize_actor_options`.
+    """
+
+    from dramatiq import actor as dramatiq_actor
+
+    options = normalize_actor_options(function.__name__, options or {})
+    if "max_concurrency" in options:
+        limit_class = _concurrency_limit_class()
+        if not any(type(m).__name__ == limit_class.__name__ for m in broker.middleware):
+            broker.add_middleware(limit_class())
+    return dramatiq_actor(function, broker=broker, **options)
+
+
+def register_actors(broker, ctx) -> None:
+    """Register all queries and scenarios of ``ctx`` as actors.
+
+    Raises:
+        ActorOptionError: when options of an actor are invalid.
+    """
+
+    for items in (ctx.queries, ctx.scenarios):
+        for name in items:
+            register_actor(broker, items[name].function, ctx.actor_options(name))
+
+
+def shutdown_broker(broker, timeout: Optional[float] = JOIN_TIMEOUT) -> None:
+    """Close ``broker``, finishing local messages first.
+
+    Args:
+        timeout (float): Seconds to wait for local messages, ``None``
+            waits for as long as they take.
+    """
+
+    if is_local(broker):
+        from dramatiq.errors import QueueJoinTimeout
+
+        try:
+            broker.join_all(timeout=None if timeout is None else int(timeout * 1000))
+        except QueueJoinTimeout:
+            logger.warning(f"Local messages were not finished within {timeout} seconds.")
+    broker.close()
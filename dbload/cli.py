@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import sys
+import inspect
 import importlib
 from pathlib import Path
 
@@ -24,6 +25,7 @@ from mapz import Mapz
 from .context_singleton import get_context
 from .config_singleton import get_config
 from .connection import get_connection
+from .broker import is_local_url
 from .query_result import QueryResult
 from . import __version__
 
@@ -144,7 +146,251 @@ def scenario(scenario_name, **kwargs):
     if not config.quiet:
         click.echo(f"Executing: {scenario_name}")
 
-    ctx.scenarios[scenario_name].function(ignore=config.ignore)
+    from .aio import run_scenario
+
+    run_scenario(ctx.scenarios[scenario_name].function, ignore=config.ignore)
+
+
+@main.command(help="Run scenarios in a loop on many virtual users.")
+@click.argument("scenario_names", metavar="SCENARIOS", nargs=-1)
+@click.option("-u", "--users", help="Number of virtual users.", type=int, default=1)
+@click.option("-t", "--duration", help="Duration of the run in seconds.", type=float)
+@click.option("-n", "--iterations", help="Total number of scenario executions.", type=int)
+@click.option("--think-time", help="Pause of a virtual user after each scenario in seconds.", type=float, default=0.0)
+@click.option("-j", "--processes", help="Number of processes, each with its own JVM and connection pool.", type=int)
+@click.option("--engine", help="Run virtual users as threads or as coroutines. Async scenarios always use asyncio.", type=click.Choice(["threads", "asyncio"]), default="threads", show_default=True)
+@click.option("--pipeline", help="Generate parameters ahead of their use in producer threads or processes.", type=click.Choice(["threads", "processes"]))
+@click.option("--pipeline-producers", help="Number of producers of every parameter pipeline.", type=int)
+@click.option("--pipeline-depth", help="Maximum number of parameter sets prepared ahead.", type=int)
+@click.option("--shape", help="Load shape, e.g. 'ramp(10, 500, 10m)', 'step(10, 50, 2m, 500)', 'spike(50, 500, 5m, 30s)' or 'sine(250, 200, 24h)'.", type=str)
+@click.option("--warmup", help="Warm-up in seconds, excluded from the measurements.", type=float)
+@click.option("--warmup-iterations", help="Warm-up in scenario executions, excluded from the measurements.", type=int)
+@click.option("--dashboard/--no-dashboard", help="Show live dashboard. Enabled by default in terminals.", default=None)
+@click.option("--refresh", help="Dashboard refresh interval in seconds.", type=float, default=0.25)
+@click.option("--metrics-port", help="Serve OpenMetrics endpoint on this port.", type=int)
+@click.option("--report", help="Write JSON or CSV report of the run to this path.", type=str)
+@click.option("--report-interval", help="Interval of the report time series in seconds.", type=float)
+@click.option("--threshold", "thresholds", help="Threshold failing the run, e.g. 'create_sale.p99 < 20ms'.", multiple=True)
+@click.option("--abort-on-threshold", help="Stop the run as soon as a threshold is violated.", is_flag=True)
+@decorate_with_common_options
+def run(scenario_names, users, duration, iterations, think_time, engine, dashboard, refresh, **kwargs):
+    update_cli_args(kwargs)
+    global cli_args
+    config = get_config(cli_args)
+
+    # Read SQL files and infuse context based on them
+    ctx = get_context()
+    ctx.infuse()
+
+    from .runner import Runner
+    from .dashboard import Dashboard, phase_table, summary_table
+    from .metrics_singleton import get_metrics
+    from .report import TimeSeries, build_report, summarize_snapshot, workload_hash, write_report
+    from .thresholds import THRESHOLDS_FAILED_EXIT_CODE, ThresholdMonitor, evaluate, parse_thresholds, threshold_table
+    from .load_shape import parse_shape
+    from .exceptions import LoadShapeError, ScenarioNotFoundError, ThresholdSyntaxError
+
+    # Setup and teardown are not part of the load by default
+    scenario_names = list(scenario_names) or [s for s in ctx.scenarios if s not in ("setup", "teardown")]
+    if not scenario_names:
+        click.echo("There are no scenarios to run.", err=True)
+        sys.exit(1)
+
+    try:
+        thresholds = parse_thresholds(list(config.thresholds))
+        shape = parse_shape(config.shape) if config.shape else None
+    except (ThresholdSyntaxError, LoadShapeError) as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(1)
+
+    # Coroutine virtual users share a pool sized by the config,
+    # while every thread virtual user gets a connection of its own.
+    runner_options = {}
+    if engine == "asyncio" or any(inspect.iscoroutinefunction(ctx.scenarios[s].function) for s in scenario_names if s in ctx.scenarios):
+        from .aio import AsyncRunner
+
+        runner_class = AsyncRunner
+        runner_options["pool_size"] = config.pool_size
+    else:
+        runner_class = Runner
+
+    pipelines = []
+    if config.pipeline:
+        from .pipeline import attach_pipelines
+
+        pipelines = attach_pipelines(ctx, config.pipeline_producers, config.pipeline_depth, config.pipeline, get_metrics())
+        if not config.quiet:
+            click.echo(f"Generating parameters of {[p.name for p in pipelines]} in {config.pipeline_producers} {config.pipeline}.")
+
+    if config.processes > 1:
+        from .multiprocess import ProcessRunner
+
+        runner_options["runner_class"] = runner_class
+        runner_options["processes"] = config.processes
+        runner_class = ProcessRunner
+
+    try:
+        runner = runner_class(
+            scenario_names,
+            users=users,
+            duration=duration,
+            iterations=iterations,
+            think_time=think_time,
+            ignore=config.ignore,
+            warmup=config.warmup,
+            warmup_iterations=config.warmup_iterations,
+            shape=shape,
+            **runner_options,
+        )
+    except ScenarioNotFoundError as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(1)
+
+    if dashboard is None:
+        dashboard = sys.stdout.isatty() and not config.quiet
+    live = Dashboard(get_metrics(), interval=refresh, snapshot=runner.snapshot) if dashboard else None
+
+    exporter = None
+    if config.metrics_port:
+        from .exporter import MetricsExporter, register_process_gauges
+
+        if config.processes > 1:
+            # Child processes report through the runner
+            exporter = MetricsExporter(None, host=config.metrics_host, port=config.metrics_port)
+            runner.on_snapshot(exporter.push)
+        else:
+            register_process_gauges(get_metrics())
+            exporter = MetricsExporter(get_metrics(), host=config.metrics_host, port=config.metrics_port)
+        exporter.start()
+
+    timeseries = TimeSeries(interval=config.report_interval, snapshot=runner.snapshot) if config.report else None
+    if timeseries:
+        runner.on_warmup_end(lambda snapshot: timeseries.boundary("warmup_end", snapshot))
+
+    if not config.quiet:
+        click.echo(f"Running {scenario_names} on {'up to ' if shape else ''}{runner.users} virtual users" + (f" in {config.processes} processes." if config.processes > 1 else "."))
+        if runner.warming_up:
+            click.echo("Warming up, measurements start after the warm-up.")
+
+    monitor = None
+    if thresholds:
+        monitor = ThresholdMonitor(
+            thresholds,
+            snapshot=runner.snapshot,
+            grace=config.threshold_grace,
+            on_violation=(lambda violations: runner.stop()) if config.abort_on_threshold else None,
+        )
+
+    runner.start()
+    if live:
+        live.start()
+    if timeseries:
+        timeseries.start()
+    if monitor:
+        monitor.start()
+    try:
+        runner.wait()
+    finally:
+        if monitor:
+            monitor.stop()
+        if timeseries:
+            timeseries.stop()
+        if live:
+            live.stop()
+        if exporter:
+            exporter.stop()
+        runner.close()
+        if pipelines:
+            from .pipeline import detach_pipelines
+
+            detach_pipelines(ctx)
+
+    snapshot = runner.snapshot()
+    measured, violations = evaluate(thresholds, snapshot, runner.elapsed)
+    if config.report:
+        report = build_report(
+            snapshot,
+            runner.elapsed,
+            config=config.to_dict(),
+            workload=workload_hash(ctx, scenario_names),
+            timeseries=timeseries,
+            run=dict(scenarios=scenario_names, users=runner.users, duration=duration, iterations=iterations, think_time=think_time),
+            thresholds=[dict(threshold=t.text, actual=actual, ok=actual is not None and t.check(actual)) for t, actual in measured],
+            warmup=dict(elapsed=runner.measured_from - runner.started_at, **summarize_snapshot(runner.warmup_snapshot, runner.measured_from - runner.started_at)) if runner.warmup_snapshot else None,
+        )
+        for path in write_report(report, config.report):
+            if not config.quiet:
+                click.echo(f"Report written to {path}")
+
+    if not config.quiet:
+        print(summary_table(snapshot, runner.elapsed))
+        if any(s.phases for s in snapshot.queries.values()):
+            print(phase_table(snapshot))
+        if measured:
+            print(threshold_table(measured))
+
+    if violations:
+        aborted = " Run was aborted early." if monitor and monitor.violations and config.abort_on_threshold else ""
+        click.echo(f"{len(violations)} of {len(thresholds)} thresholds violated.{aborted}", err=True)
+        sys.exit(THRESHOLDS_FAILED_EXIT_CODE)
+
+
+@main.command("find-max", help="Search for the concurrency with maximum sustainable throughput.")
+@click.argument("scenario_names", metavar="SCENARIOS", nargs=-1)
+@click.option("--start-users", help="First number of virtual users.", type=int, default=1, show_default=True)
+@click.option("--max-users", help="Upper limit of virtual users.", type=int, default=256, show_default=True)
+@click.option("--growth", help="Factor between levels until the first failure.", type=float, default=2.0, show_default=True)
+@click.option("--step-duration", help="Seconds every level is measured for.", type=float, default=10.0, show_default=True)
+@click.option("--slo", help="Threshold every accepted level must hold, e.g. 'p99 < 20ms'.", multiple=True)
+@click.option("--min-gain", help="Minimal relative throughput increase between levels.", type=float, default=0.05, show_default=True)
+@decorate_with_common_options
+def find_max(scenario_names, start_users, max_users, growth, step_duration, slo, min_gain, **kwargs):
+    update_cli_args(kwargs)
+    global cli_args
+    config = get_config(cli_args)
+
+    # Read SQL files and infuse context based on them
+    ctx = get_context()
+    ctx.infuse()
+
+    from .find_max import SaturationFinder, saturation_table
+    from .thresholds import parse_thresholds
+    from .exceptions import ScenarioNotFoundError, ThresholdSyntaxError
+
+    scenario_names = list(scenario_names) or [s for s in ctx.scenarios if s not in ("setup", "teardown")]
+    if not scenario_names:
+        click.echo("There are no scenarios to run.", err=True)
+        sys.exit(1)
+
+    try:
+        finder = SaturationFinder(
+            scenario_names,
+            start_users=start_users,
+            max_users=max_users,
+            growth=growth,
+            step_duration=step_duration,
+            slo=parse_thresholds(list(slo)),
+            min_gain=min_gain,
+            ignore=config.ignore,
+        )
+    except (ScenarioNotFoundError, ThresholdSyntaxError) as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(1)
+
+    if not config.quiet:
+        click.echo(f"Searching for the knee of {scenario_names} between {start_users} and {max_users} users.")
+
+    try:
+        result = finder.run()
+    finally:
+        finder.runner.close()
+
+    print(saturation_table(result))
+    if result.knee is None:
+        click.echo("Even the first level failed, no knee found.", err=True)
+        sys.exit(1)
+    if not config.quiet:
+        click.echo(f"Knee: {result.knee.users} users, {result.knee.throughput:.1f} ops/s, p99 {result.knee.p99_ms:.2f} ms.")
 
 
 @main.command(help="Execute a query.")
@@ -209,6 +455,124 @@ def execute(statement, limit, property, **kwargs):
     connection.commit()
 
 
+@main.command(help="Replay captured statement log against the database.")
+@click.argument("log", type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option("--speed", help="Replay speed-up factor. 0 ignores captured timing.", type=float, default=1.0)
+@click.option("--connections", help="Number of connections to map captured sessions onto.", type=int)
+@click.option("--queue-size", help="Maximum number of pending statements per connection.", type=int, default=1000)
+@decorate_with_common_options
+def replay(log, speed, connections, queue_size, **kwargs):
+    update_cli_args(kwargs)
+    global cli_args
+    config = get_config(cli_args)
+
+    # Read SQL files and infuse context based on them
+    ctx = get_context()
+    ctx.infuse()
+
+    from .connection import ConnectionPool
+    from .replay import Replayer, open_log
+    from .exceptions import QueryExecutionError, ReplayLogFormatError
+
+    connections = connections or config.pool_size
+    pool = ConnectionPool(size=connections)
+    replayer = Replayer(pool, connections=connections, speed=speed, queue_size=queue_size, ignore=config.ignore)
+
+    if not config.quiet:
+        click.echo(f"Replaying: {log} (speed x{speed}, {connections} connections)")
+
+    try:
+        stats = replayer.run(open_log(log))
+    except (QueryExecutionError, ReplayLogFormatError) as e:
+        click.echo(f"Replay failed: {e}", err=True)
+        sys.exit(1)
+    finally:
+        pool.close()
+
+    if not config.quiet:
+        pt = PrettyTable(["Executed", "Errors", "Sessions", "Elapsed, s", "Max lag, s"])
+        pt.add_row([stats.executed, stats.errors, stats.sessions, round(stats.elapsed, 3), round(stats.max_lag, 3)])
+        print(pt)
+
+
+@main.group(help="Inspect binary statement traces recorded during the run.")
+def trace():
+    pass
+
+
+@trace.command(help="Summarize statement traces per query.")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def summary(files):
+    from .trace import merge_traces, summarize
+
+    stats = summarize(merge_traces(list(files)))
+
+    pt = PrettyTable(["Query", "Count", "Errors", "Rows", "Mean, ms", "p50, ms", "p99, ms", "Max, ms"])
+    for name, s in sorted(stats.items()):
+        pt.add_row([name, s["count"], s["errors"], s["rows"]] + [round(s[k], 3) for k in ("mean_ms", "p50_ms", "p99_ms", "max_ms")])
+    pt.align = "r"
+    pt.align["Query"] = "l"
+    print(pt)
+
+
+@trace.command(help="Merge statement traces into one time-ordered CSV.")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("-o", "--output", help="Path to the resulting CSV file. Prints to stdout by default.", type=click.File("w"), default="-")
+def merge(files, output):
+    import csv
+    from .trace import merge_traces
+
+    writer = csv.writer(output)
+    writer.writerow(["start_ns", "duration_ns", "query", "rows", "error", "worker"])
+    for r in merge_traces(list(files)):
+        writer.writerow([r.start_ns, r.duration_ns, r.query, r.rows, r.error, r.worker])
+
+
+@main.command(help="Compare two JSON run reports and highlight regressions.")
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.option("--alpha", help="Significance level of the statistical tests.", type=float, default=0.01, show_default=True)
+@click.option("--threshold", help="Minimal relative change considered a regression.", type=float, default=0.05, show_default=True)
+def compare(old, new, alpha, threshold):
+    from .report import Comparison, compare_reports, read_report
+    from .exceptions import ReportFormatError
+
+    try:
+        old_report, new_report = read_report(old), read_report(new)
+    except ReportFormatError as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(2)
+
+    if old_report.get("workload_hash") != new_report.get("workload_hash"):
+        click.echo("Warning: reports were produced by different workloads.", err=True)
+
+    comparisons = compare_reports(old_report, new_report, alpha=alpha, threshold=threshold)
+
+    def fmt(old_value, new_value):
+        return f"{old_value:.2f} -> {new_value:.2f} ({Comparison.change(old_value, new_value) * 100:+.1f}%)"
+
+    pt = PrettyTable(["Kind", "Name", "p50, ms", "p99, ms", "Ops/s", "Err %", "p-value", "Regression"])
+    for c in comparisons:
+        pt.add_row(
+            [
+                c.kind,
+                c.name,
+                fmt(c.old_p50_ms, c.new_p50_ms),
+                fmt(c.old_p99_ms, c.new_p99_ms),
+                fmt(c.old_throughput, c.new_throughput),
+                f"{c.old_error_rate * 100:.2f} -> {c.new_error_rate * 100:.2f}",
+                f"{c.latency_p_value:.4f}",
+                click.style(", ".join(c.regression), fg="red") if c.regression else "",
+            ]
+        )
+    pt.align = "r"
+    pt.align["Kind"] = pt.align["Name"] = pt.align["Regression"] = "l"
+    print(pt)
+
+    if any(c.regression for c in comparisons):
+        sys.exit(1)
+
+
 @main.command(help="Test connection to the given database.")
 @decorate_with_common_options
 def test(**kwargs):
@@ -291,8 +655,12 @@ def scenarios(**kwargs):
 
 @main.command(help="Enqueue dramatiq actor for execution.")
 @click.argument("actor_name", metavar="ACTOR")
+@click.option("-n", "--count", help="Number of messages to enqueue. Defaults to the number of rows in the params file or 1.", type=int)
+@click.option("--params-file", help="CSV or Arrow file with positional arguments, one row per message.", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", help="Number of messages published at once.", type=int, default=1000, show_default=True)
+@click.option("--group", help="Publish every batch as a dramatiq group.", is_flag=True)
 @decorate_with_common_options
-def send(actor_name, **kwargs):
+def send(actor_name, count, params_file, batch_size, group, **kwargs):
     update_cli_args(kwargs)
     global cli_args
     config = get_config(cli_args)
@@ -302,24 +670,35 @@ def send(actor_name, **kwargs):
     ctx.infuse()
 
     try:
-        from dramatiq import set_broker, actor as register_actor
-        from dramatiq.brokers.rabbitmq import RabbitmqBroker
+        from dramatiq import set_broker
+        from .broker import get_broker, register_actors, shutdown_broker
+        from .exceptions import ActorOptionError, UnsupportedBrokerError
 
-        broker = RabbitmqBroker(url=config.broker_url)
-        set_broker(broker)
+        try:
+            broker = get_broker(config.broker_url)
+            set_broker(broker)
 
-        # Decorate all queries and scenarios as actors
-        for query_name in ctx.queries:
-            register_actor(ctx.queries[query_name].function)
-        for scenario_name in ctx.scenarios:
-            register_actor(ctx.scenarios[scenario_name].function)
+            # Decorate all queries and scenarios as actors
+            register_actors(broker, ctx)
+        except (UnsupportedBrokerError, ActorOptionError) as e:
+            click.echo(f"{e}", err=True)
+            sys.exit(1)
 
         actors = broker.get_declared_actors()
         if actor_name in actors:
+            from .enqueue import send_many
+            from .feed import open_feed
+
             actor = broker.get_actor(actor_name)
-            actor.send()
+            params = open_feed(params_file) if params_file else None
+            result = send_many(actor, count=count, params=params, batch_size=batch_size, group=group)
             if not config.quiet:
-                click.echo(f"Execution of {actor_name} has been added to the broker queue.")
+                if result.sent == 1:
+                    click.echo(f"Execution of {actor_name} has been added to the broker queue.")
+                else:
+                    click.echo(f"{result.sent} executions of {actor_name} have been added to the broker queue in {result.elapsed:.2f}s ({result.rate:.0f} messages per second).")
+            # Local broker executes the messages in this process
+            shutdown_broker(broker)
         else:
             click.echo(f"Actor {actor_name} is not registered in dramatiq.", err=True)
             sys.exit(1)
@@ -331,7 +710,7 @@ def send(actor_name, **kwargs):
 
 @main.command(help="Launch scheduler (beat) process.")
 @click.argument("actor_name", metavar="ACTOR", type=str, required=False)
-@click.argument("cron", type=str, required=False)
+@click.argument("cron", metavar="CRON|RATE", type=str, required=False)
 @decorate_with_common_options
 def scheduler(actor_name, cron, **kwargs):
     update_cli_args(kwargs)
@@ -343,19 +722,21 @@ def scheduler(actor_name, cron, **kwargs):
     ctx.infuse()
 
     try:
-        from dramatiq import set_broker, actor as register_actor
-        from dramatiq.brokers.rabbitmq import RabbitmqBroker
+        from dramatiq import set_broker
         from apscheduler.schedulers.background import BackgroundScheduler
         from apscheduler.triggers.cron import CronTrigger
+        from .broker import get_broker, register_actors, shutdown_broker
+        from .exceptions import ActorOptionError, UnsupportedBrokerError
 
-        broker = RabbitmqBroker(url=config.broker_url)
-        set_broker(broker)
+        try:
+            broker = get_broker(config.broker_url)
+            set_broker(broker)
 
-        # Decorate all queries and scenarios as actors
-        for query_name in ctx.queries:
-            register_actor(ctx.queries[query_name].function)
-        for scenario_name in ctx.scenarios:
-            register_actor(ctx.scenarios[scenario_name].function)
+            # Decorate all queries and scenarios as actors
+            register_actors(broker, ctx)
+        except (UnsupportedBrokerError, ActorOptionError) as e:
+            click.echo(f"{e}", err=True)
+            sys.exit(1)
 
         # Form a schedule if explicitly requested.
         # Otherwise schedule from config will be used
@@ -369,19 +750,38 @@ def scheduler(actor_name, cron, **kwargs):
             sys.exit(1)
 
         if not isinstance(config.schedule, Mapz):
-            click.echo("Wrong format of schedule configuration. Must be dict with actor_name:cron_schedule items.", err=True)
+            click.echo("Wrong format of schedule configuration. Must be dict with actor_name:cron_schedule or actor_name:rate items.", err=True)
+            sys.exit(1)
+
+        from .rate_scheduler import RateScheduler, broker_publisher, broker_queue_depth, split_schedule
+        from .exceptions import ScheduleRateError
+
+        try:
+            crontabs, rates = split_schedule(config.schedule)
+        except ScheduleRateError as e:
+            click.echo(f"{e}", err=True)
             sys.exit(1)
 
         scheduler = BackgroundScheduler()
-        for name, crontab in config.schedule.items():
+        for name, crontab in crontabs.items():
             actor = broker.get_actor(name)
 
             scheduler.add_job(actor.send, CronTrigger.from_crontab(crontab))
             if not config.quiet:
                 click.echo(f"Actor {name} is scheduled with crontab: '{crontab}'.")
 
+        rate_scheduler = None
+        if rates:
+            for name, rate in rates.items():
+                broker.get_actor(name)
+                if not config.quiet:
+                    click.echo(f"Actor {name} is scheduled at {rate.per_second:g} messages per second ({rate.jitter} jitter)." + (f" Backpressure policy: {rate.policy}." if rate.policy else ""))
+            rate_scheduler = RateScheduler(rates, broker_publisher(broker), depth=broker_queue_depth(broker))
+
         try:
             scheduler.start()
+            if rate_scheduler:
+                rate_scheduler.start()
             if not config.quiet:
                 click.echo("Scheduler has been started.")
 
@@ -390,7 +790,13 @@ def scheduler(actor_name, cron, **kwargs):
                 time.sleep(1)
         except (KeyboardInterrupt, SystemExit):
             scheduler.shutdown()
+            if rate_scheduler:
+                rate_scheduler.stop()
+            broker.close()
             if not config.quiet:
+                if rate_scheduler:
+                    for name, stats in rate_scheduler.stats().items():
+                        click.echo(f"Actor {name}: {stats.sent} messages sent, {stats.skipped} skipped while catching up, {stats.deferred} deferred and {stats.dropped} dropped by backpressure.")
                 click.echo("Scheduler has been shut down.")
 
     except ImportError:
@@ -409,11 +815,14 @@ def scheduler(actor_name, cron, **kwargs):
 @click.option("--use-spawn", help="Start processes by spawning", is_flag=True, default=False)
 @click.option("--fork-function", help="Fork a subprocess to run the given function", multiple=True, default=[])
 @click.option("--worker-shutdown-timeout", help="Timeout for worker shutdown in ms", type=int, default=600000)
+@click.option("--metrics-port", help="Serve OpenMetrics endpoint aggregated over all worker processes on this port.", type=int)
+@click.option("--preload/--no-preload", help="Read the workload and register actors once before forking worker processes.", default=True)
 @decorate_with_common_options
-def worker(**kwargs):
+def worker(preload, **kwargs):
     from argparse import Namespace
     dramatiq_args = Namespace()
-    dramatiq_args.broker = "dbload.resources.scenarios"  # Import any module to satisfy dramatiq main() function
+    # Worker processes get the broker and their actors from the preload hook
+    dramatiq_args.broker = "dbload.preload:preload"
     dramatiq_args.modules = []
     dramatiq_args.processes = kwargs.pop("processes")
     dramatiq_args.threads = kwargs.pop("threads")
@@ -432,35 +841,213 @@ def worker(**kwargs):
     global cli_args
     config = get_config(cli_args)
 
+    if is_local_url(config.broker_url):
+        click.echo("Separate workers need a RabbitMQ or Redis broker. With a local broker, send and scheduler execute the messages themselves.", err=True)
+        sys.exit(1)
+
     try:
         from dramatiq.cli import main as dramatiq_main, CPUS
+        from .exceptions import ActorOptionError, UnsupportedBrokerError
 
         if dramatiq_args.processes is None:
             dramatiq_args.processes = CPUS
 
-        #broker = get_broker()
+        # Worker processes push their metrics to this endpoint through
+        # the middleware installed by the preloaded broker.
+        if config.metrics_port:
+            from .exporter import MetricsExporter
+
+            exporter = MetricsExporter(host=config.metrics_host, port=config.metrics_port)
+            exporter.start()
 
-        # # Read SQL files and infuse context based on them
-        # ctx = get_context()
-        # ctx.infuse()
+        if preload:
+            from .preload import preload as preload_workload
 
-        # # Decorate all queries and scenarios as actors
-        # for query_name in ctx.queries:
-        #     register_actor(ctx.queries[query_name].function)
-        # for scenario_name in ctx.scenarios:
-        #     register_actor(ctx.scenarios[scenario_name].function)
+            try:
+                preload_workload()
+            except (UnsupportedBrokerError, ActorOptionError) as e:
+                click.echo(f"{e}", err=True)
+                sys.exit(1)
 
-        # print(broker.get_declared_actors())
-        # print(broker.get_declared_queues())
+            if not dramatiq_args.use_spawn:
+                import gc
+
+                # Keep the preloaded workload out of garbage collection,
+                # so collections in worker processes do not copy it
+                gc.freeze()
 
-        # import dbload.tests.debug
         dramatiq_main(args=dramatiq_args)
-        # dramatiq_main()
     except ImportError:
         click.echo("Cannot launch worker because dramatiq cannot be imported", err=True)
         sys.exit(1)
 
 
+@main.command(help="Coordinate a run of scenarios on several nodes started with 'dbload node'.")
+@click.argument("scenario_names", metavar="SCENARIOS", nargs=-1)
+@click.option("--nodes", help="Number of nodes to wait for. With a local broker, the nodes are started on this host.", type=int, default=1, show_default=True)
+@click.option("-u", "--users", help="Total number of virtual users, split between nodes.", type=int, default=1)
+@click.option("-t", "--duration", help="Duration of the run in seconds.", type=float)
+@click.option("-n", "--iterations", help="Total number of scenario executions, split between nodes.", type=int)
+@click.option("--think-time", help="Pause of a virtual user after each scenario in seconds.", type=float, default=0.0)
+@click.option("--shape", help="Load shape of the whole run, e.g. 'ramp(10, 500, 10m)'.", type=str)
+@click.option("--seed", help="Seed of random data generators of the nodes.", type=int)
+@click.option("--lead", help="Seconds between the start message and the start of all nodes.", type=float, default=2.0, show_default=True)
+@click.option("--timeout", help="Seconds to wait for nodes to join, get ready and report.", type=float, default=60.0, show_default=True)
+@click.option("--report", help="Write JSON or CSV report of the run to this path.", type=str)
+@click.option("--report-interval", help="Interval of the report time series in seconds.", type=float)
+@decorate_with_common_options
+def coordinate(scenario_names, nodes, users, duration, iterations, think_time, seed, lead, timeout, **kwargs):
+    update_cli_args(kwargs)
+    global cli_args
+    config = get_config(cli_args)
+
+    # Read SQL files and infuse context based on them
+    ctx = get_context()
+    ctx.infuse()
+
+    from .coordinator import BrokerChannel, Coordinator, LocalChannel, RunPlan, start_local_nodes
+    from .dashboard import summary_table
+    from .load_shape import parse_shape
+    from .report import TimeSeries, build_report, summarize_snapshot, workload_hash, write_report
+    from .exceptions import CoordinationError, LoadShapeError, UnsupportedBrokerError
+
+    scenario_names = list(scenario_names) or [s for s in ctx.scenarios if s not in ("setup", "teardown")]
+    missing = [s for s in scenario_names if s not in ctx.scenarios]
+    if not scenario_names or missing:
+        click.echo(f"Scenarios {missing} do not exist." if missing else "There are no scenarios to run.", err=True)
+        sys.exit(1)
+
+    try:
+        if config.shape:
+            parse_shape(config.shape)
+    except LoadShapeError as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(1)
+
+    plan = RunPlan(
+        scenarios=scenario_names,
+        workload=workload_hash(ctx, scenario_names),
+        users=users,
+        duration=duration,
+        iterations=iterations,
+        think_time=think_time,
+        shape=config.shape,
+        seed=seed,
+    )
+
+    local_nodes = []
+    if is_local_url(config.broker_url):
+        # Nodes are forked with the infused context of this process
+        channel = LocalChannel()
+        local_nodes = start_local_nodes(channel, nodes)
+    else:
+        try:
+            from .broker import get_broker
+
+            channel = BrokerChannel(get_broker(config.broker_url))
+        except UnsupportedBrokerError as e:
+            click.echo(f"{e}", err=True)
+            sys.exit(1)
+        except ImportError:
+            click.echo("Cannot coordinate nodes because dramatiq cannot be imported.", err=True)
+            sys.exit(1)
+
+    coordinator = Coordinator(channel, plan, nodes=nodes, lead=lead, timeout=timeout)
+    timeseries = TimeSeries(interval=config.report_interval, snapshot=coordinator.snapshot) if config.report else None
+
+    if not config.quiet:
+        click.echo(f"Waiting for {nodes} nodes to run {scenario_names} on {plan.users} virtual users.")
+    try:
+        try:
+            coordinator.start()
+        except CoordinationError as e:
+            click.echo(f"{e}", err=True)
+            sys.exit(1)
+        if not config.quiet:
+            click.echo(f"Nodes {coordinator.node_ids} start in {lead} seconds.")
+        if timeseries:
+            timeseries.start()
+        coordinator.wait()
+    finally:
+        if timeseries:
+            timeseries.stop()
+        for process in local_nodes:
+            process.join(timeout=5)
+        channel.close()
+
+    snapshot = coordinator.snapshot()
+    if config.report:
+        report = build_report(
+            snapshot,
+            coordinator.elapsed,
+            config=config.to_dict(),
+            workload=plan.workload,
+            timeseries=timeseries,
+            run=plan.to_dict(),
+            nodes={n: summarize_snapshot(s, coordinator.elapsed) for n, s in coordinator.node_snapshots().items()},
+        )
+        for path in write_report(report, config.report):
+            if not config.quiet:
+                click.echo(f"Report written to {path}")
+
+    if not config.quiet:
+        print(summary_table(snapshot, coordinator.elapsed))
+
+
+@main.command(help="Take part in runs coordinated by 'dbload coordinate'.")
+@click.option("--once", help="Exit after the first run.", is_flag=True)
+@click.option("--interval", help="Seconds between snapshots sent to the coordinator.", type=float, default=1.0, show_default=True)
+@decorate_with_common_options
+def node(once, interval, **kwargs):
+    update_cli_args(kwargs)
+    global cli_args
+    config = get_config(cli_args)
+
+    # Read SQL files and infuse context based on them
+    ctx = get_context()
+    ctx.infuse()
+
+    if is_local_url(config.broker_url):
+        click.echo("Nodes need a RabbitMQ or Redis broker. With a local broker, 'dbload coordinate' starts the nodes itself.", err=True)
+        sys.exit(1)
+
+    from .coordinator import BrokerChannel, Node
+    from .dashboard import summary_table
+    from .exceptions import CoordinationError, UnsupportedBrokerError
+
+    try:
+        from .broker import get_broker
+
+        channel = BrokerChannel(get_broker(config.broker_url))
+    except UnsupportedBrokerError as e:
+        click.echo(f"{e}", err=True)
+        sys.exit(1)
+    except ImportError:
+        click.echo("Cannot join coordinated runs because dramatiq cannot be imported.", err=True)
+        sys.exit(1)
+
+    node = Node(channel, interval=interval)
+    if not config.quiet:
+        click.echo(f"Node '{node.node_id}' is waiting for a coordinated run.")
+    try:
+        while True:
+            try:
+                snapshot = node.serve()
+            except CoordinationError as e:
+                click.echo(f"{e}", err=True)
+                if once:
+                    sys.exit(1)
+                continue
+            if snapshot is not None and not config.quiet:
+                print(summary_table(snapshot, node.elapsed))
+            if once:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        channel.close()
+
+
 @main.command(help="Display version of dbload")
 def version():
     click.echo(f"{__version__}")
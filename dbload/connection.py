@@ -12,14 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Optional
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
 import jpype
 from jpype import dbapi2
 from loguru import logger
 
 from .config import Config
 from .config_singleton import get_config
-from .exceptions import DsnNotFoundError
+from .exceptions import DsnNotFoundError, PoolExhaustedError
 
 
 def get_connection(
@@ -48,3 +52,114 @@ def get_connection(
     logger.debug(f"Successfully connected to the database.")
 
     return connection
+
+
+class ConnectionPool:
+    """Fixed size pool of database connections.
+
+    Connections are opened lazily, the first time they are needed, and
+    are reused afterwards. The most recently released connection is
+    handed out first, which keeps the working set of connections small
+    when the load is low.
+
+    Args:
+        size (int): Maximum number of open connections.
+        config (Config): Config used to open connections. Defaults to the
+            global config.
+
+    Examples:
+        Borrow a connection for the duration of a block::
+
+            pool = ConnectionPool(size=4)
+            with pool.connection() as con:
+                with con.cursor() as cur:
+                    cur.execute("SELECT 1 FROM DUMMY")
+    """
+
+    def __init__(self, size: int = 8, config: Optional[Config] = None):
+        self.size = max(size, 1)
+        self._config = config
+        self._idle: "queue.LifoQueue[dbapi2.Connection]" = queue.LifoQueue()
+        self._connections: List[dbapi2.Connection] = []
+        self._lock = threading.Lock()
+        self._in_use = 0
+        # Connections being opened, counted against the size of the pool
+        self._opening = 0
+
+    @property
+    def opened(self) -> int:
+        """Number of connections opened so far."""
+        return len(self._connections)
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently borrowed from the pool."""
+        return self._in_use
+
+    def acquire(self, timeout: Optional[float] = None) -> dbapi2.Connection:
+        """Borrow a connection, opening a new one if the pool is not full.
+
+        Raises:
+            PoolExhaustedError: when no connection became available
+                within ``timeout`` seconds.
+        """
+
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self._lock:
+                open_new = len(self._connections) + self._opening < self.size
+                if open_new:
+                    self._opening += 1
+            # Connecting takes a round trip, other threads must not wait
+            if open_new:
+                try:
+                    connection = get_connection(self._config)
+                except BaseException:
+                    with self._lock:
+                        self._opening -= 1
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._connections.append(connection)
+            if connection is None:
+                try:
+                    connection = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise PoolExhaustedError(self.size, timeout) from None
+
+        with self._lock:
+            self._in_use += 1
+        return connection
+
+    def release(self, connection: dbapi2.Connection) -> None:
+        """Return borrowed connection back to the pool."""
+
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(
+        self, timeout: Optional[float] = None
+    ) -> Iterator[dbapi2.Connection]:
+        """Borrow a connection for the duration of the ``with`` block."""
+
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        """Close all connections opened by the pool."""
+
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception as e:
+                logger.warning(f"Error while closing pooled connection: {e}")
+        self._idle = queue.LifoQueue()
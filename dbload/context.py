@@ -17,13 +17,15 @@ from pathlib import Path
 import sys
 import importlib
 from types import FunctionType
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from loguru import logger
 from mapz import Mapz
 
 from .config_singleton import get_config
 from .query_parser import QueryParser
+from .param_generators import compile_generators
+from .feed import Feed, open_feed
 from .exceptions import (
     EmptyPathToModuleError,
     ImportlibResourcesNotFoundError,
@@ -31,6 +33,8 @@ from .exceptions import (
     QueryAlreadyExistsError,
     ScenarioAlreadyExistsError,
     MatchingSqlQueryNotFoundError,
+    QueryNotFoundError,
+    UnsupportedFeedError,
     UnsupportedPredefinedSimulationError,
 )
 
@@ -87,6 +91,7 @@ class Context:
         infuse: bool = False,
         auto: bool = False,
         auto_run_queries: List[str] = [],
+        params: Optional[Callable[[], Dict[str, Any]]] = None,
     ) -> None:
         """Register a scneario in the context."""
 
@@ -103,6 +108,11 @@ class Context:
             name=name,
             infuse=infuse,
             auto_run_queries=auto_run_queries,
+            auto_run_stages=[
+                Mapz(order=0, staged=False, queries=[q])
+                for q in auto_run_queries
+            ],
+            params=params,
         )
 
     def infuse(self) -> None:
@@ -139,6 +149,9 @@ class Context:
         for s in self.scenarios:
             self._infuse_scenario_with_queries(s)
 
+        for q, feed_cfg in cfg.feeds.items():
+            self._attach_feed(q, feed_cfg)
+
         self._is_infused = True
 
     def _load_predefined_simulation(self):
@@ -242,8 +255,9 @@ class Context:
         for query_name, params in parsed.items():
             # Might have several scenarios assigned
             for name, order in params.scenarios:
+                staged = name in params.get("staged", ())
                 auto_run_queries_per_scenario[name].append(
-                    (query_name, order)
+                    (query_name, order, staged)
                 )
 
         for name in auto_run_queries_per_scenario:
@@ -251,6 +265,7 @@ class Context:
                 auto_run_queries_per_scenario[name], key=lambda i: i[1]
             )
             ordered_query_names = [t[0] for t in ordered_tuples]
+            ordered_stages = self._group_stages(ordered_tuples)
 
             # Annotated queries can create implicit scenarios that were not
             # declared explicitly in an accompanying python module.
@@ -269,6 +284,28 @@ class Context:
             else:
                 self.scenarios[name].auto_run_queries = ordered_query_names
 
+            self.scenarios[name].auto_run_stages = ordered_stages
+
+    @staticmethod
+    def _group_stages(ordered_tuples: List[tuple]) -> List[Mapz]:
+        """Group ordered auto-run queries into stages.
+
+        Queries with the same explicit order form one stage and are run
+        concurrently. Queries without an explicit order keep running one
+        after another, in the order they appear in the SQL file.
+        """
+
+        stages: List[Mapz] = []
+        for query_name, order, staged in ordered_tuples:
+            last = stages[-1] if stages else None
+            if staged and last and last.staged and last.order == order:
+                last.queries.append(query_name)
+            else:
+                stages.append(
+                    Mapz(order=order, staged=staged, queries=[query_name])
+                )
+        return stages
+
     def _infuse_query_with_matching_sql(self, parsed: Mapz, query_name: str):
         """Infuse query object with SQL text attribute.
 
@@ -291,6 +328,54 @@ class Context:
         self.queries[query_name].sql = query_text or None
         setattr(self.queries[query_name].function, "sql", query_text or None)
 
+        # Compile parameter generators declared with the "param:" tag, so
+        # that auto queries can be invoked without explicit parameters.
+        params = parsed[match].get("params", None) if query_text else None
+        self.queries[query_name].generate = compile_generators(params)
+
+        # Actor options declared like "option: queue=analytics"
+        self.queries[query_name].actor_options = dict(
+            parsed[match].get("actor_options", None) or {}
+        )
+
+    def actor_options(self, name: str) -> dict:
+        """Options of the dramatiq actor of a query or scenario.
+
+        Options from the ``actors`` config section take precedence over
+        ``option: key=value`` annotations of the query.
+        """
+
+        item = self.queries.get(name, None) or self.scenarios.get(name, None)
+        options = dict(item.get("actor_options", None) or {}) if item else {}
+        options.update(get_config().actors.get(name, None) or {})
+        return options
+
+    def register_feed(self, query_name: str, feed: Feed) -> None:
+        """Use ``feed`` as the parameter source of a query.
+
+        Feed is used by auto queries that are invoked without explicit
+        parameters and takes precedence over ``param:`` generators.
+        """
+
+        if query_name not in self.queries:
+            raise QueryNotFoundError(query_name)
+
+        logger.debug(f"Registering feed for '{query_name}' query.")
+        self.queries[query_name].feed = feed
+
+    def _attach_feed(self, query_name: str, feed_cfg: Mapz) -> None:
+        """Open a feed declared in the ``feeds`` config section."""
+
+        kwargs = dict(feed_cfg)
+        path = kwargs.pop("path")
+        # Threads and processes of a run share the feed of the query, so
+        # none of them knows its own worker index
+        if kwargs.get("mode") == "partitioned":
+            raise UnsupportedFeedError(
+                f"mode 'partitioned' in config of '{query_name}', use Feed.partition() in code"
+            )
+        self.register_feed(query_name, open_feed(path, **kwargs))
+
     def _infuse_scenario_with_queries(self, scenario_name: str):
         if self.scenarios[scenario_name].infuse:
             logger.info(f"Infusing {scenario_name} with queries")
@@ -0,0 +1,538 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Drive one run from several load generating hosts.
+
+Every host runs ``dbload node``, one host runs ``dbload coordinate``.
+The run goes through these steps:
+
+1. nodes announce themselves to the coordinator;
+2. the coordinator sends every node the :class:`RunPlan` with its share
+   of the load;
+3. every node prepares its runner and reports ready, or reports why it
+   cannot take part, e.g. because it has a different workload;
+4. when all nodes are ready, the coordinator sends them a common start
+   time a moment in the future, clocks of the hosts must be in sync;
+5. nodes send metrics snapshots every ``interval`` seconds and a last
+   one when they are done. The coordinator merges the latest snapshot of
+   every node, like :class:`~dbload.multiprocess.ProcessRunner` does for
+   processes of one host.
+
+Messages travel over a channel: :class:`BrokerChannel` uses dedicated
+queues of the dramatiq broker, :class:`LocalChannel` connects processes
+of one host and stands in for the broker in tests and local runs.
+"""
+
+import multiprocessing
+import os
+import random
+import socket
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from .load_shape import Scaled, parse_shape
+from .metrics import Snapshot
+from .metrics_singleton import get_metrics
+from .multiprocess import _share
+from .exceptions import CoordinationError
+
+
+# Name of the actor in coordination messages, no worker executes them
+COORDINATION_ACTOR = "dbload_coordination"
+
+
+@dataclass
+class RunPlan:
+    """Parameters of a coordinated run, the same for all nodes.
+
+    Attributes:
+        scenarios (List[str]): Names of scenarios to run.
+        workload (str): Hash of the workload, see
+            :func:`~dbload.report.workload_hash`. Nodes with a different
+            workload refuse to take part.
+        users (int): Total number of virtual users, split between nodes.
+        duration (float): Duration of the run in seconds.
+        iterations (int): Total number of scenario executions, split
+            between nodes.
+        think_time (float): Pause of a virtual user after each scenario.
+        shape (str): Load shape of the whole run, see
+            :func:`~dbload.load_shape.parse_shape`. Every node runs its
+            share of it.
+        seed (int): Seed of random generators. Every node adds its index,
+            so nodes generate different but reproducible data.
+    """
+
+    scenarios: List[str] = field(default_factory=list)
+    workload: Optional[str] = None
+    users: int = 1
+    duration: Optional[float] = None
+    iterations: Optional[int] = None
+    think_time: float = 0.0
+    shape: Optional[str] = None
+    seed: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "RunPlan":
+        return RunPlan(**data)
+
+    def runner_options(self, index: int, nodes: int) -> Dict[str, Any]:
+        """Options of the runner of node ``index`` out of ``nodes``."""
+
+        shape = parse_shape(self.shape) if self.shape else None
+        return dict(
+            scenarios=list(self.scenarios),
+            users=max(1, _share(self.users, index, nodes)),
+            duration=self.duration,
+            iterations=_share(self.iterations, index, nodes),
+            think_time=self.think_time,
+            shape=Scaled(shape, 1 / nodes) if shape is not None else None,
+        )
+
+
+class LocalChannel:
+    """Channel between processes of one host.
+
+    Queues live in a manager process, so the channel must be created
+    before forking the processes using it.
+    """
+
+    def __init__(self) -> None:
+        self._manager = multiprocessing.get_context("fork").Manager()
+        self._queues = self._manager.dict()
+        self._lock = self._manager.Lock()
+
+    def _queue(self, address: str):
+        with self._lock:
+            if address not in self._queues:
+                self._queues[address] = self._manager.Queue()
+            return self._queues[address]
+
+    def send(self, address: str, message: Dict[str, Any]) -> None:
+        self._queue(address).put(message)
+
+    def receive(self, address: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Take the next message for ``address``, None after ``timeout``."""
+
+        import queue
+
+        try:
+            return self._queue(address).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._manager.shutdown()
+
+
+class BrokerChannel:
+    """Channel over dedicated queues of a dramatiq broker.
+
+    Every address is a queue. Messages in them are not meant for any
+    actor and are consumed by :meth:`receive` only.
+    """
+
+    def __init__(self, broker) -> None:
+        self.broker = broker
+        self._consumers: Dict[str, Any] = {}
+
+    def send(self, address: str, message: Dict[str, Any]) -> None:
+        from dramatiq import Message
+
+        self.broker.declare_queue(address)
+        self.broker.enqueue(
+            Message(
+                queue_name=address,
+                actor_name=COORDINATION_ACTOR,
+                args=(message,),
+                kwargs={},
+                options={},
+            )
+        )
+
+    def receive(self, address: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Take the next message for ``address``, None after ``timeout``."""
+
+        consumer = self._consumers.get(address)
+        if consumer is None:
+            self.broker.declare_queue(address)
+            consumer = self._consumers[address] = self.broker.consume(
+                address, prefetch=1, timeout=100
+            )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            proxy = next(consumer)
+            if proxy is not None:
+                consumer.ack(proxy)
+                return proxy.args[0]
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self) -> None:
+        for consumer in self._consumers.values():
+            consumer.close()
+        self._consumers = {}
+        self.broker.close()
+
+
+def _seed(seed: int) -> None:
+    random.seed(seed)
+    try:
+        from faker.generator import random as faker_random
+
+        faker_random.seed(seed)
+    except ImportError:
+        pass
+
+
+def create_runner(options: Dict[str, Any]):
+    """Create runner of a node, with processes and engine of its config."""
+
+    import inspect
+
+    from .config_singleton import get_config
+    from .context_singleton import get_context
+    from .runner import Runner
+
+    config = get_config()
+    ctx = get_context()
+    runner_class = Runner
+    if any(
+        inspect.iscoroutinefunction(ctx.scenarios[s].function)
+        for s in options["scenarios"]
+        if s in ctx.scenarios
+    ):
+        from .aio import AsyncRunner
+
+        runner_class = AsyncRunner
+        options["pool_size"] = config.pool_size
+    options["ignore"] = config.ignore
+    if config.processes > 1:
+        from .multiprocess import ProcessRunner
+
+        return ProcessRunner(
+            processes=config.processes, runner_class=runner_class, **options
+        )
+    return runner_class(**options)
+
+
+class Node:
+    """Load generator taking part in coordinated runs.
+
+    Args:
+        channel: :class:`BrokerChannel` or :class:`LocalChannel`.
+        node_id (str): Unique name of the node, host name and process id
+            by default.
+        name (str): Name of the coordinated run, the same as the one of
+            the :class:`Coordinator`.
+        runner_factory (Callable): Creates the runner from the options of
+            :meth:`RunPlan.runner_options`, :func:`create_runner` by
+            default.
+        interval (float): Seconds between snapshots sent to the
+            coordinator.
+        timeout (float): Seconds to wait for the coordinator, forever by
+            default.
+    """
+
+    def __init__(
+        self,
+        channel,
+        node_id: Optional[str] = None,
+        name: str = "dbload",
+        runner_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        interval: float = 1.0,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.channel = channel
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.name = name
+        self.runner_factory = runner_factory or create_runner
+        self.interval = interval
+        self.timeout = timeout
+        self.address = f"{name}.node.{self.node_id}"
+        self.coordinator = f"{name}.coordinator"
+        # Duration of the last run in seconds
+        self.elapsed = 0.0
+
+    def _send(self, kind: str, **message: Any) -> None:
+        self.channel.send(self.coordinator, dict(kind=kind, node=self.node_id, **message))
+
+    def _wait(self, *kinds: str) -> Dict[str, Any]:
+        message = self.channel.receive(self.address, self.timeout)
+        if message is None:
+            raise CoordinationError(f"node '{self.node_id}' got no message from the coordinator")
+        if message["kind"] not in kinds:
+            raise CoordinationError(f"node '{self.node_id}' expected {kinds}, got '{message['kind']}'")
+        return message
+
+    def _prepare(self, plan: RunPlan, index: int, nodes: int):
+        from .context_singleton import get_context
+        from .report import workload_hash
+
+        if plan.workload is not None:
+            workload = workload_hash(get_context(), plan.scenarios)
+            if workload != plan.workload:
+                raise CoordinationError(
+                    f"node '{self.node_id}' has a different workload {workload[:12]}"
+                )
+        if plan.seed is not None:
+            _seed(plan.seed + index)
+        # Whatever was recorded before the run is not part of it
+        get_metrics().reset()
+        return self.runner_factory(plan.runner_options(index, nodes))
+
+    def serve(self) -> Optional[Snapshot]:
+        """Take part in one coordinated run.
+
+        Returns:
+            Final snapshot of the node, None when the run was aborted.
+
+        Raises:
+            CoordinationError: when the coordinator does not respond or
+                the node cannot take part in the run.
+        """
+
+        self._send("join")
+        message = self._wait("plan", "abort")
+        if message["kind"] == "abort":
+            return None
+        plan = RunPlan.from_dict(message["plan"])
+        try:
+            runner = self._prepare(plan, message["index"], message["nodes"])
+        except Exception as e:
+            self._send("failed", error=getattr(e, "reason", f"{e}"))
+            raise
+        self._send("ready")
+        logger.info(f"Node '{self.node_id}' is ready for the run.")
+
+        message = self._wait("start", "abort")
+        if message["kind"] == "abort":
+            runner.close()
+            return None
+        time.sleep(max(0.0, message["at"] - time.time()))
+
+        runner.start()
+        try:
+            while runner.is_running():
+                message = self.channel.receive(self.address, self.interval)
+                if message is not None and message["kind"] == "stop":
+                    runner.stop()
+                self._send("snapshot", snapshot=runner.snapshot().to_dict())
+            runner.wait()
+        finally:
+            snapshot = runner.snapshot()
+            self.elapsed = runner.elapsed
+            self._send("done", snapshot=snapshot.to_dict(), elapsed=self.elapsed)
+            runner.close()
+        logger.info(f"Node '{self.node_id}' finished the run.")
+        return snapshot
+
+
+class Coordinator:
+    """Start nodes at once and merge their metrics.
+
+    Has the interface of :class:`~dbload.runner.Runner` needed to drive
+    dashboards, time series and reports.
+
+    Args:
+        channel: :class:`BrokerChannel` or :class:`LocalChannel`.
+        plan (RunPlan): Plan sent to all nodes.
+        nodes (int): Number of nodes to wait for.
+        name (str): Name of the coordinated run.
+        lead (float): Seconds between the start message and the start,
+            so all nodes receive it in time.
+        timeout (float): Seconds to wait for nodes to join and get
+            ready, and for a message of running nodes.
+    """
+
+    def __init__(
+        self,
+        channel,
+        plan: RunPlan,
+        nodes: int = 1,
+        name: str = "dbload",
+        lead: float = 2.0,
+        timeout: float = 60.0,
+    ) -> None:
+        self.channel = channel
+        self.plan = plan
+        self.nodes = max(1, nodes)
+        self.name = name
+        self.lead = lead
+        self.timeout = timeout
+        self.address = f"{name}.coordinator"
+        shape = parse_shape(plan.shape) if plan.shape else None
+        self.users = max(plan.users, 1) if shape is None else int(shape.max_users)
+
+        self.node_ids: List[str] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._latest: Dict[str, Snapshot] = {}
+        self._elapsed: Dict[str, float] = {}
+        self._running = False
+        self._on_snapshot: List[Callable[[str, Snapshot], None]] = []
+
+    @property
+    def measured_from(self) -> Optional[float]:
+        return self.started_at
+
+    @property
+    def elapsed(self) -> float:
+        """Duration of the run in seconds, the longest of all nodes."""
+
+        if self._elapsed and len(self._elapsed) == len(self.node_ids):
+            return max(self._elapsed.values())
+        if self.started_at is None:
+            return 0.0
+        return max(0.0, (self.finished_at or time.time()) - self.started_at)
+
+    def on_snapshot(self, callback: Callable[[str, Snapshot], None]) -> None:
+        """Register callback invoked with every snapshot of a node."""
+        self._on_snapshot.append(callback)
+
+    def snapshot(self) -> Snapshot:
+        """Merge the latest snapshots of all nodes."""
+
+        merged = Snapshot()
+        for snapshot in list(self._latest.values()):
+            merged.merge(snapshot)
+        merged.gauges["nodes"] = len(self.node_ids) - len(self._elapsed)
+        return merged
+
+    def node_snapshots(self) -> Dict[str, Snapshot]:
+        """Latest snapshot of every node."""
+        return dict(self._latest)
+
+    def _receive(self, kinds, what: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            message = self.channel.receive(
+                self.address, max(0.0, deadline - time.monotonic())
+            )
+            if message is None:
+                self._broadcast("abort")
+                raise CoordinationError(f"timed out waiting for {what}")
+            if message["kind"] == "failed":
+                self._broadcast("abort")
+                raise CoordinationError(message["error"])
+            if message["kind"] in kinds:
+                return message
+            logger.warning(f"Ignoring '{message['kind']}' message of node '{message['node']}'.")
+
+    def _broadcast(self, kind: str, **message: Any) -> None:
+        for node_id in self.node_ids:
+            self.channel.send(f"{self.name}.node.{node_id}", dict(kind=kind, **message))
+
+    def start(self) -> None:
+        """Wait for nodes, send them the plan and start them at once.
+
+        Raises:
+            CoordinationError: when nodes do not join or get ready in
+                time, or a node cannot take part in the run.
+        """
+
+        while len(self.node_ids) < self.nodes:
+            message = self._receive(("join",), f"{self.nodes} nodes to join")
+            if message["node"] not in self.node_ids:
+                self.node_ids.append(message["node"])
+                logger.debug(f"Node '{message['node']}' joined.")
+
+        for index, node_id in enumerate(self.node_ids):
+            self.channel.send(
+                f"{self.name}.node.{node_id}",
+                dict(kind="plan", plan=self.plan.to_dict(), index=index, nodes=self.nodes),
+            )
+
+        ready = set()
+        while len(ready) < self.nodes:
+            message = self._receive(("ready",), "nodes to get ready")
+            ready.add(message["node"])
+
+        self.started_at = time.time() + self.lead
+        self._broadcast("start", at=self.started_at)
+        self._running = True
+        logger.debug(f"Started {self.nodes} nodes.")
+
+    def stop(self) -> None:
+        """Ask all nodes to finish after their current scenarios."""
+        self._broadcast("stop")
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def wait(self) -> None:
+        """Collect snapshots until all nodes are done."""
+
+        try:
+            while len(self._elapsed) < len(self.node_ids):
+                try:
+                    message = self.channel.receive(self.address, self.timeout)
+                except KeyboardInterrupt:
+                    self.stop()
+                    continue
+                if message is None:
+                    logger.warning("Nodes stopped reporting before the end of the run.")
+                    break
+                if message["kind"] not in ("snapshot", "done"):
+                    continue
+                node_id = message["node"]
+                snapshot = Snapshot.from_dict(message["snapshot"])
+                self._latest[node_id] = snapshot
+                if message["kind"] == "done":
+                    self._elapsed[node_id] = message["elapsed"]
+                for callback in self._on_snapshot:
+                    callback(node_id, snapshot)
+        finally:
+            self._running = False
+            self.finished_at = time.time()
+
+    def close(self) -> None:
+        """Connections are closed by the nodes themselves."""
+        pass
+
+    def run(self) -> None:
+        self.start()
+        self.wait()
+
+
+def _local_node(channel, name: str, index: int, interval: float) -> None:
+    try:
+        Node(channel, f"local-{index}", name, interval=interval, timeout=60.0).serve()
+    except CoordinationError as e:
+        logger.error(f"{e}")
+
+
+def start_local_nodes(
+    channel: LocalChannel, count: int, name: str = "dbload", interval: float = 1.0
+) -> List[multiprocessing.Process]:
+    """Fork ``count`` nodes on this host, e.g. to try a coordinated run."""
+
+    mp = multiprocessing.get_context("fork")
+    processes = [
+        mp.Process(
+            target=_local_node,
+            args=(channel, name, index, interval),
+            name=f"dbload-node-{index}",
+            daemon=True,
+        )
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
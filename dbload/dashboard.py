@@ -0,0 +1,221 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, TextIO, Tuple
+
+from prettytable import PrettyTable
+
+from .metrics import PHASES, Metrics, Snapshot, Stats
+
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# Move cursor to the top left corner and clear the screen below it
+CLEAR_SCREEN = "\x1b[H\x1b[J"
+
+
+def sparkline(values: Iterable[float]) -> str:
+    """Render values as a line of unicode block characters."""
+
+    values = list(values)
+    if not values:
+        return ""
+    top = max(values)
+    if top <= 0:
+        return SPARK_CHARS[0] * len(values)
+    last = len(SPARK_CHARS) - 1
+    return "".join(SPARK_CHARS[int(v / top * last)] for v in values)
+
+
+def _rows(snapshot: Snapshot) -> Iterable[Tuple[str, str, Stats]]:
+    for name, stats in sorted(snapshot.scenarios.items()):
+        yield "scenario", name, stats
+    for name, stats in sorted(snapshot.queries.items()):
+        yield "query", name, stats
+
+
+def summary_table(snapshot: Snapshot, elapsed: float) -> PrettyTable:
+    """Build table with cumulative metrics of the whole run."""
+
+    pt = PrettyTable(
+        ["Kind", "Name", "Count", "Ops/s", "Errors", "Mean, ms", "p50, ms", "p99, ms", "Max, ms"]
+    )
+    for kind, name, s in _rows(snapshot):
+        h = s.latency
+        pt.add_row(
+            [
+                kind,
+                name,
+                s.executions,
+                round(s.executions / elapsed, 1) if elapsed else 0,
+                s.error_count,
+                round(h.mean / 1000, 2),
+                round(h.percentile(50) / 1000, 2),
+                round(h.percentile(99) / 1000, 2),
+                round(h.max / 1000, 2),
+            ]
+        )
+    pt.align = "r"
+    pt.align["Kind"] = pt.align["Name"] = "l"
+    return pt
+
+
+def phase_table(snapshot: Snapshot) -> PrettyTable:
+    """Build table with mean and p99 time of every query phase."""
+
+    pt = PrettyTable(["Query", "Phase", "Count", "Mean, ms", "p99, ms", "Share"])
+    for name, s in sorted(snapshot.queries.items()):
+        total = sum(h.total for h in s.phases.values())
+        for phase in PHASES:
+            h = s.phases.get(phase)
+            if h is None or not h.count:
+                continue
+            pt.add_row(
+                [
+                    name,
+                    phase,
+                    h.count,
+                    round(h.mean / 1000, 3),
+                    round(h.percentile(99) / 1000, 3),
+                    f"{h.total / total * 100:.1f}%" if total else "-",
+                ]
+            )
+    pt.align = "r"
+    pt.align["Query"] = pt.align["Phase"] = "l"
+    return pt
+
+
+class Dashboard:
+    """Live console view of a running load.
+
+    A background thread takes a metrics snapshot a few times per second
+    and redraws a table with per-scenario and per-query throughput,
+    error rate, latency percentiles and their recent history, and the
+    connection pool occupancy.
+
+    Snapshots are taken with :meth:`~dbload.metrics.Metrics.snapshot`,
+    which only copies per-thread recorders, so the dashboard adds no
+    locking to the query execution path.
+
+    Args:
+        metrics (Metrics): Metrics to display.
+        interval (float): Seconds between redraws.
+        window (float): Length in seconds of the sliding window used for
+            throughput and percentiles.
+        history (int): Number of windows shown in sparklines.
+        stream (TextIO): Where to draw. Defaults to stdout.
+        snapshot (Callable): Alternative source of snapshots, e.g. one
+            that merges metrics of several processes.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = 0.25,
+        window: float = 1.0,
+        history: int = 30,
+        stream: Optional[TextIO] = None,
+        snapshot: Optional[Callable[[], Snapshot]] = None,
+    ) -> None:
+        self.metrics = metrics
+        self.interval = interval
+        self.window = window
+        self.history = history
+        self.stream = stream or sys.stdout
+        self._take_snapshot = snapshot or metrics.snapshot
+
+        self._snapshots: Deque[Snapshot] = deque()
+        self._p50: Dict[Tuple[str, str], Deque[float]] = {}
+        self._p99: Dict[Tuple[str, str], Deque[float]] = {}
+        self._started = time.time()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _trend(self, store: Dict, key: Tuple[str, str], value: float) -> str:
+        values = store.get(key)
+        if values is None:
+            values = store[key] = deque(maxlen=self.history)
+        values.append(value)
+        return sparkline(values)
+
+    def render(self, snapshot: Snapshot) -> str:
+        """Render the dashboard for a fresh snapshot."""
+
+        self._snapshots.append(snapshot)
+        # Keep the oldest snapshot that is still within the window
+        while (
+            len(self._snapshots) > 2
+            and snapshot.taken_at - self._snapshots[1].taken_at >= self.window
+        ):
+            self._snapshots.popleft()
+        previous = self._snapshots[0]
+        span = snapshot.taken_at - previous.taken_at
+        delta = snapshot.subtract(previous) if span > 0 else snapshot
+
+        pt = PrettyTable(
+            ["Kind", "Name", "Ops/s", "Err %", "p50, ms", "p99, ms", "p50 trend", "p99 trend"]
+        )
+        for kind, name, s in _rows(delta):
+            p50 = s.latency.percentile(50) / 1000
+            p99 = s.latency.percentile(99) / 1000
+            pt.add_row(
+                [
+                    kind,
+                    name,
+                    round(s.executions / span, 1) if span > 0 else 0,
+                    round(s.error_rate * 100, 2),
+                    round(p50, 2),
+                    round(p99, 2),
+                    self._trend(self._p50, (kind, name), p50),
+                    self._trend(self._p99, (kind, name), p99),
+                ]
+            )
+        pt.align = "r"
+        pt.align["Kind"] = pt.align["Name"] = "l"
+        pt.align["p50 trend"] = pt.align["p99 trend"] = "l"
+
+        gauges = snapshot.gauges
+        footer = (
+            f"elapsed {time.time() - self._started:.0f}s"
+            f" | users {gauges.get('users.active', 0):.0f}"
+            f"/{gauges.get('users.target', 0):.0f}"
+            f" | pool {gauges.get('pool.in_use', 0):.0f}"
+            f"/{gauges.get('pool.size', 0):.0f}"
+        )
+        return f"{pt}\n{footer}\n"
+
+    def draw(self) -> None:
+        text = self.render(self._take_snapshot())
+        self.stream.write(CLEAR_SCREEN + text)
+        self.stream.flush()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.draw()
+
+    def start(self) -> None:
+        self._started = time.time()
+        self._thread = threading.Thread(
+            target=self._loop, name="dbload-dashboard", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
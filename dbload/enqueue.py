@@ -0,0 +1,119 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Enqueue many executions of a dramatiq actor at once.
+
+:func:`send_many` is what ``dbload send ACTOR --count N`` runs::
+
+    result = send_many(broker.get_actor("create_sale"), count=100_000)
+    print(f"{result.rate:.0f} messages per second")
+
+Messages are built and published in batches over the connection the
+broker keeps for the calling thread. Arguments of the messages can come
+from a parameter feed, one row per message, see :mod:`~dbload.feed`.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+from .feed import Feed
+
+
+@dataclass
+class SendResult:
+    """Outcome of :func:`send_many`.
+
+    Attributes:
+        sent (int): Number of published messages.
+        batches (int): Number of published batches.
+        elapsed (float): Seconds spent building and publishing.
+    """
+
+    sent: int
+    batches: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """Published messages per second."""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def enqueue_messages(broker, messages: List[Any], group: bool = False) -> None:
+    """Publish prepared messages back to back.
+
+    With ``group`` the messages are published as a dramatiq group, so
+    completion of the whole batch can be awaited by a results backend.
+    """
+
+    if group:
+        from dramatiq import group as dramatiq_group
+
+        dramatiq_group(messages, broker=broker).run()
+        return
+    for message in messages:
+        broker.enqueue(message)
+
+
+def send_many(
+    actor,
+    count: Optional[int] = None,
+    params: Optional[Feed] = None,
+    batch_size: int = 1000,
+    group: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> SendResult:
+    """Publish ``count`` messages of ``actor``.
+
+    Args:
+        actor: dramatiq actor to enqueue.
+        count (int): Number of messages. Defaults to the number of rows
+            of ``params``, or a single message without it.
+        params (Feed): Feed with positional arguments of the messages.
+            Rows are taken in the feed's order and mode, so a feed in
+            ``sequential`` mode starts over when ``count`` exceeds it.
+        batch_size (int): Number of messages published at once.
+        group (bool): Publish every batch as a dramatiq group.
+        progress (Callable): Called with the number of messages sent so
+            far after every batch.
+    """
+
+    if count is None:
+        count = len(params) if params is not None else 1
+    batch_size = max(1, batch_size)
+
+    broker = actor.broker
+    sent = batches = 0
+    started = time.perf_counter()
+    while sent < count:
+        size = min(batch_size, count - sent)
+        if params is not None:
+            messages = [actor.message(*params.next()) for _ in range(size)]
+        else:
+            messages = [actor.message() for _ in range(size)]
+        enqueue_messages(broker, messages, group)
+        sent += size
+        batches += 1
+        if progress is not None:
+            progress(sent)
+
+    result = SendResult(sent, batches, time.perf_counter() - started)
+    logger.debug(
+        f"Sent {result.sent} '{actor.actor_name}' messages in "
+        f"{result.batches} batches, {result.rate:.0f} per second."
+    )
+    return result
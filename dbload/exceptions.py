@@ -14,7 +14,7 @@
 
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, Tuple
 
 
 class SqlFileEmptyError(RuntimeError):
@@ -192,3 +192,138 @@ class EmptyPathToModuleError(RuntimeError):
 
     def __init__(self, path: Path) -> None:
         super().__init__(f"Empty path to module is provided: {path}.")
+
+
+class ParameterGeneratorError(RuntimeError):
+    """Parameter generator spec from SQL annotation cannot be compiled."""
+
+    def __init__(self, spec: str, reason: str) -> None:
+        super().__init__(f"Cannot compile parameter generator '{spec}': {reason}.")
+
+
+class UnsupportedFeedError(RuntimeError):
+    """Parameter feed cannot be created with the given settings."""
+
+    def __init__(self, what: str) -> None:
+        super().__init__(f"Unsupported parameter feed: {what}.")
+
+
+class FeedExhaustedError(RuntimeError):
+    """Parameter feed has no more rows to hand out."""
+
+    def __init__(self, feed: Any) -> None:
+        super().__init__(f"Parameter feed is exhausted: {getattr(feed, 'path', feed)}.")
+
+
+class ArrowNotFoundError(RuntimeError):
+    """Required module pyarrow not found."""
+
+    def __init__(self) -> None:
+        super().__init__("Module pyarrow is required for Parquet and Arrow feeds.")
+
+
+class QueryNotFoundError(RuntimeError):
+    """Query with the given name is not registered in the context."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"Query '{name}' is not registered in the context.")
+
+
+class PoolExhaustedError(RuntimeError):
+    """No pooled connection became available in time."""
+
+    def __init__(self, size: int, timeout: Optional[float]) -> None:
+        super().__init__(
+            f"All {size} pooled connections are in use (waited {timeout} seconds)."
+        )
+
+
+class ReplayLogFormatError(ValueError):
+    """Record of the captured statement log cannot be parsed."""
+
+    def __init__(self, line_number: int, reason: str) -> None:
+        super().__init__(f"Malformed replay log record on line {line_number}: {reason}.")
+
+
+class TraceFileFormatError(RuntimeError):
+    """File is not a statement trace written by dbload."""
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(f"Not a dbload statement trace file: {path}.")
+
+
+class ScenarioNotFoundError(RuntimeError):
+    """Scenario with the given name is not registered in the context."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"Scenario '{name}' is not registered in the context.")
+
+
+class ReportFormatError(RuntimeError):
+    """File is not a JSON run report written by dbload."""
+
+    def __init__(self, path: Path, reason: str) -> None:
+        super().__init__(f"Cannot read run report {path}: {reason}.")
+
+
+class ThresholdSyntaxError(ValueError):
+    """Threshold declaration cannot be parsed."""
+
+    def __init__(self, text: str, reason: str) -> None:
+        super().__init__(f"Invalid threshold '{text}': {reason}.")
+
+
+class LoadShapeError(ValueError):
+    """Load shape specification cannot be parsed."""
+
+    def __init__(self, spec: str, reason: str) -> None:
+        super().__init__(f"Invalid load shape '{spec}': {reason}.")
+
+
+class ScenarioStepTypeError(TypeError):
+    """Generator scenario yielded something other than deferred queries."""
+
+    def __init__(self, step: Any) -> None:
+        super().__init__(
+            f"Scenario must yield 'query.defer(...)' calls or lists of them, instead got: {type(step)}."
+        )
+
+
+class PipelineProducerError(RuntimeError):
+    """Producer of a parameter pipeline failed."""
+
+    def __init__(self, name: str, message: str) -> None:
+        super().__init__(
+            f"Producer of '{name}' parameters failed: {message}"
+        )
+
+
+class ScheduleRateError(ValueError):
+    """Rate entry of the schedule cannot be parsed."""
+
+    def __init__(self, spec: str, reason: str) -> None:
+        super().__init__(f"Invalid rate '{spec}': {reason}.")
+
+
+class UnsupportedBrokerError(ValueError):
+    """Broker URL has unsupported scheme."""
+
+    def __init__(self, url: str, schemes: Tuple[str, ...]) -> None:
+        super().__init__(
+            f"Unsupported broker URL '{url}'. Supported schemes: {', '.join(schemes)}."
+        )
+
+
+class ActorOptionError(ValueError):
+    """Option of a dramatiq actor is unknown or invalid."""
+
+    def __init__(self, name: str, option: str, reason: str) -> None:
+        super().__init__(f"Invalid option '{option}' of actor '{name}': {reason}.")
+
+
+class CoordinationError(RuntimeError):
+    """Coordinated run on several nodes cannot go on."""
+
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(f"Coordinated run failed: {reason}.")
@@ -0,0 +1,388 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""OpenMetrics (Prometheus) endpoint for load generator metrics.
+
+:class:`MetricsExporter` serves ``GET /metrics`` in the OpenMetrics text
+format. Besides metrics of its own process it accepts snapshots pushed
+by other local processes with ``POST /push``, so a single endpoint
+exposes the sum over all dramatiq worker processes. Pushes are only
+accepted from the loopback interface, while ``/metrics`` can be scraped
+from anywhere. Worker processes
+push with :class:`MetricsPusher`, started by a dramatiq middleware from
+:func:`metrics_middleware`.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .metrics import PHASES, Histogram, Metrics, Snapshot, Stats
+
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Upper bounds of latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+GAUGES = {
+    "pool.size": ("dbload_pool_size", "Maximum number of pooled connections."),
+    "pool.in_use": ("dbload_pool_in_use", "Number of borrowed pooled connections."),
+    "users.active": ("dbload_users_active", "Number of active virtual users."),
+    "users.target": ("dbload_users_target", "Number of virtual users requested by the load shape."),
+    "jvm.heap_used": ("dbload_jvm_heap_used_bytes", "Used JVM heap."),
+    "jvm.heap_committed": ("dbload_jvm_heap_committed_bytes", "Committed JVM heap."),
+    "processes": ("dbload_processes", "Number of processes reporting metrics."),
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _bucket_counts(h: Histogram) -> List[Tuple[str, int]]:
+    """Cumulative counts for the fixed latency buckets."""
+
+    return [
+        (f"{le}", h.count_le(int(le * 1_000_000))) for le in LATENCY_BUCKETS
+    ] + [("+Inf", h.count)]
+
+
+def _render_stats(kind: str, items: Dict[str, Stats]) -> List[str]:
+    prefix = f"dbload_{kind}"
+    lines = [
+        f"# TYPE {prefix}_executions counter",
+        f"# HELP {prefix}_executions Number of executed {kind} invocations.",
+    ]
+    for name, s in sorted(items.items()):
+        lines.append(
+            f'{prefix}_executions_total{{{kind}="{_escape(name)}"}} {s.executions}'
+        )
+
+    lines += [
+        f"# TYPE {prefix}_errors counter",
+        f"# HELP {prefix}_errors Number of failed {kind} invocations by error class.",
+    ]
+    for name, s in sorted(items.items()):
+        for error, count in sorted(s.errors.items()):
+            lines.append(
+                f'{prefix}_errors_total{{{kind}="{_escape(name)}",error="{_escape(error)}"}} {count}'
+            )
+
+    if kind == "query":
+        lines += [
+            f"# TYPE {prefix}_rows counter",
+            f"# HELP {prefix}_rows Number of fetched or affected rows.",
+        ]
+        for name, s in sorted(items.items()):
+            lines.append(
+                f'{prefix}_rows_total{{{kind}="{_escape(name)}"}} {s.rows}'
+            )
+
+    lines += [
+        f"# TYPE {prefix}_latency_seconds histogram",
+        f"# HELP {prefix}_latency_seconds Latency of {kind} invocations.",
+    ]
+    for name, s in sorted(items.items()):
+        label = f'{kind}="{_escape(name)}"'
+        for le, count in _bucket_counts(s.latency):
+            lines.append(
+                f'{prefix}_latency_seconds_bucket{{{label},le="{le}"}} {count}'
+            )
+        lines.append(
+            f"{prefix}_latency_seconds_sum{{{label}}} {s.latency.total / 1e6}"
+        )
+        lines.append(
+            f"{prefix}_latency_seconds_count{{{label}}} {s.latency.count}"
+        )
+
+    if kind == "query":
+        lines += [
+            f"# TYPE {prefix}_phase_seconds summary",
+            f"# HELP {prefix}_phase_seconds Time spent in each phase of {kind} invocations.",
+        ]
+        for name, s in sorted(items.items()):
+            for phase in PHASES:
+                h = s.phases.get(phase)
+                if h is None:
+                    continue
+                label = f'{kind}="{_escape(name)}",phase="{phase}"'
+                lines.append(
+                    f"{prefix}_phase_seconds_sum{{{label}}} {h.total / 1e6}"
+                )
+                lines.append(
+                    f"{prefix}_phase_seconds_count{{{label}}} {h.count}"
+                )
+    return lines
+
+
+def render_openmetrics(snapshot: Snapshot) -> str:
+    """Render snapshot in the OpenMetrics text exposition format."""
+
+    lines = _render_stats("query", snapshot.queries)
+    lines += _render_stats("scenario", snapshot.scenarios)
+    for key, value in sorted(snapshot.gauges.items()):
+        name, help_text = GAUGES.get(
+            key, (f"dbload_{key.replace('.', '_')}", key)
+        )
+        lines += [
+            f"# TYPE {name} gauge",
+            f"# HELP {name} {help_text}",
+            f"{name} {value}",
+        ]
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def register_process_gauges(metrics: Metrics) -> None:
+    """Register gauges describing the current process, like JVM heap."""
+
+    def _heap(kind: str) -> float:
+        import jpype
+
+        if not jpype.isJVMStarted():
+            return 0.0
+        runtime = jpype.JClass("java.lang.Runtime").getRuntime()
+        if kind == "used":
+            return float(runtime.totalMemory() - runtime.freeMemory())
+        return float(runtime.totalMemory())
+
+    metrics.register_gauge("jvm.heap_used", lambda: _heap("used"))
+    metrics.register_gauge("jvm.heap_committed", lambda: _heap("committed"))
+
+
+def _is_loopback(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    mapped = getattr(address, "ipv4_mapped", None)
+    return (mapped or address).is_loopback
+
+
+class MetricsExporter:
+    """HTTP endpoint exposing merged metrics of local processes.
+
+    Args:
+        metrics (Metrics): Metrics of this process to include. Pass
+            ``None`` when this process does not execute queries itself.
+        host (str): Interface to listen on.
+        port (int): Port to listen on. ``0`` picks a free port.
+        ttl (float): Pushed snapshots older than this many seconds are
+            considered to belong to dead processes and are dropped.
+
+    Examples:
+        Expose metrics of this process and scrape them::
+
+            exporter = MetricsExporter(get_metrics(), port=9464)
+            exporter.start()
+            # curl http://localhost:9464/metrics
+    """
+
+    def __init__(
+        self,
+        metrics: Optional[Metrics] = None,
+        host: str = "0.0.0.0",
+        port: int = 9464,
+        ttl: float = 60.0,
+    ) -> None:
+        self.metrics = metrics
+        self.ttl = ttl
+        self._pushed: Dict[str, Tuple[float, Snapshot]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def push(self, source: str, snapshot: Snapshot) -> None:
+        """Store latest snapshot of another process."""
+
+        with self._lock:
+            self._pushed[source] = (time.time(), snapshot)
+
+    def snapshot(self) -> Snapshot:
+        """Merge own metrics with snapshots pushed by live processes."""
+
+        now = time.time()
+        merged = Snapshot()
+        processes = 0
+        if self.metrics is not None:
+            merged.merge(self.metrics.snapshot())
+            processes += 1
+        with self._lock:
+            for source, (received, snapshot) in list(self._pushed.items()):
+                if now - received > self.ttl:
+                    del self._pushed[source]
+                    continue
+                merged.merge(snapshot)
+                processes += 1
+        merged.gauges["processes"] = processes
+        return merged
+
+    def _handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_openmetrics(exporter.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != "/push":
+                    self.send_error(404)
+                    return
+                # Only local worker processes may add to the results
+                if not _is_loopback(self.client_address[0]):
+                    self.send_error(403)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    data = json.loads(self.rfile.read(length))
+                    exporter.push(
+                        str(data["source"]),
+                        Snapshot.from_dict(data["snapshot"]),
+                    )
+                except (ValueError, KeyError) as e:
+                    self.send_error(400, f"{e}")
+                    return
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics endpoint: {format % args}")
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="dbload-metrics-exporter",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info(f"Serving metrics on port {self.port}.")
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsPusher:
+    """Periodically push snapshots of this process to an exporter.
+
+    Args:
+        metrics (Metrics): Metrics to push.
+        url (str): Push URL of the exporter, e.g.
+            ``http://127.0.0.1:9464/push``.
+        interval (float): Seconds between pushes.
+    """
+
+    def __init__(self, metrics: Metrics, url: str, interval: float = 1.0):
+        self.metrics = metrics
+        self.url = url
+        self.interval = interval
+        self.source = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def push(self) -> None:
+        body = json.dumps(
+            dict(source=self.source, snapshot=self.metrics.snapshot().to_dict())
+        ).encode()
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            logger.debug(f"Cannot push metrics to {self.url}: {e}")
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.push()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._loop, name="dbload-metrics-pusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.push()
+
+
+def metrics_middleware(url: str, interval: float = 1.0):
+    """Create dramatiq middleware pushing worker metrics to ``url``.
+
+    Requires the optional ``dramatiq`` package.
+    """
+
+    from dramatiq import Middleware
+
+    from .metrics_singleton import get_metrics
+
+    class MetricsPushMiddleware(Middleware):
+        pusher: Optional[MetricsPusher] = None
+
+        def after_worker_boot(self, broker, worker):
+            metrics = get_metrics()
+            register_process_gauges(metrics)
+            self.pusher = MetricsPusher(metrics, url, interval)
+            self.pusher.start()
+
+        def before_worker_shutdown(self, broker, worker):
+            if self.pusher is not None:
+                self.pusher.stop()
+
+    return MetricsPushMiddleware()
@@ -0,0 +1,137 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run independent queries of a scenario concurrently.
+
+Every function decorated by :meth:`~dbload.query.query` has a ``defer``
+method taking the same arguments as the query, except the cursor. It
+returns a :class:`Deferred` call, which :func:`gather` executes on a
+separate pooled connection::
+
+    emp, client = gather(
+        create_sale.find_employees_by_terminated_return_random.defer(terminated=False),
+        create_sale.get_clients_return_random.defer(),
+    )
+
+Connections come from a per-process pool of ``pool_size`` connections,
+which is separate from connections held by virtual users.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from .connection import ConnectionPool
+from .query_result import note_acquire, take_acquire
+
+
+class Deferred:
+    """Query call to be executed later on a connection of its own.
+
+    Args:
+        function (Callable): Query function taking a cursor as the first
+            argument.
+        args: Positional arguments of the query, without the cursor.
+        kwargs: Keyword arguments of the query.
+    """
+
+    def __init__(self, function: Callable, *args, **kwargs) -> None:
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, connection) -> Any:
+        with connection.cursor() as cursor:
+            return self.function(cursor, *self.args, **self.kwargs)
+
+    def __repr__(self) -> str:
+        name = getattr(self.function, "__name__", repr(self.function))
+        return f"Deferred({name})"
+
+
+class _FanOut:
+    """Per-process pool and executor used by :func:`gather`."""
+
+    pool: Optional[ConnectionPool] = None
+    executor: Optional[ThreadPoolExecutor] = None
+    pid: Optional[int] = None
+    lock = threading.Lock()
+
+
+def _get_fanout() -> _FanOut:
+    # Forked processes must not reuse connections of their parent
+    with _FanOut.lock:
+        if _FanOut.pid != os.getpid():
+            from .config_singleton import get_config
+
+            size = get_config().pool_size
+            _FanOut.pool = ConnectionPool(size=size)
+            _FanOut.executor = ThreadPoolExecutor(
+                max_workers=size, thread_name_prefix="dbload-fanout"
+            )
+            _FanOut.pid = os.getpid()
+    return _FanOut
+
+
+def _borrow(pool: ConnectionPool, deferred: Deferred) -> Any:
+    started = time.perf_counter_ns()
+    with pool.connection() as connection:
+        note_acquire(time.perf_counter_ns() - started)
+        try:
+            return deferred(connection)
+        finally:
+            take_acquire()
+
+
+def gather(
+    *deferred: Deferred,
+    pool: Optional[ConnectionPool] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Execute deferred queries concurrently and return their results.
+
+    Results are returned in the order of the arguments. All queries are
+    waited for even when some of them fail.
+
+    Args:
+        deferred (Deferred): Calls created by ``query.defer(...)``.
+        pool (ConnectionPool): Pool to take connections from. Defaults
+            to the per-process fan-out pool.
+        return_exceptions (bool): Return exceptions in place of results
+            instead of raising the first of them.
+
+    Raises:
+        QueryExecutionError: when a query fails and neither
+            ``return_exceptions`` nor the query's ``ignore`` is set.
+    """
+
+    fanout = _get_fanout()
+    pool = pool or fanout.pool
+    futures = [fanout.executor.submit(_borrow, pool, d) for d in deferred]
+
+    results: List[Any] = []
+    error: Optional[BaseException] = None
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if not return_exceptions and error is None:
+                error = e
+            results.append(e)
+
+    if error is not None:
+        raise error
+    return results
@@ -0,0 +1,323 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import csv
+import itertools
+import mmap
+import random
+from array import array
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from loguru import logger
+
+from .exceptions import (
+    ArrowNotFoundError,
+    FeedExhaustedError,
+    UnsupportedFeedError,
+)
+
+
+FEED_MODES = ("sequential", "random", "partitioned")
+
+
+def _auto_convert(value: str) -> Any:
+    """Convert CSV field into int or float when it looks like one."""
+
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _to_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "y", "t")
+
+
+# Column types accepted by name, e.g. from the ``feeds`` config section
+FEED_TYPES = {
+    "int": int,
+    "float": float,
+    "str": str,
+    "bool": _to_bool,
+    "auto": _auto_convert,
+}
+
+
+def _converter(kind: Union[str, Callable]) -> Callable:
+    if callable(kind):
+        return kind
+    if kind not in FEED_TYPES:
+        raise UnsupportedFeedError(f"column type '{kind}'")
+    return FEED_TYPES[kind]
+
+
+class Feed(abc.ABC):
+    """Source of query parameters backed by a file.
+
+    Feed hands out one row of parameters per call. Rows are never all
+    materialized as python objects; subclasses only keep a compact index
+    of the file and decode a row when it is requested.
+
+    Any feed is callable, which makes it a drop-in parameter source for
+    auto queries::
+
+        feed = open_feed("customer_ids.csv", mode="random")
+        find_client_by_id(cursor, feed=feed)
+
+    Args:
+        mode (str): How rows are handed out: ``sequential`` (in file order),
+            ``random`` (uniformly random rows) or ``partitioned`` (in file
+            order, but only the rows that belong to ``worker``).
+        worker (int): Index of the current worker for ``partitioned`` mode.
+        workers (int): Total number of workers for ``partitioned`` mode.
+        loop (bool): Start over when the end of the feed is reached.
+            Otherwise :class:`~.FeedExhaustedError` is raised.
+    """
+
+    def __init__(
+        self,
+        mode: str = "sequential",
+        worker: int = 0,
+        workers: int = 1,
+        loop: bool = True,
+    ) -> None:
+        if mode not in FEED_MODES:
+            raise UnsupportedFeedError(f"mode '{mode}'")
+
+        self.mode = mode
+        self.worker = worker
+        self.workers = max(workers, 1)
+        self.loop = loop
+        # Incrementing ``itertools.count`` is atomic under the GIL, so
+        # several threads can share one feed without any locking.
+        self._counter = itertools.count()
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def row(self, index: int) -> List[Any]:
+        """Decode row by its index."""
+
+    def partition(self, worker: int, workers: int) -> "Feed":
+        """Create a view of this feed that only yields rows of ``worker``.
+
+        The view shares the underlying file mapping with this feed.
+        """
+
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view.mode = "partitioned"
+        view.worker = worker
+        view.workers = max(workers, 1)
+        view._counter = itertools.count()
+        return view
+
+    def next(self) -> List[Any]:
+        """Get the next row of parameters according to the feed mode."""
+
+        total = len(self)
+        if total == 0:
+            raise FeedExhaustedError(self)
+
+        if self.mode == "random":
+            return self.row(random.randrange(total))
+
+        step = next(self._counter)
+        if self.mode == "partitioned":
+            # Rows worker, worker + workers, worker + 2 * workers, ...
+            owned = (total - self.worker + self.workers - 1) // self.workers
+            if owned <= 0:
+                raise FeedExhaustedError(self)
+            if step >= owned and not self.loop:
+                raise FeedExhaustedError(self)
+            return self.row(self.worker + (step % owned) * self.workers)
+
+        if step >= total and not self.loop:
+            raise FeedExhaustedError(self)
+        return self.row(step % total)
+
+    __call__ = next
+
+
+class CsvFeed(Feed):
+    """Feed that streams rows from a memory-mapped CSV file.
+
+    On creation the file is scanned once to build an index of line
+    offsets, stored in a compact ``array`` of 64-bit integers. Rows are
+    decoded lazily from the memory map when requested.
+
+    Fields that look like integers or floats are converted automatically,
+    unless explicit ``types`` are given. Quoted fields containing line
+    breaks are not supported.
+
+    Args:
+        path (str): Path to the CSV file.
+        header (bool): Whether the first line is a header.
+        columns (List[str]): Subset of header columns to use, in the order
+            of the query parameters. Requires ``header``.
+        types (List[Union[str, Callable]]): Converters applied to each
+            column, or names of them: ``int``, ``float``, ``str``,
+            ``bool`` or ``auto``.
+        delimiter (str): CSV field delimiter.
+        encoding (str): Text encoding of the file.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        header: bool = True,
+        columns: Optional[Sequence[str]] = None,
+        types: Optional[Sequence[Union[str, Callable]]] = None,
+        delimiter: str = ",",
+        encoding: str = "utf-8",
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+
+        self.path = Path(path)
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.types = [_converter(t) for t in types] if types else None
+
+        if self.path.stat().st_size == 0:
+            raise UnsupportedFeedError(f"empty file '{self.path}'")
+
+        self._file = self.path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = self._index()
+
+        self.header: Optional[List[str]] = None
+        if header and len(self._offsets) > 0:
+            self.header = self._decode(0)
+            self._offsets = self._offsets[1:]
+
+        self._select: Optional[List[int]] = None
+        if columns:
+            if not self.header:
+                raise UnsupportedFeedError("columns selection without header")
+            self._select = [self.header.index(c) for c in columns]
+
+        logger.debug(f"Indexed {len(self)} rows of the '{self.path}' feed.")
+
+    def _index(self) -> array:
+        """Build array of start offsets for every non-empty line."""
+
+        offsets = array("Q")
+        mm, size, pos = self._mm, len(self._mm), 0
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            if end == -1:
+                end = size
+            if mm[pos:end].strip():
+                offsets.append(pos)
+            pos = end + 1
+        return offsets
+
+    def _decode(self, line: int) -> List[str]:
+        start = self._offsets[line]
+        end = self._mm.find(b"\n", start)
+        if end == -1:
+            end = len(self._mm)
+        text = self._mm[start:end].decode(self.encoding).rstrip("\r")
+        return next(csv.reader((text,), delimiter=self.delimiter))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def row(self, index: int) -> List[Any]:
+        fields = self._decode(index)
+        if self._select is not None:
+            fields = [fields[i] for i in self._select]
+        if self.types:
+            return [t(v) for t, v in zip(self.types, fields)]
+        return [_auto_convert(v) for v in fields]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+class ArrowFeed(Feed):
+    """Feed backed by a memory-mapped Parquet or Arrow IPC file.
+
+    Requires the optional ``pyarrow`` package. Data stays in Arrow
+    columnar buffers, only the requested row is converted to python.
+
+    Args:
+        path (str): Path to ``.parquet``, ``.arrow`` or ``.feather`` file.
+        columns (List[str]): Subset of columns to use, in the order of
+            the query parameters.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        columns: Optional[Sequence[str]] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            import pyarrow.ipc
+        except ImportError:
+            raise ArrowNotFoundError() from None
+
+        self.path = Path(path)
+        if self.path.suffix == ".parquet":
+            table = pyarrow.parquet.read_table(
+                str(self.path), columns=columns, memory_map=True
+            )
+        else:
+            source = pyarrow.memory_map(str(self.path), "r")
+            table = pyarrow.ipc.open_file(source).read_all()
+            if columns:
+                table = table.select(list(columns))
+
+        self._table = table
+        self._columns = table.columns
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def row(self, index: int) -> List[Any]:
+        return [column[index].as_py() for column in self._columns]
+
+
+def open_feed(path: Union[str, Path], **kwargs) -> Feed:
+    """Open a feed choosing the implementation by file extension.
+
+    All keyword arguments are passed to the feed constructor.
+    """
+
+    suffix = Path(path).suffix.lower()
+    if suffix in (".csv", ".tsv", ".txt"):
+        if suffix == ".tsv":
+            kwargs.setdefault("delimiter", "\t")
+        return CsvFeed(path, **kwargs)
+    elif suffix in (".parquet", ".arrow", ".feather"):
+        return ArrowFeed(path, **kwargs)
+    else:
+        raise UnsupportedFeedError(f"file type '{suffix}'")
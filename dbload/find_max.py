@@ -0,0 +1,241 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search for the concurrency that gives the maximum sustainable throughput.
+
+:class:`SaturationFinder` runs scenarios at increasing numbers of
+virtual users, growing them geometrically while throughput keeps rising
+and the latency SLO holds. Once a level fails, the range between the
+last accepted and the failed level is bisected until it is narrower
+than the resolution. The last accepted level is the knee of the
+throughput-latency curve.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from loguru import logger
+from prettytable import PrettyTable
+
+from .connection import ConnectionPool
+from .load_shape import LoadShape
+from .metrics import Metrics
+from .metrics_singleton import get_metrics
+from .runner import Runner
+from .thresholds import Threshold, evaluate
+
+
+class _Level(LoadShape):
+    """Load shape whose number of users is set by the finder."""
+
+    def __init__(self, users: int, max_users: int) -> None:
+        self.users = users
+        self.max_users = max_users
+
+    def target(self, t: float) -> float:
+        return self.users
+
+
+@dataclass
+class SaturationStep:
+    """Measurements at one level of concurrency."""
+
+    users: int
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    error_rate: float
+    # "ok", "slo" or "plateau"
+    verdict: str = "ok"
+    violated: Optional[List[str]] = None
+
+
+@dataclass
+class SaturationResult:
+    steps: List[SaturationStep]
+    knee: Optional[SaturationStep]
+
+
+class SaturationFinder:
+    """Adaptive concurrency search.
+
+    A level is accepted when all ``slo`` thresholds hold and throughput
+    grew by at least ``min_gain`` compared to the previously accepted
+    level.
+
+    Args:
+        scenarios (List[str]): Names of registered scenarios to run.
+        start_users (int): First level of concurrency.
+        max_users (int): Upper limit of the search.
+        growth (float): Factor between levels before the first failure.
+        step_duration (float): Seconds every level is measured for.
+        settle (float): Seconds at the beginning of every level that are
+            not measured, while the load stabilizes.
+        slo (List[Threshold]): Thresholds every accepted level must hold,
+            e.g. ``p99 < 20ms``.
+        min_gain (float): Minimal relative throughput increase.
+        resolution (float): Bisection stops when the range between the
+            accepted and the failed level is within this fraction of the
+            accepted level.
+        pool (ConnectionPool): Pool to take connections from. Defaults
+            to a pool of ``max_users`` connections, which are opened
+            only when a level needs them.
+        ignore (bool): Passed to the scenarios.
+        metrics (Metrics): Metrics levels are measured with. Defaults to
+            the global metrics.
+        clock (Callable): Monotonic time in seconds.
+        sleep (Callable): Waits the given number of seconds.
+    """
+
+    def __init__(
+        self,
+        scenarios: List[str],
+        start_users: int = 1,
+        max_users: int = 256,
+        growth: float = 2.0,
+        step_duration: float = 10.0,
+        settle: Optional[float] = None,
+        slo: Optional[List[Threshold]] = None,
+        min_gain: float = 0.05,
+        resolution: float = 0.1,
+        pool: Optional[ConnectionPool] = None,
+        ignore: bool = False,
+        metrics: Optional[Metrics] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.scenarios = scenarios
+        self.start_users = max(start_users, 1)
+        self.max_users = max(max_users, self.start_users)
+        self.growth = max(growth, 1.1)
+        self.step_duration = step_duration
+        self.settle = step_duration * 0.2 if settle is None else settle
+        self.slo = slo or []
+        self.min_gain = min_gain
+        self.resolution = resolution
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.clock = clock
+        self.sleep = sleep
+        self._level = _Level(self.start_users, self.max_users)
+        self.runner = Runner(
+            scenarios,
+            shape=self._level,
+            pool=pool or ConnectionPool(size=self.max_users),
+            ignore=ignore,
+        )
+        self.steps: List[SaturationStep] = []
+
+    def measure(self, users: int) -> SaturationStep:
+        """Run at the given level and measure it."""
+
+        self._level.users = users
+        self.sleep(self.settle)
+        before = self.metrics.snapshot()
+        started = self.clock()
+        self.sleep(self.step_duration)
+        delta = self.metrics.snapshot().subtract(before)
+        elapsed = self.clock() - started
+
+        stats = delta.scenarios or delta.queries
+        executions = sum(s.executions for s in stats.values())
+        errors = sum(s.error_count for s in stats.values())
+        latency = None
+        for s in stats.values():
+            latency = s.latency.copy() if latency is None else latency.merge(s.latency)
+
+        step = SaturationStep(
+            users=users,
+            throughput=executions / elapsed if elapsed > 0 else 0.0,
+            p50_ms=latency.percentile(50) / 1000 if latency else 0.0,
+            p99_ms=latency.percentile(99) / 1000 if latency else 0.0,
+            error_rate=errors / executions if executions else 0.0,
+        )
+        _, violations = evaluate(self.slo, delta, elapsed)
+        if violations:
+            step.verdict = "slo"
+            step.violated = [v.threshold.text for v in violations]
+        self.steps.append(step)
+        logger.info(
+            f"{users} users: {step.throughput:.1f} ops/s, p99 {step.p99_ms:.2f} ms"
+            + (f", violated {step.violated}" if violations else "")
+        )
+        return step
+
+    def _accept(self, step: SaturationStep, best: Optional[SaturationStep]) -> bool:
+        if step.verdict == "slo":
+            return False
+        if best is not None and step.throughput < best.throughput * (1 + self.min_gain):
+            step.verdict = "plateau"
+            return False
+        return True
+
+    def run(self) -> SaturationResult:
+        """Search for the knee. Blocks until the search is finished."""
+
+        self.runner.start()
+        try:
+            best: Optional[SaturationStep] = None
+            failed: Optional[int] = None
+
+            # Grow geometrically until a level fails
+            users = self.start_users
+            while True:
+                step = self.measure(users)
+                if not self._accept(step, best):
+                    failed = users
+                    break
+                best = step
+                if users >= self.max_users:
+                    break
+                users = min(max(int(users * self.growth), users + 1), self.max_users)
+
+            # Bisect between the last accepted and the failed level
+            while best is not None and failed is not None:
+                if failed - best.users <= max(1, best.users * self.resolution):
+                    break
+                users = (best.users + failed) // 2
+                step = self.measure(users)
+                if self._accept(step, best):
+                    best = step
+                else:
+                    failed = users
+        finally:
+            self.runner.stop()
+            self.runner.wait()
+
+        return SaturationResult(steps=self.steps, knee=best)
+
+
+def saturation_table(result: SaturationResult) -> PrettyTable:
+    """Build throughput versus latency table of all measured levels."""
+
+    pt = PrettyTable(["Users", "Ops/s", "p50, ms", "p99, ms", "Err %", "Verdict"])
+    for step in sorted(result.steps, key=lambda s: s.users):
+        verdict = "knee" if step is result.knee else step.verdict
+        if step.violated:
+            verdict += f" ({', '.join(step.violated)})"
+        pt.add_row(
+            [
+                step.users,
+                round(step.throughput, 1),
+                round(step.p50_ms, 2),
+                round(step.p99_ms, 2),
+                round(step.error_rate * 100, 2),
+                verdict,
+            ]
+        )
+    pt.align = "r"
+    pt.align["Verdict"] = "l"
+    return pt
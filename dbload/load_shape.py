@@ -0,0 +1,214 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load shapes: number of virtual users as a function of time.
+
+Shapes are given to :class:`~dbload.runner.Runner` directly or parsed
+from specifications like these::
+
+    constant(50)              50 users
+    ramp(10, 500, 10m)        10 to 500 users linearly over 10 minutes
+    step(10, 50, 2m, 500)     start with 10, add 50 every 2 minutes up to 500
+    spike(50, 500, 5m, 30s)   50 users, 500 for 30 seconds every 5 minutes
+    sine(250, 200, 24h)       250 +- 200 users with a period of 24 hours
+
+Durations are seconds unless they have an ``ms``, ``s``, ``m`` or ``h``
+suffix. An optional last argument of ``constant``, ``step``, ``spike``
+and ``sine`` limits the duration of the shape, ``ramp`` holds its end
+value for as long as the run lasts.
+"""
+
+import abc
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+from .exceptions import LoadShapeError
+
+
+spec_regex = re.compile(r"^\s*(\w+)\s*\((.*)\)\s*$")
+duration_regex = re.compile(r"^\s*(\d+(?:\.\d*)?)\s*(ms|s|m|h)?\s*$")
+
+DURATION_UNITS = {None: 1.0, "ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(text: str) -> float:
+    """Parse duration like ``30``, ``30s``, ``10m`` or ``1.5h`` in seconds."""
+
+    m = duration_regex.match(str(text))
+    if not m:
+        raise ValueError(f"invalid duration '{text}'")
+    return float(m.group(1)) * DURATION_UNITS[m.group(2)]
+
+
+class LoadShape(abc.ABC):
+    """Base class of load shapes.
+
+    Attributes:
+        duration (float): Length of the shape in seconds, ``None`` when
+            it does not end by itself.
+        max_users (float): Largest number of users the shape asks for.
+    """
+
+    duration: Optional[float] = None
+    max_users: float = 1
+
+    @abc.abstractmethod
+    def target(self, t: float) -> float:
+        """Number of virtual users ``t`` seconds after the start."""
+
+
+class Constant(LoadShape):
+    def __init__(self, users: float, duration: Optional[float] = None) -> None:
+        self.users = users
+        self.duration = duration
+        self.max_users = users
+
+    def target(self, t: float) -> float:
+        return self.users
+
+
+class Ramp(LoadShape):
+    def __init__(self, start: float, end: float, over: float) -> None:
+        self.start = start
+        self.end = end
+        self.over = over
+        self.max_users = max(start, end)
+
+    def target(self, t: float) -> float:
+        if t >= self.over or self.over <= 0:
+            return self.end
+        return self.start + (self.end - self.start) * t / self.over
+
+
+class Step(LoadShape):
+    def __init__(
+        self,
+        start: float,
+        step: float,
+        every: float,
+        limit: float,
+        duration: Optional[float] = None,
+    ) -> None:
+        if every <= 0:
+            raise ValueError("step interval must be positive")
+        self.start = start
+        self.step = step
+        self.every = every
+        self.limit = limit
+        self.duration = duration
+        self.max_users = max(start, limit)
+
+    def target(self, t: float) -> float:
+        value = self.start + self.step * math.floor(t / self.every)
+        return min(value, self.limit) if self.step >= 0 else max(value, self.limit)
+
+
+class Spike(LoadShape):
+    def __init__(
+        self,
+        base: float,
+        peak: float,
+        every: float,
+        length: float,
+        duration: Optional[float] = None,
+    ) -> None:
+        if every <= 0:
+            raise ValueError("spike interval must be positive")
+        self.base = base
+        self.peak = peak
+        self.every = every
+        self.length = length
+        self.duration = duration
+        self.max_users = max(base, peak)
+
+    def target(self, t: float) -> float:
+        # Spikes happen at the end of every period
+        return self.peak if t % self.every >= self.every - self.length else self.base
+
+
+class Sine(LoadShape):
+    def __init__(
+        self,
+        mean: float,
+        amplitude: float,
+        period: float,
+        duration: Optional[float] = None,
+    ) -> None:
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period
+        self.duration = duration
+        self.max_users = mean + abs(amplitude)
+
+    def target(self, t: float) -> float:
+        return max(self.mean + self.amplitude * math.sin(2 * math.pi * t / self.period), 0)
+
+
+class Scaled(LoadShape):
+    """Fraction of another shape, e.g. the share of one of many processes."""
+
+    def __init__(self, shape: LoadShape, factor: float) -> None:
+        self.shape = shape
+        self.factor = factor
+        self.duration = shape.duration
+        self.max_users = shape.max_users * factor
+
+    def target(self, t: float) -> float:
+        return self.shape.target(t) * self.factor
+
+
+# Argument kinds of every shape: "n" is a number, "d" is a duration
+SHAPES: Dict[str, Tuple[type, str, str]] = {
+    "constant": (Constant, "n", "d"),
+    "ramp": (Ramp, "nnd", ""),
+    "step": (Step, "nndn", "d"),
+    "spike": (Spike, "nndd", "d"),
+    "sine": (Sine, "nnd", "d"),
+}
+
+
+def parse_shape(spec: str) -> LoadShape:
+    """Parse load shape specification like ``ramp(10, 500, 10m)``.
+
+    Raises:
+        LoadShapeError: when the specification cannot be parsed.
+    """
+
+    m = spec_regex.match(spec)
+    if not m:
+        raise LoadShapeError(spec, "expected 'name(arguments)'")
+    name = m.group(1)
+    if name not in SHAPES:
+        raise LoadShapeError(spec, f"unknown shape, use one of {', '.join(SHAPES)}")
+
+    cls, required, optional = SHAPES[name]
+    arguments = [a.strip() for a in m.group(2).split(",") if a.strip()]
+    if not len(required) <= len(arguments) <= len(required) + len(optional):
+        raise LoadShapeError(spec, f"{name} takes {len(required)} arguments")
+
+    values = []
+    for kind, argument in zip(required + optional, arguments):
+        try:
+            values.append(
+                parse_duration(argument) if kind == "d" else float(argument)
+            )
+        except ValueError as e:
+            raise LoadShapeError(spec, f"{e}")
+    try:
+        return cls(*values)
+    except ValueError as e:
+        raise LoadShapeError(spec, f"{e}")
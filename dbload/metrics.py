@@ -0,0 +1,460 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process metrics of executed queries and scenarios.
+
+Every thread records into its own :class:`Recorder`, which nobody else
+writes to, so the hot path takes no locks. Readers, like the dashboard
+or the report, call :meth:`Metrics.snapshot` which merges copies of all
+recorders into a :class:`Snapshot`.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+# Every power of two is split into 2 ** SUB_BITS linear sub-buckets,
+# which bounds the relative error of percentiles by ~3%.
+SUB_BITS = 5
+SUB_COUNT = 1 << SUB_BITS
+
+
+class Histogram:
+    """Log-linear histogram of integer values, e.g. latency in µs.
+
+    Buckets are kept in a sparse dict, which makes histograms cheap to
+    copy, merge, subtract and serialize.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @staticmethod
+    def index(value: int) -> int:
+        """Get bucket index of a value."""
+
+        if value < SUB_COUNT:
+            return max(value, 0)
+        shift = value.bit_length() - SUB_BITS - 1
+        return ((shift + 1) << SUB_BITS) + (value >> shift) - SUB_COUNT
+
+    @staticmethod
+    def lower_bound(index: int) -> int:
+        """Get smallest value that falls into the bucket."""
+
+        if index < SUB_COUNT:
+            return index
+        shift = (index >> SUB_BITS) - 1
+        return ((index & (SUB_COUNT - 1)) + SUB_COUNT) << shift
+
+    @staticmethod
+    def upper_bound(index: int) -> int:
+        """Get largest value that falls into the bucket."""
+        return Histogram.lower_bound(index + 1) - 1
+
+    def record(self, value: int) -> None:
+        i = Histogram.index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Estimate the value at percentile ``p`` (0-100)."""
+
+        if not self.count:
+            return 0.0
+        rank = max(p / 100 * self.count, 1)
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                # Middle of the bucket, clamped by observed extremes
+                value = (Histogram.lower_bound(i) + Histogram.upper_bound(i)) / 2
+                return float(min(max(value, self.min), self.max))
+        return float(self.max)  # pragma: no cover
+
+    def count_le(self, value: int) -> int:
+        """Count values less than or equal to ``value`` (approximately)."""
+        return sum(
+            c for i, c in self.counts.items() if Histogram.upper_bound(i) <= value
+        )
+
+    def copy(self) -> "Histogram":
+        h = Histogram()
+        h.counts = dict(self.counts)
+        h.count, h.total, h.min, h.max = (
+            self.count,
+            self.total,
+            self.min,
+            self.max,
+        )
+        return h
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        """Add values of ``other`` histogram into this one."""
+
+        if not other.count:
+            return self
+        # ``other`` may belong to a thread that keeps recording into it
+        for i, c in list(other.counts.items()):
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.min = min(self.min, other.min) if self.count else other.min
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def subtract(self, other: "Histogram") -> "Histogram":
+        """Get histogram of values recorded since ``other`` was copied.
+
+        Minimum and maximum cannot be restored exactly and are taken
+        from the remaining buckets.
+        """
+
+        h = Histogram()
+        for i, c in self.counts.items():
+            left = c - other.counts.get(i, 0)
+            if left > 0:
+                h.counts[i] = left
+        h.count = sum(h.counts.values())
+        h.total = max(self.total - other.total, 0)
+        if h.counts:
+            h.min = Histogram.lower_bound(min(h.counts))
+            h.max = min(Histogram.upper_bound(max(h.counts)), self.max)
+        return h
+
+    def to_dict(self) -> Dict:
+        return dict(
+            counts={str(i): c for i, c in self.counts.items()},
+            count=self.count,
+            total=self.total,
+            min=self.min,
+            max=self.max,
+        )
+
+    @staticmethod
+    def from_dict(data: Dict) -> "Histogram":
+        h = Histogram()
+        h.counts = {int(i): c for i, c in data.get("counts", {}).items()}
+        h.count = data.get("count", 0)
+        h.total = data.get("total", 0)
+        h.min = data.get("min", 0)
+        h.max = data.get("max", 0)
+        return h
+
+
+# Phases of a query invocation, in the order they happen
+PHASES = ("acquire", "execute", "fetch", "convert", "commit")
+
+
+class Stats:
+    """Counters and latency histogram of a single query or scenario.
+
+    Latency is recorded in microseconds. Queries additionally keep a
+    latency histogram per phase of the invocation, see :data:`PHASES`.
+    """
+
+    __slots__ = ("executions", "errors", "rows", "latency", "phases")
+
+    def __init__(self) -> None:
+        self.executions = 0
+        self.errors: Dict[str, int] = {}
+        self.rows = 0
+        self.latency = Histogram()
+        self.phases: Dict[str, Histogram] = {}
+
+    def record(
+        self,
+        duration_ns: int,
+        rows: int = -1,
+        error: Optional[BaseException] = None,
+        phases: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.executions += 1
+        if rows > 0:
+            self.rows += rows
+        if error is not None:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        self.latency.record(duration_ns // 1000)
+        if phases:
+            for phase, ns in phases.items():
+                h = self.phases.get(phase)
+                if h is None:
+                    h = self.phases[phase] = Histogram()
+                h.record(ns // 1000)
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    @property
+    def error_rate(self) -> float:
+        return self.error_count / self.executions if self.executions else 0.0
+
+    def copy(self) -> "Stats":
+        s = Stats()
+        s.executions = self.executions
+        s.errors = dict(self.errors)
+        s.rows = self.rows
+        s.latency = self.latency.copy()
+        s.phases = {k: h.copy() for k, h in list(self.phases.items())}
+        return s
+
+    def merge(self, other: "Stats") -> "Stats":
+        self.executions += other.executions
+        for k, v in list(other.errors.items()):
+            self.errors[k] = self.errors.get(k, 0) + v
+        self.rows += other.rows
+        self.latency.merge(other.latency)
+        for k, h in list(other.phases.items()):
+            if k in self.phases:
+                self.phases[k].merge(h)
+            else:
+                self.phases[k] = h.copy()
+        return self
+
+    def subtract(self, other: "Stats") -> "Stats":
+        s = Stats()
+        s.executions = self.executions - other.executions
+        s.errors = {
+            k: v - other.errors.get(k, 0)
+            for k, v in self.errors.items()
+            if v - other.errors.get(k, 0) > 0
+        }
+        s.rows = self.rows - other.rows
+        s.latency = self.latency.subtract(other.latency)
+        empty = Histogram()
+        s.phases = {
+            k: h.subtract(other.phases.get(k, empty))
+            for k, h in self.phases.items()
+        }
+        return s
+
+    def to_dict(self) -> Dict:
+        return dict(
+            executions=self.executions,
+            errors=dict(self.errors),
+            rows=self.rows,
+            latency=self.latency.to_dict(),
+            phases={k: h.to_dict() for k, h in self.phases.items()},
+        )
+
+    @staticmethod
+    def from_dict(data: Dict) -> "Stats":
+        s = Stats()
+        s.executions = data.get("executions", 0)
+        s.errors = dict(data.get("errors", {}))
+        s.rows = data.get("rows", 0)
+        s.latency = Histogram.from_dict(data.get("latency", {}))
+        s.phases = {
+            k: Histogram.from_dict(h) for k, h in data.get("phases", {}).items()
+        }
+        return s
+
+
+def _merge_into(target: Dict[str, Stats], source: Dict[str, Stats]) -> None:
+    # ``list(dict.items())`` copies the dict in one step under the GIL,
+    # so it is safe while the owning thread keeps adding new keys.
+    for name, stats in list(source.items()):
+        if name in target:
+            target[name].merge(stats)
+        else:
+            target[name] = stats.copy()
+
+
+class Recorder:
+    """Metrics of a single thread. Only the owning thread writes here."""
+
+    __slots__ = ("queries", "scenarios")
+
+    def __init__(self) -> None:
+        self.queries: Dict[str, Stats] = {}
+        self.scenarios: Dict[str, Stats] = {}
+
+
+class Snapshot:
+    """Point-in-time copy of merged metrics.
+
+    Attributes:
+        taken_at (float): Unix time when the snapshot was taken.
+        queries (Dict[str, Stats]): Stats per query name.
+        scenarios (Dict[str, Stats]): Stats per scenario name.
+        gauges (Dict[str, float]): Current values of registered gauges,
+            e.g. connection pool occupancy.
+    """
+
+    def __init__(self, taken_at: Optional[float] = None) -> None:
+        self.taken_at = time.time() if taken_at is None else taken_at
+        self.queries: Dict[str, Stats] = {}
+        self.scenarios: Dict[str, Stats] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def merge(self, other: "Snapshot") -> "Snapshot":
+        """Merge another snapshot, e.g. from a different process.
+
+        Counters and histograms are added up, gauges are summed.
+        """
+
+        _merge_into(self.queries, other.queries)
+        _merge_into(self.scenarios, other.scenarios)
+        for k, v in other.gauges.items():
+            self.gauges[k] = self.gauges.get(k, 0) + v
+        self.taken_at = max(self.taken_at, other.taken_at)
+        return self
+
+    def subtract(self, previous: "Snapshot") -> "Snapshot":
+        """Get metrics recorded between ``previous`` and this snapshot."""
+
+        delta = Snapshot(self.taken_at)
+        empty = Stats()
+        for attr in ("queries", "scenarios"):
+            mine, theirs = getattr(self, attr), getattr(previous, attr)
+            setattr(
+                delta,
+                attr,
+                {
+                    k: v.subtract(theirs.get(k, empty))
+                    for k, v in mine.items()
+                },
+            )
+        delta.gauges = dict(self.gauges)
+        return delta
+
+    def to_dict(self) -> Dict:
+        return dict(
+            taken_at=self.taken_at,
+            queries={k: v.to_dict() for k, v in self.queries.items()},
+            scenarios={k: v.to_dict() for k, v in self.scenarios.items()},
+            gauges=dict(self.gauges),
+        )
+
+    @staticmethod
+    def from_dict(data: Dict) -> "Snapshot":
+        s = Snapshot(data.get("taken_at"))
+        s.queries = {
+            k: Stats.from_dict(v) for k, v in data.get("queries", {}).items()
+        }
+        s.scenarios = {
+            k: Stats.from_dict(v) for k, v in data.get("scenarios", {}).items()
+        }
+        s.gauges = dict(data.get("gauges", {}))
+        return s
+
+
+class Metrics:
+    """Registry of per-thread recorders.
+
+    Examples:
+        Record a query execution and read it back::
+
+            metrics = get_metrics()
+            metrics.record_query("select_all", duration_ns=1500000, rows=10)
+            snapshot = metrics.snapshot()
+            print(snapshot.queries["select_all"].latency.percentile(99))
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._recorders: List[Recorder] = []
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+        # Incremented by reset(), recorders of older generations are dropped
+        self._generation = 0
+
+    def recorder(self) -> Recorder:
+        """Get recorder of the calling thread."""
+
+        generation, recorder = getattr(self._local, "recorder", (-1, None))
+        if generation == self._generation:
+            return recorder
+        recorder = Recorder()
+        with self._lock:
+            self._recorders.append(recorder)
+            self._local.recorder = (self._generation, recorder)
+        return recorder
+
+    def record_query(
+        self,
+        name: str,
+        duration_ns: int,
+        rows: int = -1,
+        error: Optional[BaseException] = None,
+        phases: Optional[Dict[str, int]] = None,
+    ) -> None:
+        queries = self.recorder().queries
+        stats = queries.get(name)
+        if stats is None:
+            stats = queries[name] = Stats()
+        stats.record(duration_ns, rows, error, phases)
+
+    def record_scenario(
+        self,
+        name: str,
+        duration_ns: int,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        scenarios = self.recorder().scenarios
+        stats = scenarios.get(name)
+        if stats is None:
+            stats = scenarios[name] = Stats()
+        stats.record(duration_ns, -1, error)
+
+    def register_gauge(self, name: str, function: Callable[[], float]) -> None:
+        """Register a callable sampled on every snapshot."""
+        self._gauges[name] = function
+
+    def unregister_gauge(self, name: str) -> None:
+        self._gauges.pop(name, None)
+
+    def snapshot(self) -> Snapshot:
+        """Merge all thread recorders into a snapshot."""
+
+        snapshot = Snapshot()
+        with self._lock:
+            recorders = list(self._recorders)
+        for r in recorders:
+            _merge_into(snapshot.queries, r.queries)
+            _merge_into(snapshot.scenarios, r.scenarios)
+        for name, function in list(self._gauges.items()):
+            try:
+                snapshot.gauges[name] = float(function())
+            except Exception:
+                pass
+        return snapshot
+
+    def reset(self) -> None:
+        """Drop everything recorded so far.
+
+        Threads get fresh recorders on their next record call.
+        """
+
+        with self._lock:
+            self._recorders = []
+            self._generation += 1
@@ -0,0 +1,296 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the load in several processes, each with its own JVM.
+
+:class:`ProcessRunner` forks child processes after the context has been
+infused in the parent, so children share parsed queries and imported
+scenario modules copy-on-write. The JVM must not be started in the
+parent: every child starts its own JVM and opens its own connection
+pool on first use.
+
+Children run a regular :class:`~dbload.runner.Runner` with their share
+of virtual users and iterations and send metrics snapshots to the parent
+over a queue. The parent merges the latest snapshot of every child, so
+dashboards, reports and thresholds see the whole run.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+from loguru import logger
+
+from .context_singleton import get_context
+from .load_shape import Scaled
+from .metrics import Snapshot
+from .metrics_singleton import get_metrics
+from .runner import Runner
+from .exceptions import ScenarioNotFoundError
+
+
+def _share(total: Optional[int], index: int, parts: int) -> Optional[int]:
+    """Split ``total`` into ``parts`` nearly equal integers."""
+
+    if total is None:
+        return None
+    return total // parts + (1 if index < total % parts else 0)
+
+
+def _child(
+    index: int,
+    runner_class: Type[Runner],
+    options: Dict,
+    messages: "multiprocessing.Queue",
+    stop: "multiprocessing.synchronize.Event",
+    interval: float,
+) -> None:
+    # Whatever the parent recorded before forking is not ours
+    metrics = get_metrics()
+    metrics.reset()
+
+    runner = runner_class(**options)
+    runner.on_warmup_end(
+        lambda snapshot: messages.put(("warmup", index, snapshot.to_dict(), None))
+    )
+
+    def _watch():
+        while not stop.wait(interval):
+            messages.put(("snapshot", index, metrics.snapshot().to_dict(), None))
+        runner.stop()
+
+    runner.start()
+    threading.Thread(target=_watch, name="dbload-child-watch", daemon=True).start()
+    try:
+        runner.wait()
+    finally:
+        messages.put(("done", index, metrics.snapshot().to_dict(), runner.elapsed))
+        runner.close()
+
+
+class ProcessRunner:
+    """Run scenarios in ``processes`` forked child processes.
+
+    Has the interface of :class:`~dbload.runner.Runner` needed to drive
+    a run, so it can be used in its place.
+
+    Args:
+        scenarios (List[str]): Names of registered scenarios to run.
+        processes (int): Number of child processes.
+        runner_class (Type[Runner]): Runner used in every child, e.g.
+            :class:`~dbload.aio.AsyncRunner`.
+        interval (float): Seconds between snapshots sent by children.
+        users (int): Total number of virtual users, split between
+            processes. Other arguments of the runner are passed as is,
+            except ``iterations`` and ``warmup_iterations``, which are
+            split, and ``shape``, which is scaled down.
+
+    Raises:
+        RuntimeError: when the platform cannot fork processes.
+    """
+
+    def __init__(
+        self,
+        scenarios: List[str],
+        processes: int = 2,
+        runner_class: Type[Runner] = Runner,
+        interval: float = 0.5,
+        users: int = 1,
+        **options,
+    ) -> None:
+        ctx = get_context()
+        for name in scenarios:
+            if name not in ctx.scenarios:
+                raise ScenarioNotFoundError(name)
+
+        self.scenarios = list(scenarios)
+        self.processes = max(processes, 1)
+        self.runner_class = runner_class
+        self.interval = interval
+        self.options = options
+        shape = options.get("shape")
+        self.users = max(users, 1) if shape is None else int(shape.max_users)
+        self.duration = options.get("duration") or (shape.duration if shape else None)
+
+        self._mp = multiprocessing.get_context("fork")
+        self._messages = self._mp.Queue()
+        self._stop = self._mp.Event()
+        self._children: List[multiprocessing.Process] = []
+        self._latest: Dict[int, Snapshot] = {}
+        self._warmups: Dict[int, Snapshot] = {}
+        self._elapsed: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+        self._on_warmup_end: List[Callable[[Snapshot], None]] = []
+        self._on_snapshot: List[Callable[[str, Snapshot], None]] = []
+
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.measured_from: Optional[float] = None
+        self.warmup_snapshot: Optional[Snapshot] = None
+        self._warming = bool(options.get("warmup") or options.get("warmup_iterations"))
+
+    def _child_options(self, index: int) -> Dict:
+        options = dict(self.options)
+        options["users"] = _share(self.users, index, self.processes)
+        options["iterations"] = _share(options.get("iterations"), index, self.processes)
+        options["warmup_iterations"] = _share(
+            options.get("warmup_iterations"), index, self.processes
+        )
+        if options.get("shape") is not None:
+            options["shape"] = Scaled(options["shape"], 1 / self.processes)
+        options["scenarios"] = self.scenarios
+        return options
+
+    @property
+    def warming_up(self) -> bool:
+        return self._warming
+
+    @property
+    def elapsed(self) -> float:
+        """Duration of the measured part of the run in seconds."""
+
+        if self._elapsed and len(self._elapsed) == len(self._children):
+            return max(self._elapsed.values())
+        start = self.measured_from or self.started_at
+        if start is None:
+            return 0.0
+        return (self.finished_at or time.time()) - start
+
+    def on_warmup_end(self, callback: Callable[[Snapshot], None]) -> None:
+        """Register callback invoked when all processes finished warm-up."""
+        self._on_warmup_end.append(callback)
+
+    def on_snapshot(self, callback: Callable[[str, Snapshot], None]) -> None:
+        """Register callback invoked with every snapshot of a child."""
+        self._on_snapshot.append(callback)
+
+    def snapshot(self) -> Snapshot:
+        """Merge the latest snapshots of all child processes."""
+
+        merged = Snapshot()
+        with self._lock:
+            for snapshot in self._latest.values():
+                merged.merge(snapshot)
+        merged.gauges["processes"] = sum(
+            1 for child in self._children if child.is_alive()
+        )
+        return merged
+
+    def _collect(self) -> None:
+        done = 0
+        while done < len(self._children):
+            try:
+                kind, index, data, elapsed = self._messages.get(timeout=0.5)
+            except queue.Empty:
+                if not any(child.is_alive() for child in self._children):
+                    logger.warning("Child processes exited without reporting.")
+                    break
+                continue
+
+            snapshot = Snapshot.from_dict(data)
+            if kind == "warmup":
+                self._warmup_finished(index, snapshot)
+                continue
+
+            with self._lock:
+                self._latest[index] = snapshot
+            if kind == "done":
+                self._elapsed[index] = elapsed
+                done += 1
+            for callback in self._on_snapshot:
+                callback(f"process-{index}", snapshot)
+
+    def _warmup_finished(self, index: int, snapshot: Snapshot) -> None:
+        with self._lock:
+            self._warmups[index] = snapshot
+            # Measurements of the child start from scratch
+            self._latest[index] = Snapshot(snapshot.taken_at)
+            if len(self._warmups) < len(self._children):
+                return
+            merged = Snapshot()
+            for s in self._warmups.values():
+                merged.merge(s)
+            self.warmup_snapshot = merged
+            self.measured_from = time.time()
+            self._warming = False
+        for callback in self._on_warmup_end:
+            callback(merged)
+
+    def start(self) -> None:
+        """Fork child processes and start collecting their metrics."""
+
+        import jpype
+
+        if jpype.isJVMStarted():
+            logger.warning(
+                "JVM is already running in the parent process. Child "
+                "processes inherit it in an unusable state."
+            )
+
+        # Every process needs at least one virtual user
+        self.processes = min(self.processes, self.users)
+        self.started_at = time.time()
+        for index in range(self.processes):
+            child = self._mp.Process(
+                target=_child,
+                args=(
+                    index,
+                    self.runner_class,
+                    self._child_options(index),
+                    self._messages,
+                    self._stop,
+                    self.interval,
+                ),
+                name=f"dbload-process-{index}",
+                daemon=True,
+            )
+            child.start()
+            self._children.append(child)
+        self._collector = threading.Thread(
+            target=self._collect, name="dbload-collector", daemon=True
+        )
+        self._collector.start()
+        logger.debug(f"Started {self.processes} processes.")
+
+    def stop(self) -> None:
+        """Ask all processes to finish after their current scenarios."""
+        self._stop.set()
+
+    def is_running(self) -> bool:
+        return self._collector is not None and self._collector.is_alive()
+
+    def wait(self) -> None:
+        """Block until all processes finished and reported."""
+
+        try:
+            while self.is_running():
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            self.stop()
+            self._collector.join()
+        finally:
+            for child in self._children:
+                child.join(timeout=5)
+            self.finished_at = time.time()
+
+    def close(self) -> None:
+        """Connections are closed by the child processes themselves."""
+        pass
+
+    def run(self) -> None:
+        self.start()
+        self.wait()
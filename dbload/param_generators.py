@@ -0,0 +1,185 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ast
+import functools
+import itertools
+import random
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .exceptions import ParameterGeneratorError
+
+
+# Spec looks like ``int(2,9999)``, ``faker.name`` or ``faker.date(pattern='%Y')``
+spec_regex = re.compile(r"^\s*([\w.]+)\s*(?:\((.*)\))?\s*$")
+
+# Shared Faker instance, created on first use because it is slow to build
+_faker = None
+
+
+def _get_faker():
+    global _faker
+
+    if _faker is None:
+        from faker import Faker
+
+        _faker = Faker()
+
+    return _faker
+
+
+def _literal(node: ast.AST, text: str) -> Any:
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return ast.get_source_segment(text, node)
+
+
+def _parse_arguments(text: Optional[str]) -> Tuple[List[Any], Dict[str, Any]]:
+    """Parse generator arguments into positional and keyword values.
+
+    Arguments follow python call syntax, e.g. ``1, 'a,b', pattern='%Y'``.
+    Values that are not valid python literals are kept as plain strings,
+    so that ``choice(red,green)`` works without quoting.
+    """
+
+    if not text or not text.strip():
+        return [], {}
+
+    source = f"f({text})"
+    try:
+        call = ast.parse(source, mode="eval").body
+    except SyntaxError:
+        # Not a python argument list, take the values as they are
+        return [raw.strip() for raw in text.split(",")], {}
+
+    arguments = [_literal(node, source) for node in call.args]
+    keywords = {k.arg: _literal(k.value, source) for k in call.keywords if k.arg}
+    return arguments, keywords
+
+
+def _int_generator(low: int = 0, high: int = 2 ** 31 - 1) -> Callable:
+    rnd = random.random
+    span = high - low + 1
+
+    def _int():
+        return low + int(rnd() * span)
+
+    return _int
+
+
+def _float_generator(low: float = 0.0, high: float = 1.0) -> Callable:
+    rnd = random.random
+    span = high - low
+
+    def _float():
+        return low + rnd() * span
+
+    return _float
+
+
+def _choice_generator(*elements: Any) -> Callable:
+    if not elements:
+        raise ParameterGeneratorError("choice()", "needs at least one element")
+    return functools.partial(random.choice, elements)
+
+
+def _seq_generator(start: int = 1, step: int = 1) -> Callable:
+    return itertools.count(start, step).__next__
+
+
+def _const_generator(value: Any = None) -> Callable:
+    def _const():
+        return value
+
+    return _const
+
+
+builtin_generators = {
+    "int": _int_generator,
+    "float": _float_generator,
+    "choice": _choice_generator,
+    "seq": _seq_generator,
+    "const": _const_generator,
+}
+
+
+def compile_generator(spec: str) -> Callable[[], Any]:
+    """Compile a single parameter spec into a zero-argument callable.
+
+    Supported specs:
+
+    * ``faker.<provider>`` or ``faker.<provider>(args)`` - any Faker
+      provider method, e.g. ``faker.name`` or ``faker.random_int(1,10)``.
+    * ``int(low,high)`` - random integer, bounds inclusive.
+    * ``float(low,high)`` - random float.
+    * ``choice(a,b,c)`` - random element of the listed values.
+    * ``seq(start,step)`` - monotonically increasing integer sequence.
+    * ``const(value)`` - always the same value.
+
+    Raises:
+        ParameterGeneratorError: when the spec cannot be compiled.
+    """
+
+    m = spec_regex.match(spec)
+    if not m:
+        raise ParameterGeneratorError(spec, "malformed generator spec")
+
+    kind, raw_arguments = m.group(1), m.group(2)
+    arguments, keywords = _parse_arguments(raw_arguments)
+
+    if kind.startswith("faker."):
+        provider = kind[len("faker.") :]
+        method = getattr(_get_faker(), provider, None)
+        if not callable(method):
+            raise ParameterGeneratorError(
+                spec, f"unknown faker provider '{provider}'"
+            )
+        if arguments or keywords:
+            return functools.partial(method, *arguments, **keywords)
+        return method
+
+    if kind not in builtin_generators:
+        raise ParameterGeneratorError(spec, f"unknown generator '{kind}'")
+
+    try:
+        return builtin_generators[kind](*arguments, **keywords)
+    except TypeError as e:
+        raise ParameterGeneratorError(spec, f"{e}") from None
+
+
+def compile_generators(
+    params: List[Tuple[str, str]]
+) -> Optional[Callable[[], List[Any]]]:
+    """Compile annotated query parameters into one fast closure.
+
+    Args:
+        params (List[Tuple[str, str]]): List of ``(name, spec)`` pairs
+            in the order of the positional ``?`` markers of the query.
+
+    Returns:
+        Callable that produces a fresh list of parameter values on every
+        call, or ``None`` if there is nothing to generate.
+    """
+
+    if not params:
+        return None
+
+    generators = tuple(compile_generator(spec) for _, spec in params)
+
+    def _generate() -> List[Any]:
+        return [g() for g in generators]
+
+    return _generate
@@ -0,0 +1,272 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generate query and scenario parameters ahead of their use.
+
+Parameter generation, like Faker calls or formatting of large strings,
+normally alternates with query execution on the thread of a virtual
+user. A :class:`Pipeline` moves it to producer threads or processes,
+which fill a bounded queue while virtual users wait for the database.
+Producers block when the queue is full, so they never run far ahead of
+the consumers.
+
+:func:`attach_pipelines` puts a pipeline in front of every parameter
+generator of auto queries (``param:`` annotations) and of every scenario
+declared with ``@scenario(params=...)``.
+
+Every pipeline reports three gauges: ``pipeline.<name>.depth`` with the
+number of prepared values, ``pipeline.<name>.starved`` counting gets
+that found the queue empty, and ``pipeline.<name>.blocked`` counting
+puts that found it full.
+"""
+
+import multiprocessing
+import os
+import queue
+import random
+import threading
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+from .metrics import Metrics
+from .exceptions import PipelineProducerError
+
+
+PIPELINE_MODES = ("threads", "processes")
+
+
+class _Failure:
+    """Error raised by a producer, passed on to the consumer."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.message = f"{type(error).__name__}: {error}"
+
+
+def _reseed() -> None:
+    # Forked producers would otherwise generate the same values
+    random.seed()
+    try:
+        from faker.generator import random as faker_random
+
+        faker_random.seed()
+    except ImportError:
+        pass
+
+
+class Pipeline:
+    """Bounded queue of values produced in the background.
+
+    Producers start on the first :meth:`get` in every process, so a
+    pipeline created before forking works in the forked children too.
+
+    Args:
+        name (str): Name used in gauges and errors.
+        produce (Callable): Function returning the next value.
+        producers (int): Number of producer threads or processes.
+        depth (int): Maximum number of prepared values.
+        mode (str): ``threads`` or ``processes``. Processes avoid
+            contention on the GIL for generators written in python.
+        metrics (Metrics): Metrics to register gauges with.
+
+    Examples:
+        Prepare parameters of a query in two processes::
+
+            pipeline = Pipeline("add_client", make_client, producers=2, mode="processes")
+            add_client(cursor, *pipeline.get())
+    """
+
+    def __init__(
+        self,
+        name: str,
+        produce: Callable[[], Any],
+        producers: int = 1,
+        depth: int = 1000,
+        mode: str = "threads",
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}'.")
+        self.name = name
+        self.produce = produce
+        self.producers = max(1, producers)
+        self.depth = max(1, depth)
+        self.mode = mode
+        self.metrics = metrics
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._workers: List[Any] = []
+        self._queue: Any = None
+        self._stop: Any = None
+        self._starved = 0
+        self._blocked: Any = None
+        if metrics is not None:
+            metrics.register_gauge(f"pipeline.{name}.depth", lambda: self.size)
+            metrics.register_gauge(f"pipeline.{name}.starved", lambda: self._starved)
+            metrics.register_gauge(f"pipeline.{name}.blocked", lambda: self.blocked)
+
+    @property
+    def size(self) -> int:
+        """Number of values waiting in the queue."""
+
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+        try:
+            return self._queue.qsize()
+        except NotImplementedError:  # pragma: no cover, macOS
+            return 0
+
+    @property
+    def blocked(self) -> int:
+        if self._blocked is None or self._pid != os.getpid():
+            return 0
+        return self._blocked.value
+
+    def _produce(self, stop, values, blocked) -> None:
+        if self.mode == "processes":
+            _reseed()
+        while not stop.is_set():
+            try:
+                value = self.produce()
+            except Exception as e:
+                value = _Failure(e)
+            try:
+                values.put_nowait(value)
+                continue
+            except queue.Full:
+                with blocked.get_lock():
+                    blocked.value += 1
+            while not stop.is_set():
+                try:
+                    values.put(value, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def start(self) -> None:
+        """Start producers in the current process."""
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.mode == "processes":
+                mp = multiprocessing.get_context("fork")
+                self._queue = mp.Queue(maxsize=self.depth)
+                self._stop = mp.Event()
+                self._blocked = mp.Value("q", 0)
+                start_worker = mp.Process
+            else:
+                self._queue = queue.Queue(maxsize=self.depth)
+                self._stop = threading.Event()
+                self._blocked = multiprocessing.Value("q", 0)
+                start_worker = threading.Thread
+            self._starved = 0
+            self._workers = [
+                start_worker(
+                    target=self._produce,
+                    args=(self._stop, self._queue, self._blocked),
+                    name=f"dbload-pipeline-{self.name}-{i}",
+                    daemon=True,
+                )
+                for i in range(self.producers)
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._pid = os.getpid()
+            logger.debug(
+                f"Started {self.producers} {self.mode} producing '{self.name}'."
+            )
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Take the next value, waiting for producers if there is none.
+
+        Raises:
+            PipelineProducerError: when the producer of the value failed.
+        """
+
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            value = self._queue.get_nowait()
+        except queue.Empty:
+            self._starved += 1
+            value = self._queue.get(timeout=timeout)
+        if isinstance(value, _Failure):
+            raise PipelineProducerError(self.name, value.message)
+        return value
+
+    __call__ = get
+
+    def stop(self) -> None:
+        """Stop producers started by the current process."""
+
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        for worker in self._workers:
+            if self.mode == "processes":
+                worker.terminate()
+            worker.join()
+        self._workers = []
+        self._pid = None
+
+
+def attach_pipelines(
+    ctx,
+    producers: int = 1,
+    depth: int = 1000,
+    mode: str = "threads",
+    metrics: Optional[Metrics] = None,
+) -> List[Pipeline]:
+    """Put pipelines in front of parameter sources of the context.
+
+    Covers auto queries with ``param:`` generators and scenarios with
+    ``params``. Queries with feeds are left alone, reading a feed is
+    cheap already.
+
+    Returns:
+        Attached pipelines, to be stopped with :func:`detach_pipelines`.
+    """
+
+    pipelines = []
+    for kind, items, source in (
+        ("query", ctx.queries, "generate"),
+        ("scenario", ctx.scenarios, "params"),
+    ):
+        for name, item in items.items():
+            produce = item.get(source, None)
+            if produce is None or item.get("pipeline", None) is not None:
+                continue
+            if kind == "query" and item.get("feed", None) is not None:
+                continue
+            item.pipeline = Pipeline(
+                name, produce, producers, depth, mode, metrics
+            )
+            pipelines.append(item.pipeline)
+    return pipelines
+
+
+def detach_pipelines(ctx) -> None:
+    """Stop and remove pipelines attached by :func:`attach_pipelines`."""
+
+    for items in (ctx.queries, ctx.scenarios):
+        for name, item in items.items():
+            pipeline = item.get("pipeline", None)
+            if pipeline is None:
+                continue
+            pipeline.stop()
+            if pipeline.metrics is not None:
+                for gauge in ("depth", "starved", "blocked"):
+                    pipeline.metrics.unregister_gauge(f"pipeline.{name}.{gauge}")
+            item.pipeline = None
@@ -0,0 +1,87 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prepare dramatiq worker processes before they are forked.
+
+``dbload worker`` calls :func:`preload` in the parent process and hands
+``dbload.preload:preload`` to dramatiq as the broker. Forked worker
+processes find the broker, the infused context and the registered
+actors already in place and share them with the parent copy-on-write,
+instead of reading config and SQL files again. Processes started by
+spawning run :func:`preload` themselves.
+
+Database connections, and with them the JVM, are only opened by the
+worker processes, the JVM does not survive a fork.
+"""
+
+from typing import Any, Optional
+
+from loguru import logger
+
+
+_broker: Any = None
+
+
+def preload(ctx=None, url: Optional[str] = None):
+    """Infuse the context and register all its actors, once per process.
+
+    Args:
+        ctx (Context): Context to infuse, the global one by default.
+        url (str): Broker URL, the ``broker_url`` config by default.
+
+    Returns:
+        Broker with the registered actors, also set as the global
+        dramatiq broker.
+
+    Raises:
+        UnsupportedBrokerError: when the broker URL is not supported.
+        ActorOptionError: when options of an actor are invalid.
+    """
+
+    global _broker
+    if _broker is not None:
+        return _broker
+
+    from dramatiq import set_broker
+
+    from .broker import get_broker, register_actors
+    from .config_singleton import get_config
+    from .context_singleton import get_context
+
+    config = get_config()
+    broker = get_broker(url or config.broker_url)
+    if config.metrics_port:
+        from .exporter import metrics_middleware
+
+        push_url = f"http://127.0.0.1:{config.metrics_port}/push"
+        broker.add_middleware(metrics_middleware(push_url, config.metrics_push_interval))
+    set_broker(broker)
+
+    # Read SQL files and infuse context based on them
+    if ctx is None:
+        ctx = get_context()
+    ctx.infuse()
+
+    # Decorate all queries and scenarios as actors
+    register_actors(broker, ctx)
+    logger.debug(f"Preloaded {len(broker.get_declared_actors())} actors.")
+
+    _broker = broker
+    return broker
+
+
+def is_preloaded() -> bool:
+    """Whether :func:`preload` already ran in this process or its parent."""
+
+    return _broker is not None
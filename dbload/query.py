@@ -14,15 +14,19 @@
 
 import functools
 import random
-from typing import Optional, Union, Any
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
 from types import FunctionType
 
 from loguru import logger
 from jpype.dbapi2 import Cursor, Connection
 
-from .query_result import QueryResult
+from .query_result import QueryResult, set_phase_timings, take_acquire
 from .context_singleton import get_context
 from .connection import get_connection
+from .fanout import Deferred
+from .metrics_singleton import get_metrics
+from .trace import get_tracer
 from .exceptions import (
     NotQueryResultTypeError,
     QueryExecutionError,
@@ -52,6 +56,9 @@ def query(
             the results (decorator's argument).
         ignore (bool): Ignore any errors during query execution (invocation
             argument).
+        feed (Feed): Source of parameters for auto queries invoked without
+            explicit parameters, see :mod:`~dbload.feed` (invocation
+            argument).
 
     Examples:
         Method that has a matching query called "create_table" in the SQL
@@ -89,6 +96,11 @@ def query(
 
             >>> create_table(cursor, ignore=True)
 
+        Defer the call to execute it concurrently with other queries on
+        a connection of its own, see :func:`~dbload.fanout.gather`::
+
+            >>> gather(create_table.defer(), create_index.defer())
+
     Raises:
         NotFunctionTypeError: when decorated object is not a function.
         CursorArgumentMissingError: when cursor argument is not supplied
@@ -117,6 +129,7 @@ def query(
         def wrapper_query(
             *args,
             ignore: bool = False,
+            feed: Optional[Callable[[], List[Any]]] = None,
             **kwargs,
         ):
             # nonlocal, because otherwise interpreter does not know that
@@ -129,6 +142,10 @@ def query(
             # Cursor is expected be supplied as the first argument to the
             # invoked function.
             cursor: Optional[Cursor] = None
+            phases: Dict[str, int] = {}
+            acquired = take_acquire()
+            if acquired is not None:
+                phases["acquire"] = acquired
             if not args:
                 logger.debug(
                     (
@@ -142,8 +159,10 @@ def query(
                 ctx.infuse()
 
                 # Initiate a new connection ang get a curosr from it.
+                acquire_started = time.perf_counter_ns()
                 connection = get_connection()
                 cursor = connection.cursor()
+                phases["acquire"] = time.perf_counter_ns() - acquire_started
 
             else:
                 cursor = args[0]
@@ -155,6 +174,14 @@ def query(
             if cursor._closed:
                 raise CursorClosedError(f"in query {__name}")
 
+            # Tracing is opt-in and costs one more clock read and one
+            # struct write per statement when enabled.
+            tracer = get_tracer()
+            if tracer is not None:
+                start_ns = time.time_ns()
+            error: Optional[Exception] = None
+            started = time.perf_counter_ns()
+
             result: Union[QueryResult, Any] = None
             try:
                 # Auto queries ignore whatever logic was present in
@@ -167,16 +194,45 @@ def query(
                     ctx = get_context()
                     sql = ctx.queries[__name].sql
 
+                    # When no explicit parameters were supplied, take
+                    # them from the passed feed, then from the feed
+                    # registered for this query, and finally from the
+                    # generators of "param:" annotations, prepared ahead
+                    # by a pipeline if there is one.
+                    if not parameters:
+                        source = feed
+                        if source is None:
+                            source = ctx.queries[__name].get("feed", None)
+                        if source is None:
+                            source = ctx.queries[__name].get("pipeline", None)
+                        if source is None:
+                            source = ctx.queries[__name].get("generate", None)
+                        if source is not None:
+                            parameters = source()
+
+                    # Preparation is part of jpype's execute() and cannot
+                    # be timed apart without relying on its internals
+                    execute_started = time.perf_counter_ns()
                     cursor.execute(sql, parameters)
-                    result = QueryResult.from_cursor(cursor)
+                    phases["execute"] = time.perf_counter_ns() - execute_started
+                    result = QueryResult.from_cursor(cursor, phases)
 
                     connection = cursor._connection
+                    commit_started = time.perf_counter_ns()
                     connection.commit()
+                    phases["commit"] = time.perf_counter_ns() - commit_started
 
                 else:
-                    result = func(cursor, *args, **kwargs)
+                    # Let QueryResult.from_cursor() called by the query
+                    # function report fetch and conversion timings.
+                    previous = set_phase_timings(phases)
+                    try:
+                        result = func(cursor, *args, **kwargs)
+                    finally:
+                        set_phase_timings(previous)
 
             except Exception as e:
+                error = e
                 if ignore:
                     logger.warning(
                         f"Error occured in query but was handled: {e}"
@@ -184,9 +240,22 @@ def query(
                 else:
                     raise QueryExecutionError(e) from None
 
+            finally:
+                duration_ns = time.perf_counter_ns() - started
+                rows = -1
+                if isinstance(result, QueryResult):
+                    rows = len(result.rows or ()) or result.rowcount
+                get_metrics().record_query(
+                    __name, duration_ns, rows, error, phases
+                )
+                if tracer is not None:
+                    tracer.record(__name, start_ns, duration_ns, rows, error)
+
             return result
 
         setattr(wrapper_query, "_is_decorated_by_query", True)
+        setattr(wrapper_query, "_query_name", __name)
+        wrapper_query.defer = functools.partial(Deferred, wrapper_query)
 
         ctx = get_context()
         ctx.register_query(
@@ -269,11 +338,15 @@ def return_random(
 
             return result
 
-        setattr(wrapper_return_random, "_is_decorated_by_return_random", True)
-
         ctx = get_context()
         __name = name or f"{func.__name__}_return_random"
         __match = match or ctx.queries[func.__name__].match
+
+        setattr(wrapper_return_random, "_is_decorated_by_return_random", True)
+        setattr(wrapper_return_random, "_query_name", __name)
+        wrapper_return_random.defer = functools.partial(
+            Deferred, wrapper_return_random
+        )
         ctx.register_query(
             wrapper_return_random, name=__name, match=__match, auto=auto
         )
@@ -50,6 +50,9 @@ class QueryParser:
         the validity of SQL syntax.
         Parser understands annotation comments in SQL file that start
         with ``"--"`` comment identifier and contain ``name:`` tag in them.
+        Comment lines with ``param:`` tag declare parameter generators
+        for the positional ``?`` markers of the current query, for example
+        ``-- param: NAME=faker.name, AMOUNT=int(2,9999)``.
 
         Returns:
             Mapz: Dictionary of parsed queries.
@@ -67,13 +70,23 @@ class QueryParser:
     @staticmethod
     def _parse_queries(source: str, parsed: Mapz) -> None:
         name_regex = re.compile(r".*name:\s*([\w]+)")
-        option_regex = re.compile(r"option:\s*([\w]+)")
+        option_regex = re.compile(r"option:\s*([\w]+)\b(?!\s*=)")
+        # Options with a value, like "option: queue=analytics", are
+        # options of the dramatiq actor of the query.
+        actor_option_regex = re.compile(r"option:\s*(\w+)\s*=\s*([^,\s]+)")
         # re.findall(
         #     r"scenario:\s*([\w-]+)(?:\[([-\d]+)\])?",
         #     "--name:disi, scenario: sample[1], scenario: teardown[-90], scenario: name",
         # )
         # >>> [('sample', '1'), ('teardown', '-90'), ('name', '')]
         scenario_regex = re.compile(r"scenario:\s*([\w-]+)(?:\[([-\d]+)\])?")
+        # Everything after "param:" up to the next "tag:" or end of line.
+        # Commas inside generator arguments, like in "int(2,9999)", are
+        # not treated as separators.
+        param_regex = re.compile(r"param:\s*(.*?)(?=,\s*\w+:|$)")
+        param_item_regex = re.compile(
+            r"(\w+)\s*=\s*([\w.]+(?:\([^)]*\))?)"
+        )
 
         # After reading whole file, process the lines
         # one by one, assembling queries one by one
@@ -88,6 +101,14 @@ class QueryParser:
             line = line.strip("\n").replace("\t", " ").replace("\r", "")
 
             if "--" in line:
+                # Parameter generators can be declared either on the
+                # "name:" line or on separate comment lines below it.
+                params = [
+                    item
+                    for segment in param_regex.findall(line)
+                    for item in param_item_regex.findall(segment)
+                ]
+
                 # Detect start of the new query
                 nm = name_regex.match(line)
                 if nm:
@@ -101,10 +122,15 @@ class QueryParser:
 
                     # Detect if there are any options specified in the query
                     options = option_regex.findall(line)
+                    actor_options = dict(actor_option_regex.findall(line))
 
                     # Detect if the querly explicitly wants to be called
                     # within a certain scenario
                     scenarios = scenario_regex.findall(line)
+                    # Queries with an explicit order, like "setup[10]",
+                    # run concurrently with other queries of the same
+                    # order in that scenario.
+                    staged = [n for n, order in scenarios if order]
                     scenarios = [
                         (n, int(order) if order else 0)
                         for n, order in scenarios
@@ -117,10 +143,16 @@ class QueryParser:
                     collected[current_query_name] = Mapz(
                         # kind=current_query_kind,
                         options=options,
+                        actor_options=actor_options,
                         scenarios=scenarios,
+                        staged=staged,
+                        params=params,
                         text="",
                     )
 
+                elif params and current_query_name:
+                    collected[current_query_name].params.extend(params)
+
             else:
                 current_query_content += line
 
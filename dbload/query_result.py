@@ -12,13 +12,54 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
 from dbload.exceptions import CursorClosedError
-from typing import Any, List, Tuple
 
 from jpype.dbapi2 import Cursor
 from prettytable import PrettyTable
 
 
+def _nop(value: Any) -> Any:
+    return value
+
+
+# Timings of the query being executed by the current thread, filled in
+# by from_cursor() when called from inside a query function.
+_phase_timings = threading.local()
+
+
+def set_phase_timings(
+    timings: Optional[Dict[str, int]]
+) -> Optional[Dict[str, int]]:
+    """Set dict collecting phase timings of the current thread's query.
+
+    Returns the previous dict, to be restored after nested queries.
+    """
+    previous = getattr(_phase_timings, "current", None)
+    _phase_timings.current = timings
+    return previous
+
+
+def note_acquire(duration_ns: int) -> None:
+    """Count time spent borrowing a connection for the next query.
+
+    Called by code that borrows a connection for a single query, like
+    :func:`~dbload.fanout.gather`. The next query executed by the
+    current thread records it as its ``acquire`` phase.
+    """
+    _phase_timings.acquire = duration_ns
+
+
+def take_acquire() -> Optional[int]:
+    """Get and clear the time noted by :func:`note_acquire`."""
+    duration_ns = getattr(_phase_timings, "acquire", None)
+    _phase_timings.acquire = None
+    return duration_ns
+
+
 class QueryResult:
     def __init__(
         self,
@@ -31,7 +72,7 @@ class QueryResult:
         self._columns: List[Tuple] = columns
 
     @staticmethod
-    def from_cursor(cursor: Cursor):
+    def from_cursor(cursor: Cursor, timings: Optional[Dict[str, int]] = None):
         """Store results of the query execution from cursor.
 
         (Execute must already be called but nothing should be fetched.)
@@ -45,11 +86,17 @@ class QueryResult:
         Args:
             cursor: Cursor object for which ``execute()`` has already been
                 called.
+            timings (dict): If given, nanoseconds spent fetching the rows
+                (``fetch``) and converting Java values into python objects
+                (``convert``) are stored in it.
         """
 
         if cursor._closed:
             raise CursorClosedError("in QueryResult")
 
+        if timings is None:
+            timings = getattr(_phase_timings, "current", None)
+
         qr = QueryResult()
         qr._rowcount = cursor.rowcount
 
@@ -58,10 +105,41 @@ class QueryResult:
         # types of queries.
         if cursor.rowcount == -1 or cursor._resultSet is not None:
             qr._columns = cursor.description
-            qr._rows = cursor.fetchall()
+            if timings is None:
+                qr._rows = cursor.fetchall()
+            else:
+                qr._rows = QueryResult._timed_fetchall(cursor, timings)
 
         return qr
 
+    @staticmethod
+    def _timed_fetchall(cursor: Cursor, timings: Dict[str, int]) -> List:
+        """Fetch raw Java values first and convert them separately.
+
+        Produces the same rows as ``fetchall()`` with default converters,
+        but lets fetching and conversion be timed apart.
+        """
+
+        started = time.perf_counter_ns()
+        rows = cursor.fetchall(converters=None)
+        fetched = time.perf_counter_ns()
+
+        connection = getattr(cursor, "_connection", None)
+        converters = getattr(connection, "_converters", None)
+        if rows and converters:
+            get = converters.get
+            rows = [
+                [
+                    v if v is None else get(type(v), _nop)(v)
+                    for v in row
+                ]
+                for row in rows
+            ]
+
+        timings["fetch"] = fetched - started
+        timings["convert"] = time.perf_counter_ns() - fetched
+        return rows
+
     @property
     def rowcount(self) -> int:
         return self._rowcount
@@ -0,0 +1,438 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Enqueue actors at a target rate.
+
+Entries of the ``schedule`` config section are either crontabs, handled
+by APScheduler, or rates handled by :class:`RateScheduler`::
+
+    {
+        "schedule": {
+            "create_sale": "300/s",
+            "update_client": {"rate": "20/m", "jitter": "none", "burst": 5},
+            "teardown": "0 3 * * *"
+        }
+    }
+
+Rates are messages per second, minute or hour. Messages arrive as a
+Poisson process by default, like requests of independent users, or
+evenly spaced with ``"jitter": "none"``. Arrivals are counted into a
+token bucket holding at most ``burst`` tokens (one second worth of
+messages by default). When the scheduler falls behind, for example
+while the broker is slow, it catches up with at most one full bucket
+and the rest of the missed messages is skipped instead of being sent as
+one huge burst. Messages due in the same tick are published together.
+
+When workers cannot keep up, publishing at the target rate only grows
+the queue, and the backlog hits the database at full speed once it
+recovers. Rate entries can therefore watch the queue of their actor::
+
+    "create_sale": {"rate": "300/s", "max_depth": 5000, "max_lag": "30s", "policy": "throttle"}
+
+The queue is overloaded while it holds ``max_depth`` messages or more,
+or while its consumer lag, the estimated seconds needed to drain it at
+the observed consumption rate, exceeds ``max_lag``. While it is
+overloaded, the ``policy`` decides what happens to due messages:
+
+* ``throttle`` – messages are deferred in the token bucket and sent once
+  the queue recovers, at most ``burst`` of them, the rest is dropped;
+* ``shed`` – messages are dropped;
+* ``coalesce`` – messages due in one tick are replaced by a single one.
+
+Queue depth is read from the broker every ``check_interval`` seconds,
+see :func:`broker_queue_depth`.
+"""
+
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from loguru import logger
+from mapz import Mapz
+
+from .load_shape import parse_duration
+from .exceptions import ScheduleRateError
+
+
+rate_regex = re.compile(r"^\s*(\d+(?:\.\d*)?)\s*/\s*(s|m|h)\s*$")
+
+RATE_UNITS = {"s": 1.0, "m": 60.0, "h": 3600.0}
+
+JITTERS = ("poisson", "none")
+
+POLICIES = ("throttle", "shed", "coalesce")
+
+OPTIONS = {"jitter", "burst", "policy", "max_depth", "max_lag"}
+
+
+def is_rate(spec: Any) -> bool:
+    """Whether schedule entry is a rate rather than a crontab."""
+
+    if isinstance(spec, dict):
+        return "rate" in spec
+    return bool(rate_regex.match(str(spec)))
+
+
+def parse_rate(spec: str) -> float:
+    """Parse rate like ``300/s`` or ``20/m`` in messages per second."""
+
+    m = rate_regex.match(str(spec))
+    if not m:
+        raise ScheduleRateError(spec, "expected '<number>/s', '/m' or '/h'")
+    return float(m.group(1)) / RATE_UNITS[m.group(2)]
+
+
+@dataclass
+class Rate:
+    """Target rate of one actor.
+
+    Attributes:
+        per_second (float): Messages per second.
+        jitter (str): ``poisson`` for exponentially distributed gaps
+            between messages, ``none`` for even spacing.
+        burst (float): Capacity of the token bucket, the largest number
+            of messages published at once when catching up.
+        policy (str): Backpressure policy, ``throttle``, ``shed`` or
+            ``coalesce``. Defaults to ``throttle`` when a limit is set.
+        max_depth (int): Queue depth considered overloaded.
+        max_lag (float): Consumer lag in seconds considered overloaded.
+    """
+
+    per_second: float
+    jitter: str = "poisson"
+    burst: Optional[float] = None
+    policy: Optional[str] = None
+    max_depth: Optional[int] = None
+    max_lag: Optional[float] = None
+
+    def __post_init__(self) -> None:
+        if not self.per_second > 0:
+            raise ScheduleRateError(
+                f"{self.per_second}/s", "rate must be positive"
+            )
+        if self.jitter not in JITTERS:
+            raise ScheduleRateError(
+                str(self.jitter), f"jitter must be one of {JITTERS}"
+            )
+        if self.burst is None:
+            self.burst = max(1.0, self.per_second)
+        if isinstance(self.max_lag, str):
+            try:
+                self.max_lag = parse_duration(self.max_lag)
+            except ValueError as e:
+                raise ScheduleRateError(self.max_lag, f"{e}") from None
+        limited = self.max_depth is not None or self.max_lag is not None
+        if self.policy is None and limited:
+            self.policy = "throttle"
+        if self.policy is not None:
+            if self.policy not in POLICIES:
+                raise ScheduleRateError(
+                    str(self.policy), f"policy must be one of {POLICIES}"
+                )
+            if not limited:
+                raise ScheduleRateError(
+                    str(self.policy), "policy needs 'max_depth' or 'max_lag'"
+                )
+
+    @staticmethod
+    def parse(spec: Any) -> "Rate":
+        """Create rate from ``"300/s"`` or ``{"rate": "300/s", ...}``."""
+
+        if isinstance(spec, dict):
+            options = dict(spec)
+            per_second = parse_rate(options.pop("rate"))
+            unknown = set(options) - OPTIONS
+            if unknown:
+                raise ScheduleRateError(
+                    str(spec), f"unknown options {sorted(unknown)}"
+                )
+            return Rate(per_second, **options)
+        return Rate(parse_rate(spec))
+
+
+@dataclass
+class _Bucket:
+    rate: Rate
+    next_arrival: float
+    tokens: float = 0.0
+    sent: int = 0
+    skipped: int = 0
+    dropped: int = 0
+    deferred: int = 0
+    depth: Optional[int] = None
+    lag: float = 0.0
+    overloaded: bool = False
+    checked_at: Optional[float] = None
+    published: int = 0
+
+    def observe(self, depth: int, now: float) -> None:
+        """Update overload state from queue depth sampled at ``now``."""
+
+        if self.depth is not None and self.checked_at is not None:
+            consumed = self.depth + self.published - depth
+            elapsed = now - self.checked_at
+            if consumed > 0 and elapsed > 0:
+                self.lag = depth / (consumed / elapsed)
+            elif depth > 0:
+                self.lag = math.inf
+            else:
+                self.lag = 0.0
+        self.depth = depth
+        self.checked_at = now
+        self.published = 0
+
+        rate = self.rate
+        overloaded = (rate.max_depth is not None and depth >= rate.max_depth) or (
+            rate.max_lag is not None and self.lag > rate.max_lag
+        )
+        if overloaded != self.overloaded:
+            if overloaded:
+                logger.warning(
+                    f"Queue is overloaded with {depth} messages and {self.lag:.1f}s lag, "
+                    f"applying '{rate.policy}' policy."
+                )
+            else:
+                logger.info(f"Queue recovered with {depth} messages.")
+        self.overloaded = overloaded
+
+    def gap(self, rng: random.Random) -> float:
+        if self.rate.jitter == "poisson":
+            return rng.expovariate(self.rate.per_second)
+        return 1.0 / self.rate.per_second
+
+
+@dataclass
+class ScheduleStats:
+    """Counts of a scheduled actor."""
+
+    sent: int = 0
+    skipped: int = 0
+    dropped: int = 0
+    deferred: int = 0
+    depth: Optional[int] = None
+    lag: float = 0.0
+
+
+class RateScheduler:
+    """Publish messages of several actors at their target rates.
+
+    Args:
+        rates (Dict[str, Rate]): Rate of every actor by name.
+        publish (Callable): Called with actor name and number of
+            messages due in the current tick.
+        tick (float): Seconds between ticks.
+        seed (int): Seed of the arrival jitter.
+        depth (Callable): Called with actor name, returns number of
+            messages waiting in its queue, or ``None`` when unknown.
+            Needed by rates with a backpressure policy.
+        check_interval (float): Seconds between queue depth checks.
+
+    Examples:
+        Send 300 ``create_sale`` messages per second::
+
+            def publish(name, count):
+                for _ in range(count):
+                    broker.get_actor(name).send()
+
+            scheduler = RateScheduler({"create_sale": Rate(300)}, publish)
+            scheduler.start()
+    """
+
+    def __init__(
+        self,
+        rates: Dict[str, Rate],
+        publish: Callable[[str, int], None],
+        tick: float = 0.01,
+        seed: Optional[int] = None,
+        depth: Optional[Callable[[str], Optional[int]]] = None,
+        check_interval: float = 1.0,
+    ) -> None:
+        self.rates = rates
+        self.publish = publish
+        self.tick = tick
+        self.depth = depth
+        self.check_interval = check_interval
+        self._rng = random.Random(seed)
+        self._buckets: Dict[str, _Bucket] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def reset(self, now: float) -> None:
+        """Start all schedules at ``now``."""
+
+        self._buckets = {}
+        for name, rate in self.rates.items():
+            bucket = _Bucket(rate, now)
+            bucket.next_arrival = now + bucket.gap(self._rng)
+            self._buckets[name] = bucket
+
+    def due(self, now: float) -> Dict[str, int]:
+        """Take messages that arrived until ``now`` out of the buckets."""
+
+        if not self._buckets:
+            self.reset(now)
+
+        due = {}
+        for name, bucket in self._buckets.items():
+            throttled = bucket.overloaded and bucket.rate.policy == "throttle"
+            while bucket.next_arrival <= now:
+                if bucket.tokens >= bucket.rate.burst:
+                    # The bucket is full, skip the rest of the backlog
+                    missed = now - bucket.next_arrival
+                    missed = int(missed * bucket.rate.per_second) + 1
+                    if bucket.overloaded:
+                        bucket.dropped += missed
+                    else:
+                        bucket.skipped += missed
+                    bucket.next_arrival = now + bucket.gap(self._rng)
+                    break
+                bucket.tokens += 1
+                if throttled:
+                    bucket.deferred += 1
+                bucket.next_arrival += bucket.gap(self._rng)
+            count = int(bucket.tokens)
+            if not count or throttled:
+                continue
+            bucket.tokens -= count
+            if bucket.overloaded and bucket.rate.policy == "shed":
+                bucket.dropped += count
+                continue
+            if bucket.overloaded and bucket.rate.policy == "coalesce":
+                bucket.dropped += count - 1
+                count = 1
+            due[name] = count
+        return due
+
+    def check(self, now: float) -> None:
+        """Sample queue depths of actors with a backpressure policy."""
+
+        if self.depth is None:
+            return
+        for name, bucket in self._buckets.items():
+            if bucket.rate.policy is None:
+                continue
+            if bucket.checked_at is not None and now - bucket.checked_at < self.check_interval:
+                continue
+            try:
+                depth = self.depth(name)
+            except Exception as e:
+                logger.warning(f"Cannot get queue depth of '{name}': {e}")
+                continue
+            if depth is not None:
+                bucket.observe(depth, now)
+
+    def step(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Publish messages due at ``now`` and return their counts."""
+
+        now = time.monotonic() if now is None else now
+        if not self._buckets:
+            self.reset(now)
+        self.check(now)
+        due = self.due(now)
+        for name, count in due.items():
+            try:
+                self.publish(name, count)
+            except Exception as e:
+                logger.error(f"Cannot publish {count} '{name}' messages: {e}")
+                continue
+            self._buckets[name].sent += count
+            self._buckets[name].published += count
+        return due
+
+    def stats(self) -> Dict[str, ScheduleStats]:
+        return {
+            name: ScheduleStats(
+                bucket.sent,
+                bucket.skipped,
+                bucket.dropped,
+                bucket.deferred,
+                bucket.depth,
+                bucket.lag,
+            )
+            for name, bucket in self._buckets.items()
+        }
+
+    def _loop(self) -> None:
+        self.reset(time.monotonic())
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.step(started)
+            self._stop.wait(max(0.0, self.tick - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._loop, name="dbload-rate-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def split_schedule(schedule: Mapz) -> Tuple[Dict[str, str], Dict[str, Rate]]:
+    """Split ``schedule`` config section into crontabs and rates.
+
+    Raises:
+        ScheduleRateError: when a rate entry is malformed.
+    """
+
+    crontabs: Dict[str, str] = {}
+    rates: Dict[str, Rate] = {}
+    for name, spec in schedule.items():
+        if is_rate(spec):
+            rates[name] = Rate.parse(spec)
+        else:
+            crontabs[name] = spec
+    return crontabs, rates
+
+
+def broker_publisher(broker) -> Callable[[str, int], None]:
+    """Publish function sending messages of ``broker`` actors.
+
+    Messages of one tick are built first and enqueued back to back.
+    """
+
+    from .enqueue import enqueue_messages
+
+    def publish(name: str, count: int) -> None:
+        actor = broker.get_actor(name)
+        enqueue_messages(broker, [actor.message() for _ in range(count)])
+
+    return publish
+
+
+def broker_queue_depth(broker) -> Callable[[str], Optional[int]]:
+    """Depth function reading queues of ``broker`` actors.
+
+    Supports the RabbitMQ broker, which counts ready messages of the
+    queue, and the stub broker used in tests. Other brokers report
+    ``None`` and their rates are not limited.
+    """
+
+    def depth(name: str) -> Optional[int]:
+        queue_name = broker.get_actor(name).queue_name
+        if hasattr(broker, "get_queue_message_counts"):
+            return broker.get_queue_message_counts(queue_name)[0]
+        queues = getattr(broker, "queues", None)
+        if queues is not None and queue_name in queues:
+            return queues[queue_name].qsize()
+        return None
+
+    return depth
@@ -0,0 +1,290 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import hashlib
+import json
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, TextIO, Union
+
+from loguru import logger
+
+from .connection import ConnectionPool
+from .context_singleton import get_context
+from .metrics_singleton import get_metrics
+from .exceptions import QueryExecutionError, ReplayLogFormatError
+
+
+@dataclass
+class ReplayRecord:
+    """Single statement from the captured statement log.
+
+    Attributes:
+        ts (float): Capture timestamp in seconds.
+        session (str): Identifier of the captured database session.
+        statement (str): Name of a registered query or raw SQL text.
+        params (List): Positional parameters of the statement.
+    """
+
+    ts: float
+    session: str
+    statement: str
+    params: List[Any] = field(default_factory=list)
+
+
+@dataclass
+class ReplayStats:
+    """Summary of a finished replay."""
+
+    executed: int = 0
+    errors: int = 0
+    sessions: int = 0
+    # How late, at most, a record was dispatched compared to its
+    # scheduled (sped up) time. Large values mean the target database or
+    # the replayer could not keep up with the captured rate.
+    max_lag: float = 0.0
+    elapsed: float = 0.0
+
+
+def _parse_ts(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _parse_params(value: Any) -> List[Any]:
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        return list(value.values())
+    return list(value)
+
+
+def read_log(stream: TextIO, fmt: str = "jsonl") -> Iterator[ReplayRecord]:
+    """Stream records from the captured statement log.
+
+    Two formats are supported:
+
+    * ``jsonl`` – one JSON object per line with ``ts``, ``session``,
+      either ``query`` (name of a registered query) or ``sql`` (raw SQL
+      text), and optional ``params`` list.
+    * ``csv`` – columns ``ts,session,statement,params`` where ``params``
+      is a JSON encoded list.
+
+    Timestamps are either seconds since epoch or ISO 8601 strings.
+    Records are yielded one by one, so the log is never held in memory.
+
+    Raises:
+        ReplayLogFormatError: when a record cannot be parsed.
+    """
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for n, row in enumerate(reader, start=2):
+            try:
+                yield ReplayRecord(
+                    ts=_parse_ts(row["ts"]),
+                    session=row.get("session") or "",
+                    statement=row["statement"],
+                    params=_parse_params(row.get("params")),
+                )
+            except (KeyError, ValueError, TypeError) as e:
+                raise ReplayLogFormatError(n, f"{e}") from None
+        return
+
+    for n, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            yield ReplayRecord(
+                ts=_parse_ts(item["ts"]),
+                session=str(item.get("session", "")),
+                statement=item.get("query") or item["sql"],
+                params=_parse_params(item.get("params")),
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            raise ReplayLogFormatError(n, f"{e}") from None
+
+
+def open_log(path: Union[str, Path]) -> Iterator[ReplayRecord]:
+    """Stream records from a log file, choosing format by extension."""
+
+    path = Path(path)
+    fmt = "csv" if path.suffix.lower() == ".csv" else "jsonl"
+    with path.open("r", newline="") as f:
+        yield from read_log(f, fmt)
+
+
+class Replayer:
+    """Re-issue captured statements with their original timing.
+
+    Every captured session is pinned to one of ``connections`` worker
+    threads, and each worker holds a single pooled connection for the
+    whole replay. Statements of one session are therefore executed in
+    their captured order, on the same connection.
+
+    Statements are executed through the registered query functions, so
+    the usual error handling of the :meth:`~dbload.query.query` wrapper
+    applies. Raw SQL text from the log is registered as an implicit auto
+    query on first use.
+
+    Args:
+        pool (ConnectionPool): Pool to borrow worker connections from.
+        connections (int): Number of worker threads and connections.
+        speed (float): Replay speed-up factor. ``2.0`` replays twice as
+            fast as captured, ``0`` ignores timing altogether.
+        queue_size (int): Maximum number of dispatched, not yet executed
+            statements per worker. Keeps memory bounded.
+        ignore (bool): Ignore errors of individual statements.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        connections: int = 8,
+        speed: float = 1.0,
+        queue_size: int = 1000,
+        ignore: bool = False,
+    ) -> None:
+        self.pool = pool
+        self.connections = max(connections, 1)
+        self.speed = speed
+        self.queue_size = queue_size
+        self.ignore = ignore
+        self.stats = ReplayStats()
+
+        self._queues: List[queue.Queue] = []
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._failure: Optional[Exception] = None
+
+    def _query_function(self, statement: str):
+        """Find registered query by name or register raw SQL as one."""
+
+        ctx = get_context()
+        if statement in ctx.queries:
+            return ctx.queries[statement].function
+
+        name = f"replay_{hashlib.sha1(statement.encode()).hexdigest()[:12]}"
+        with self._lock:
+            if name not in ctx.queries:
+                from .query import query
+
+                def _replayed_statement(*args, **kwargs):
+                    pass  # pragma: no cover
+
+                query(name=name, auto=True)(_replayed_statement)
+                ctx.queries[name].sql = statement
+        return ctx.queries[name].function
+
+    def _worker(self, inbox: queue.Queue) -> None:
+        try:
+            with self.pool.connection() as connection:
+                while True:
+                    record = inbox.get()
+                    if record is None:
+                        return
+                    if self._failure is not None:
+                        continue
+
+                    function = self._query_function(record.statement)
+                    with connection.cursor() as cur:
+                        function(cur, *record.params, ignore=self.ignore)
+                    with self._lock:
+                        self.stats.executed += 1
+        except Exception as e:
+            with self._lock:
+                if self._failure is None:
+                    self._failure = e
+            # Keep taking records, so the dispatcher never blocks on a
+            # full inbox of a dead worker
+            while inbox.get() is not None:
+                pass
+
+    def _slot(self, session: str) -> int:
+        return zlib.crc32(session.encode()) % self.connections
+
+    def run(self, records: Iterator[ReplayRecord]) -> ReplayStats:
+        """Replay records and wait until all of them are executed.
+
+        Raises:
+            QueryExecutionError: when a statement fails and errors are
+                not ignored. Dispatching stops at the first failure,
+                as it does when a worker cannot get a connection.
+        """
+
+        self._queues = [
+            queue.Queue(maxsize=self.queue_size)
+            for _ in range(self.connections)
+        ]
+        workers = [
+            threading.Thread(target=self._worker, args=(q,), daemon=True)
+            for q in self._queues
+        ]
+        for w in workers:
+            w.start()
+
+        # Errors are counted by the query wrapper, ignored ones included
+        metrics = get_metrics()
+        before = metrics.snapshot()
+        started = time.perf_counter()
+        first_ts: Optional[float] = None
+        try:
+            for record in records:
+                if self._failure is not None:
+                    break
+
+                if first_ts is None:
+                    first_ts = record.ts
+
+                if self.speed > 0:
+                    due = started + (record.ts - first_ts) / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        self.stats.max_lag = max(self.stats.max_lag, -delay)
+
+                self._sessions.add(record.session)
+                self._queues[self._slot(record.session)].put(record)
+        finally:
+            for q in self._queues:
+                q.put(None)
+            for w in workers:
+                w.join()
+
+        self.stats.errors = sum(
+            stats.error_count
+            for stats in metrics.snapshot().subtract(before).queries.values()
+        )
+        self.stats.sessions = len(self._sessions)
+        self.stats.elapsed = time.perf_counter() - started
+        logger.debug(f"Replay finished: {self.stats}")
+
+        if self._failure is not None:
+            raise self._failure
+        return self.stats
@@ -0,0 +1,486 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Machine-readable run reports and their comparison.
+
+A report is built from the final metrics :class:`~dbload.metrics.Snapshot`
+of a run and a :class:`TimeSeries` sampled during it. JSON reports keep
+the full latency histograms, so two reports can be compared with
+:func:`compare_reports`, which tests latency differences for
+significance instead of just comparing averages.
+"""
+
+import csv
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .metrics import Histogram, Metrics, Snapshot, Stats
+from .exceptions import ReportFormatError
+
+
+REPORT_FORMAT = 1
+
+# Sections of snapshots and reports with the kind of their entries
+KINDS = (("scenarios", "scenario"), ("queries", "query"))
+
+# Percentiles included in reports
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+def _percentile_key(p: float) -> str:
+    return f"p{p:g}".replace(".", "") + "_ms"
+
+
+def summarize_stats(stats: Stats, elapsed: float) -> Dict[str, Any]:
+    """Summarize stats of one query or scenario for the report."""
+
+    h = stats.latency
+    summary = dict(
+        executions=stats.executions,
+        throughput=stats.executions / elapsed if elapsed else 0.0,
+        errors=dict(stats.errors),
+        error_count=stats.error_count,
+        error_rate=stats.error_rate,
+        rows=stats.rows,
+        mean_ms=h.mean / 1000,
+    )
+    for p in PERCENTILES:
+        summary[_percentile_key(p)] = h.percentile(p) / 1000
+    summary["max_ms"] = h.max / 1000
+    return summary
+
+
+def _executions(snapshot: Snapshot) -> int:
+    return sum(s.executions for s in snapshot.queries.values()) + sum(
+        s.executions for s in snapshot.scenarios.values()
+    )
+
+
+def summarize_snapshot(snapshot: Snapshot, elapsed: float) -> Dict[str, Any]:
+    """Summarize all queries and scenarios of a snapshot."""
+
+    return dict(
+        queries={
+            k: summarize_stats(v, elapsed) for k, v in sorted(snapshot.queries.items())
+        },
+        scenarios={
+            k: summarize_stats(v, elapsed) for k, v in sorted(snapshot.scenarios.items())
+        },
+    )
+
+
+class TimeSeries:
+    """Metrics sampled at a fixed interval during a run.
+
+    Every point holds throughput, errors and latency percentiles of each
+    query and scenario within the last interval, and current gauges.
+    Marks label moments of the run, e.g. the end of a warm-up.
+
+    Args:
+        metrics (Metrics): Metrics to sample.
+        interval (float): Seconds between samples.
+        snapshot (Callable): Alternative source of snapshots, e.g. one
+            that merges metrics of several processes.
+    """
+
+    def __init__(
+        self,
+        metrics: Optional[Metrics] = None,
+        interval: float = 1.0,
+        snapshot: Optional[Callable[[], Snapshot]] = None,
+    ) -> None:
+        self.interval = interval
+        self._take_snapshot = snapshot or metrics.snapshot
+        self.points: List[Dict[str, Any]] = []
+        self.marks: List[Dict[str, Any]] = []
+        self._started = time.time()
+        self._previous: Optional[Snapshot] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a snapshot and append a point for the passed interval."""
+
+        with self._lock:
+            return self._append(self._take_snapshot())
+
+    def _append(self, snapshot: Snapshot) -> Dict[str, Any]:
+        previous = self._previous or Snapshot(self._started)
+        if _executions(snapshot) < _executions(previous):
+            # Metrics were reset since the previous sample
+            previous = Snapshot(previous.taken_at)
+        delta = snapshot.subtract(previous)
+        span = snapshot.taken_at - previous.taken_at
+        self._previous = snapshot
+
+        point: Dict[str, Any] = dict(t=round(snapshot.taken_at - self._started, 3))
+        for attr in ("queries", "scenarios"):
+            point[attr] = {
+                name: dict(
+                    ops=s.executions / span if span > 0 else 0.0,
+                    errors=s.error_count,
+                    p50_ms=s.latency.percentile(50) / 1000,
+                    p99_ms=s.latency.percentile(99) / 1000,
+                )
+                for name, s in getattr(delta, attr).items()
+                if s.executions
+            }
+        point["gauges"] = dict(snapshot.gauges)
+        self.points.append(point)
+        return point
+
+    def mark(self, name: str) -> None:
+        """Label the current moment of the run."""
+        self.marks.append(dict(t=round(time.time() - self._started, 3), name=name))
+
+    def boundary(self, name: str, snapshot: Snapshot) -> None:
+        """Close the current interval at ``snapshot`` and mark it.
+
+        Used when the sampled metrics are reset right after ``snapshot``
+        was taken, e.g. at the end of the warm-up, so that the next
+        point only counts what was recorded after the reset.
+        """
+
+        with self._lock:
+            if self._previous is None or self._previous.taken_at < snapshot.taken_at:
+                self._append(snapshot)
+            self.marks.append(
+                dict(t=round(snapshot.taken_at - self._started, 3), name=name)
+            )
+            self._previous = Snapshot(snapshot.taken_at)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self) -> None:
+        self._started = time.time()
+        self._thread = threading.Thread(
+            target=self._loop, name="dbload-timeseries", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(interval=self.interval, points=self.points, marks=self.marks)
+
+
+def workload_hash(ctx, scenarios: Optional[List[str]] = None) -> str:
+    """Hash the SQL of registered queries and the names of run scenarios.
+
+    Reports with different hashes measured different workloads and
+    should not be compared.
+    """
+
+    digest = hashlib.sha256()
+    for name in sorted(ctx.queries):
+        digest.update(name.encode())
+        digest.update(str(ctx.queries[name].get("sql", "") or "").encode())
+    for name in sorted(scenarios if scenarios is not None else ctx.scenarios):
+        digest.update(f"scenario:{name}".encode())
+    return digest.hexdigest()
+
+
+REDACTED = "<redacted>"
+
+# Credentials in URLs and JDBC connection strings
+_URL_USERINFO = re.compile(r"(?<=://)[^/@\s]*@")
+_SECRET_PARAMETER = re.compile(
+    r"((?:password|passwd|pwd|secret|token)[\w.]*\s*=)[^;&]*", re.IGNORECASE
+)
+
+
+def _redact_url(url: str) -> str:
+    url = _URL_USERINFO.sub("", url)
+    return _SECRET_PARAMETER.sub(lambda m: m.group(1) + REDACTED, url)
+
+
+def redact_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy configuration without credentials.
+
+    Removes user info and password parameters from ``dsn`` and
+    ``broker_url`` and masks all values of ``driver_arg``, which
+    commonly are user name and password.
+    """
+
+    config = dict(config)
+    for key in ("dsn", "broker_url"):
+        if isinstance(config.get(key), str):
+            config[key] = _redact_url(config[key])
+    driver_arg = config.get("driver_arg")
+    if isinstance(driver_arg, dict):
+        config["driver_arg"] = {key: REDACTED for key in driver_arg}
+    elif driver_arg:
+        config["driver_arg"] = [REDACTED for _ in driver_arg]
+    return config
+
+
+def build_report(
+    snapshot: Snapshot,
+    elapsed: float,
+    config: Optional[Dict] = None,
+    workload: Optional[str] = None,
+    timeseries: Optional[TimeSeries] = None,
+    run: Optional[Dict] = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Build a JSON-serializable report of a run.
+
+    Args:
+        snapshot (Snapshot): Final metrics of the run.
+        elapsed (float): Duration of the run in seconds.
+        config (Dict): Configuration used for the run. Credentials are
+            removed, see :func:`redact_config`.
+        workload (str): Hash of the workload, see :func:`workload_hash`.
+        timeseries (TimeSeries): Metrics sampled during the run.
+        run (Dict): Parameters of the run, e.g. number of users.
+        extra: Additional top level sections.
+    """
+
+    config = redact_config(config or {})
+    # SQL texts are represented by the workload hash
+    config.pop("sources", None)
+
+    report: Dict[str, Any] = dict(
+        format=REPORT_FORMAT,
+        created_at=time.time(),
+        elapsed=elapsed,
+        workload_hash=workload,
+        run=dict(run or {}),
+        config=config,
+        **summarize_snapshot(snapshot, elapsed),
+        snapshot=snapshot.to_dict(),
+        timeseries=timeseries.to_dict() if timeseries is not None else None,
+    )
+    report.update(extra)
+    return report
+
+
+SUMMARY_COLUMNS = (
+    ["kind", "name", "executions", "throughput", "error_count", "error_rate", "rows", "mean_ms"]
+    + [_percentile_key(p) for p in PERCENTILES]
+    + ["max_ms"]
+)
+
+
+def write_report(report: Dict[str, Any], path: Union[str, Path]) -> List[Path]:
+    """Write report as JSON or CSV, depending on the file suffix.
+
+    CSV reports consist of a summary file with one row per query and
+    scenario and a ``<name>.timeseries.csv`` file next to it.
+
+    Returns:
+        Paths of the written files.
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() != ".csv":
+        path.write_text(json.dumps(report, indent=2, default=str))
+        return [path]
+
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        for section, kind in KINDS:
+            for name, s in report[section].items():
+                writer.writerow(
+                    [kind, name] + [s[c] for c in SUMMARY_COLUMNS[2:]]
+                )
+    written = [path]
+
+    if report.get("timeseries"):
+        ts_path = path.with_suffix(".timeseries.csv")
+        with ts_path.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["t", "kind", "name", "ops", "errors", "p50_ms", "p99_ms", "value"])
+            for point in report["timeseries"]["points"]:
+                for section, kind in KINDS:
+                    for name, s in point[section].items():
+                        writer.writerow(
+                            [point["t"], kind, name]
+                            + [s[c] for c in ("ops", "errors", "p50_ms", "p99_ms")]
+                            + [""]
+                        )
+                # Gauges, e.g. target and active number of users
+                for name, value in point.get("gauges", {}).items():
+                    writer.writerow([point["t"], "gauge", name, "", "", "", "", value])
+            for mark in report["timeseries"]["marks"]:
+                writer.writerow([mark["t"], "mark", mark["name"], "", "", "", "", ""])
+        written.append(ts_path)
+    return written
+
+
+def read_report(path: Union[str, Path]) -> Dict[str, Any]:
+    """Read JSON report written by :func:`write_report`.
+
+    Raises:
+        ReportFormatError: when the file is not a JSON report.
+    """
+
+    path = Path(path)
+    try:
+        report = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        raise ReportFormatError(path, f"{e}")
+    if not isinstance(report, dict) or "snapshot" not in report:
+        raise ReportFormatError(path, "no histogram data, only JSON reports can be compared")
+    return report
+
+
+def _normal_sf(z: float) -> float:
+    """Probability that a standard normal variable exceeds ``z``."""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def mann_whitney(old: Histogram, new: Histogram) -> Tuple[float, float]:
+    """One-sided Mann-Whitney U test computed from histogram buckets.
+
+    Values falling into the same bucket are treated as ties.
+
+    Returns:
+        Tuple of the z score and the p-value of the hypothesis that
+        values of ``new`` tend to be larger than values of ``old``.
+    """
+
+    n_old, n_new = old.count, new.count
+    n = n_old + n_new
+    if not n_old or not n_new:
+        return 0.0, 1.0
+
+    rank_sum = 0.0
+    ties = 0.0
+    seen = 0
+    for i in sorted(set(old.counts) | set(new.counts)):
+        a, b = old.counts.get(i, 0), new.counts.get(i, 0)
+        t = a + b
+        rank_sum += b * (seen + (t + 1) / 2)
+        ties += t ** 3 - t
+        seen += t
+
+    u = rank_sum - n_new * (n_new + 1) / 2
+    mean = n_old * n_new / 2
+    variance = n_old * n_new / 12 * ((n + 1) - ties / (n * (n - 1) or 1))
+    if variance <= 0:
+        return 0.0, 1.0
+    # Continuity correction
+    z = (u - mean - 0.5 * math.copysign(1, u - mean)) / math.sqrt(variance)
+    return z, _normal_sf(z)
+
+
+def _proportions_test(errors_old: int, n_old: int, errors_new: int, n_new: int) -> float:
+    """One-sided p-value of the error rate having increased."""
+
+    if not n_old or not n_new:
+        return 1.0
+    pooled = (errors_old + errors_new) / (n_old + n_new)
+    variance = pooled * (1 - pooled) * (1 / n_old + 1 / n_new)
+    if variance <= 0:
+        return 1.0
+    z = (errors_new / n_new - errors_old / n_old) / math.sqrt(variance)
+    return _normal_sf(z)
+
+
+@dataclass
+class Comparison:
+    """Comparison of a query or scenario in two reports."""
+
+    kind: str
+    name: str
+    old_p50_ms: float
+    new_p50_ms: float
+    old_p99_ms: float
+    new_p99_ms: float
+    old_throughput: float
+    new_throughput: float
+    old_error_rate: float
+    new_error_rate: float
+    latency_p_value: float
+    errors_p_value: float
+    regression: List[str]
+
+    @staticmethod
+    def change(old: float, new: float) -> float:
+        """Relative change from ``old`` to ``new``."""
+        return (new - old) / old if old else 0.0
+
+
+def compare_reports(
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    alpha: float = 0.01,
+    threshold: float = 0.05,
+) -> List[Comparison]:
+    """Compare queries and scenarios present in both reports.
+
+    Latency is a regression when the Mann-Whitney test on the latency
+    histograms is significant at ``alpha`` and the median or p99 grew by
+    more than ``threshold`` (relative). Error rate is a regression when
+    a two-proportion test is significant at ``alpha``. Throughput is a
+    regression when it dropped by more than ``threshold``.
+    """
+
+    old_snapshot = Snapshot.from_dict(old["snapshot"])
+    new_snapshot = Snapshot.from_dict(new["snapshot"])
+    old_elapsed = old.get("elapsed") or 0.0
+    new_elapsed = new.get("elapsed") or 0.0
+
+    comparisons = []
+    for section, kind in KINDS:
+        mine, theirs = getattr(old_snapshot, section), getattr(new_snapshot, section)
+        for name in sorted(set(mine) & set(theirs)):
+            a, b = mine[name], theirs[name]
+            _, latency_p = mann_whitney(a.latency, b.latency)
+            errors_p = _proportions_test(
+                a.error_count, a.executions, b.error_count, b.executions
+            )
+            c = Comparison(
+                kind=kind,
+                name=name,
+                old_p50_ms=a.latency.percentile(50) / 1000,
+                new_p50_ms=b.latency.percentile(50) / 1000,
+                old_p99_ms=a.latency.percentile(99) / 1000,
+                new_p99_ms=b.latency.percentile(99) / 1000,
+                old_throughput=a.executions / old_elapsed if old_elapsed else 0.0,
+                new_throughput=b.executions / new_elapsed if new_elapsed else 0.0,
+                old_error_rate=a.error_rate,
+                new_error_rate=b.error_rate,
+                latency_p_value=latency_p,
+                errors_p_value=errors_p,
+                regression=[],
+            )
+            if latency_p < alpha and (
+                Comparison.change(c.old_p50_ms, c.new_p50_ms) > threshold
+                or Comparison.change(c.old_p99_ms, c.new_p99_ms) > threshold
+            ):
+                c.regression.append("latency")
+            if errors_p < alpha:
+                c.regression.append("errors")
+            if Comparison.change(c.old_throughput, c.new_throughput) < -threshold:
+                c.regression.append("throughput")
+            comparisons.append(c)
+    return comparisons
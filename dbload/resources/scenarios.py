@@ -78,14 +78,19 @@ def update_employee(con):
             logger.info(f"Employee {emp_id} is restored")
 
 
-@scenario
-def create_client(con):
-
-    name = faker.name()
-    phone = faker.phone_number()
-    email = faker.ascii_company_email()
+def new_client():
     job = faker.job()
-    policy = f"<catalog><client><discount>{job}</discount></client></catalog>"
+    return dict(
+        name=faker.name(),
+        phone=faker.phone_number(),
+        email=faker.ascii_company_email(),
+        job=job,
+        policy=f"<catalog><client><discount>{job}</discount></client></catalog>",
+    )
+
+
+@scenario(params=new_client)
+def create_client(con, name, phone, email, job, policy):
 
     with con.cursor() as c:
         create_client.add_client(c, name=name, phone=phone, email=email, job=job, policy=policy)
@@ -137,21 +142,3 @@ def create_sale(con):
         create_sale.add_sale(c, emp_id=emp_id, client_id=client_id, subjet=subject, amount=amount)
         logger.info(f"New sale is made: {emp_name} sold ${amount} of goods to {client_name}")
 
-
-try:
-    from dramatiq import set_broker, actor
-    from dramatiq.brokers.rabbitmq import RabbitmqBroker
-    from dbload import get_config
-
-    config = get_config()
-    broker = RabbitmqBroker(url=config.broker_url)
-    set_broker(broker)
-
-    logger.info("Decorating scenarios")
-    actor(update_employee)
-    actor(create_client)
-    actor(update_client)
-    actor(create_sale)
-
-except ImportError:
-    pass
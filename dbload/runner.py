@@ -0,0 +1,291 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import itertools
+import math
+import threading
+import time
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+from .connection import ConnectionPool
+from .load_shape import LoadShape
+from .context_singleton import get_context
+from .metrics import Snapshot
+from .metrics_singleton import get_metrics
+from .exceptions import ScenarioExecutionError, ScenarioNotFoundError
+
+
+class Runner:
+    """Closed-loop load runner.
+
+    Runs the given scenarios in a loop on ``users`` virtual users. Every
+    virtual user is a thread holding one pooled connection while it is
+    active and executing scenarios round-robin, one after another.
+
+    The run ends after ``duration`` seconds, after ``iterations``
+    scenario executions in total, or when :meth:`stop` is called,
+    whichever comes first.
+
+    With a ``shape`` the number of active virtual users follows the
+    :class:`~dbload.load_shape.LoadShape` over time. Threads for the
+    largest number of users are started up front and the ones above the
+    current target wait idle, without a connection. The run ends with
+    the shape, if it has a duration.
+
+    An optional warm-up of ``warmup`` seconds or ``warmup_iterations``
+    scenario executions precedes the measured part of the run.
+    Scenarios run as usual during the warm-up, but when it ends the
+    metrics recorded so far are moved to :attr:`warmup_snapshot` and
+    the global metrics are reset. ``duration`` and ``iterations`` do
+    not include the warm-up.
+
+    Args:
+        scenarios (List[str]): Names of registered scenarios to run.
+        users (int): Number of virtual users.
+        duration (float): Duration of the run in seconds.
+        iterations (int): Total number of scenario executions.
+        think_time (float): Pause of a virtual user after each scenario.
+        pool (ConnectionPool): Pool to take connections from. By default
+            a pool with one connection per virtual user is created.
+        ignore (bool): Passed to the scenarios, see
+            :meth:`~dbload.scenario.scenario`.
+        warmup (float): Duration of the warm-up in seconds.
+        warmup_iterations (int): Number of scenario executions in the
+            warm-up.
+        shape (LoadShape): Number of virtual users over time, overrides
+            ``users``.
+
+    Examples:
+        Run two scenarios on 10 virtual users for a minute::
+
+            runner = Runner(["create_sale", "update_client"], users=10, duration=60)
+            runner.run()
+    """
+
+    def __init__(
+        self,
+        scenarios: List[str],
+        users: int = 1,
+        duration: Optional[float] = None,
+        iterations: Optional[int] = None,
+        think_time: float = 0.0,
+        pool: Optional[ConnectionPool] = None,
+        ignore: bool = False,
+        warmup: Optional[float] = None,
+        warmup_iterations: Optional[int] = None,
+        shape: Optional[LoadShape] = None,
+    ) -> None:
+        ctx = get_context()
+        for name in scenarios:
+            if name not in ctx.scenarios:
+                raise ScenarioNotFoundError(name)
+
+        self.scenarios = list(scenarios)
+        self.shape = shape
+        if shape is not None:
+            users = math.ceil(shape.max_users)
+            if duration is None:
+                duration = shape.duration
+        self.users = max(users, 1)
+        self.duration = duration
+        self.iterations = iterations
+        self.think_time = think_time
+        self.pool = pool or ConnectionPool(size=self.users)
+        self.ignore = ignore
+        self.metrics = get_metrics()
+        self.warmup = warmup
+        self.warmup_iterations = warmup_iterations
+
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Start of the measured part of the run, after the warm-up
+        self.measured_from: Optional[float] = None
+        self.warmup_snapshot: Optional[Snapshot] = None
+        self._warming = bool(warmup or warmup_iterations)
+        self._warmup_iteration = itertools.count()
+        self._on_warmup_end: List[Callable[[Snapshot], None]] = []
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._iteration = itertools.count()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active_users(self) -> int:
+        return self._active
+
+    @property
+    def elapsed(self) -> float:
+        """Duration of the measured part of the run in seconds."""
+
+        start = self.measured_from or self.started_at
+        if start is None:
+            return 0.0
+        return (self.finished_at or time.time()) - start
+
+    @property
+    def target_users(self) -> float:
+        """Number of virtual users requested by the load shape right now."""
+
+        if self.shape is None:
+            return self.users
+        if self.started_at is None:
+            return self.shape.target(0)
+        return self.shape.target(time.time() - self.started_at)
+
+    @property
+    def warming_up(self) -> bool:
+        return self._warming
+
+    def on_warmup_end(self, callback: Callable[[Snapshot], None]) -> None:
+        """Register callback invoked with the warm-up metrics when it ends."""
+        self._on_warmup_end.append(callback)
+
+    def end_warmup(self) -> None:
+        """Finish the warm-up and start measuring."""
+
+        with self._lock:
+            if not self._warming:
+                return
+            self._warming = False
+            self.warmup_snapshot = self.metrics.snapshot()
+            self.metrics.reset()
+            self.measured_from = time.time()
+
+        logger.debug(
+            f"Warm-up finished after {self.measured_from - self.started_at:.1f}s."
+        )
+        for callback in self._on_warmup_end:
+            callback(self.warmup_snapshot)
+
+    def _next_iteration(self) -> bool:
+        if self._warming and self.warmup_iterations:
+            if next(self._warmup_iteration) < self.warmup_iterations:
+                return True
+            self.end_warmup()
+        if self.iterations is None:
+            return True
+        return next(self._iteration) < self.iterations
+
+    def _user(self, index: int) -> None:
+        ctx = get_context()
+        functions = [ctx.scenarios[name].function for name in self.scenarios]
+
+        active = False
+        # Holds the connection of the user while it is active
+        with contextlib.ExitStack() as borrowed:
+            try:
+                for i in itertools.count(index):
+                    if self._stop.is_set():
+                        break
+                    # Users above the target of the load shape stay idle
+                    if active != (index < self.target_users):
+                        active = not active
+                        with self._lock:
+                            self._active += 1 if active else -1
+                        if active:
+                            connection = borrowed.enter_context(self.pool.connection())
+                        else:
+                            borrowed.close()
+                    if not active:
+                        self._stop.wait(0.05)
+                        continue
+                    if not self._next_iteration():
+                        break
+                    try:
+                        functions[i % len(functions)](
+                            connection, ignore=self.ignore
+                        )
+                    except ScenarioExecutionError as e:
+                        # Already counted in metrics by the scenario
+                        logger.debug(f"Virtual user {index}: {e}")
+                    if self.think_time:
+                        self._stop.wait(self.think_time)
+            finally:
+                if active:
+                    with self._lock:
+                        self._active -= 1
+
+    def start(self) -> None:
+        """Start virtual users in background threads."""
+
+        self.metrics.register_gauge("pool.size", lambda: self.pool.size)
+        self.metrics.register_gauge("pool.in_use", lambda: self.pool.in_use)
+        self.metrics.register_gauge("users.active", lambda: self._active)
+        self.metrics.register_gauge("users.target", lambda: self.target_users)
+
+        self.started_at = time.time()
+        for index in range(self.users):
+            t = threading.Thread(
+                target=self._user,
+                args=(index,),
+                name=f"dbload-user-{index}",
+                daemon=True,
+            )
+            self._threads.append(t)
+            t.start()
+        logger.debug(f"Started {self.users} virtual users.")
+
+    def stop(self) -> None:
+        """Ask virtual users to finish after their current scenario."""
+        self._stop.set()
+
+    def is_running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def wait(self) -> None:
+        """Block until the run is finished."""
+
+        try:
+            while self.is_running():
+                now = time.time()
+                if (
+                    self._warming
+                    and self.warmup
+                    and now - self.started_at >= self.warmup
+                ):
+                    self.end_warmup()
+                if (
+                    self.duration is not None
+                    and not self._warming
+                    and now - (self.measured_from or self.started_at)
+                    >= self.duration
+                ):
+                    self.stop()
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            self.stop()
+            for t in self._threads:
+                t.join()
+        finally:
+            self.finished_at = time.time()
+            if self._warming:
+                logger.warning("Run finished during the warm-up.")
+
+    def snapshot(self) -> Snapshot:
+        """Take snapshot of the metrics of this run."""
+        return self.metrics.snapshot()
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.pool.close()
+
+    def run(self) -> None:
+        """Start the run and block until it is finished."""
+
+        self.start()
+        self.wait()
@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import functools
-from typing import Any, List, Optional
+import inspect
+import time
+from typing import Any, Callable, Dict, List, Optional
 from types import FunctionType
 
 from loguru import logger
@@ -21,6 +24,7 @@ from jpype.dbapi2 import Connection
 
 from .context_singleton import get_context
 from .connection import get_connection
+from .metrics_singleton import get_metrics
 from dbload.exceptions import (
     ConnectionClosedError,
     ConnectionTypeError,
@@ -36,6 +40,7 @@ def scenario(
     infuse: bool = True,
     auto: bool = False,
     auto_run_queries: List[str] = [],
+    params: Optional[Callable[[], Dict[str, Any]]] = None,
 ):
     """Register a function as scenario in the context.
 
@@ -48,6 +53,11 @@ def scenario(
         auto_run_queries (List[str]): Lif of query names to run
             automatically when scenario in invoked. Only existing queries
             are launched. This happends before any other logic in scenario.
+        params (Callable): Function returning keyword arguments for the
+            scenario, used when the scenario is invoked without them.
+            Keeping parameter generation apart lets ``dbload run
+            --pipeline`` prepare parameters ahead in producers, see
+            :mod:`~dbload.pipeline`.
 
     Examples:
         Create a cursor within scenario and use it to manually execute a
@@ -58,6 +68,23 @@ def scenario(
                 with connection.cursor() as cur:
                     stmt = "INSERT INTO USERS VALUES ('Alexander')"
                     cur.execute(stmt)
+
+        Scenarios declared with ``async def`` receive an
+        :class:`~dbload.aio.AsyncConnection` and await their queries.
+        They are run by the asyncio engine, see :mod:`~dbload.aio`::
+
+            @scenario
+            async def browse(connection):
+                await connection.query(select_products)
+
+        Scenarios written as generators yield deferred queries and get
+        their results back. The engine batches and overlaps yielded
+        queries, see :mod:`~dbload.steps`::
+
+            @scenario
+            def hire(connection):
+                dep = yield hire.get_departments_return_random.defer()
+                yield [hire.add_employee.defer(n, b, dep.first[0]) for n, b in people]
     """
 
     def decorator_scenario(func: FunctionType):
@@ -68,6 +95,19 @@ def scenario(
         __name: str = name or func.__name__
         func.__name__ = __name
 
+        if inspect.iscoroutinefunction(func):
+            wrapper_scenario = _async_scenario(func, __name, params)
+            setattr(wrapper_scenario, "_is_decorated_by_scenario", True)
+            get_context().register_scenario(
+                wrapper_scenario,
+                name=__name,
+                infuse=infuse,
+                auto=auto,
+                auto_run_queries=auto_run_queries,
+                params=params,
+            )
+            return wrapper_scenario
+
         @functools.wraps(func)
         def wrapper_scenario(*args, ignore: bool = False, **kwargs):
             nonlocal func
@@ -103,6 +143,9 @@ def scenario(
             if connection._closed:
                 raise ConnectionClosedError(__name)
 
+            error: Optional[Exception] = None
+            started = time.perf_counter_ns()
+
             result: Any = None
             try:
                 # Auto Run Queries.
@@ -114,16 +157,29 @@ def scenario(
                     logger.debug(
                         f"Execuing auto-run queries for scenario '{__name}': {query_names}"
                     )
-                    for q in query_names:
-                        with connection.cursor() as cur:
-                            ctx.queries[q].function(cur, ignore=ignore)
+                    _run_stages(
+                        __name,
+                        connection,
+                        ctx.scenarios[__name].auto_run_stages,
+                        ignore,
+                    )
 
                 if auto:
                     connection.commit()
                 else:
+                    source = ctx.scenarios[__name].get("pipeline", None) or params
+                    if source is not None and not args and not kwargs:
+                        kwargs = source()
                     result = func(connection, *args, **kwargs)
+                    # Generator scenarios yield their queries to the
+                    # engine, see dbload.steps.
+                    if inspect.isgenerator(result):
+                        from .steps import run_steps
+
+                        result = run_steps(__name, connection, result)
 
             except Exception as e:
+                error = e
                 if ignore:
                     logger.warning(
                         f"Error occured in scenario but was handled: {e}"
@@ -131,6 +187,11 @@ def scenario(
                 else:
                     raise ScenarioExecutionError(e) from None
 
+            finally:
+                get_metrics().record_scenario(
+                    __name, time.perf_counter_ns() - started, error
+                )
+
             return result
 
         setattr(wrapper_scenario, "_is_decorated_by_scenario", True)
@@ -142,6 +203,7 @@ def scenario(
             infuse=infuse,
             auto=auto,
             auto_run_queries=auto_run_queries,
+            params=params,
         )
 
         return wrapper_scenario
@@ -150,3 +212,90 @@ def scenario(
         return decorator_scenario
     else:
         return decorator_scenario(_func)
+
+
+def _run_stages(name: str, connection: Connection, stages, ignore: bool) -> None:
+    """Run auto-run queries of a scenario stage by stage.
+
+    A stage with several queries runs them concurrently, each on a
+    connection of its own, see :func:`~dbload.fanout.gather`. The next
+    stage starts only after the whole stage finished. A failed query
+    stops the scenario after its stage, unless ``ignore`` is set. Stages
+    with an explicit order are timed and recorded as ``name[order]``
+    scenarios.
+    """
+
+    from .fanout import Deferred, gather
+
+    ctx = get_context()
+    for stage in stages:
+        functions = [ctx.queries[q].function for q in stage.queries]
+        error: Optional[Exception] = None
+        started = time.perf_counter_ns()
+        try:
+            if len(functions) == 1:
+                with connection.cursor() as cur:
+                    functions[0](cur, ignore=ignore)
+            else:
+                gather(*[Deferred(f, ignore=ignore) for f in functions])
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if stage.staged:
+                duration_ns = time.perf_counter_ns() - started
+                get_metrics().record_scenario(
+                    f"{name}[{stage.order}]", duration_ns, error
+                )
+                logger.info(
+                    f"Stage {name}[{stage.order}] of {len(functions)} "
+                    f"queries took {duration_ns / 1e9:.3f}s."
+                )
+
+
+def _async_scenario(
+    func: FunctionType,
+    name: str,
+    params: Optional[Callable[[], Dict[str, Any]]] = None,
+):
+    """Wrap ``async def`` scenario, see :func:`scenario`."""
+
+    from .aio import AsyncConnection
+
+    @functools.wraps(func)
+    async def wrapper_scenario(connection, *args, ignore: bool = False, **kwargs):
+        logger.debug(f"Executing '{name}' scenario.")
+
+        if not isinstance(connection, AsyncConnection):
+            raise ConnectionTypeError(connection)
+
+        ctx = get_context()
+        error: Optional[Exception] = None
+        started = time.perf_counter_ns()
+
+        result: Any = None
+        try:
+            for q in ctx.scenarios[name].auto_run_queries:
+                await connection.query(ctx.queries[q].function, ignore=ignore)
+            source = ctx.scenarios[name].get("pipeline", None) or params
+            if source is not None and not args and not kwargs:
+                # Pipelines block while their producers are behind
+                loop = asyncio.get_running_loop()
+                kwargs = await loop.run_in_executor(None, source)
+            result = await func(connection, *args, **kwargs)
+
+        except Exception as e:
+            error = e
+            if ignore:
+                logger.warning(f"Error occured in scenario but was handled: {e}")
+            else:
+                raise ScenarioExecutionError(e) from None
+
+        finally:
+            get_metrics().record_scenario(
+                name, time.perf_counter_ns() - started, error
+            )
+
+        return result
+
+    return wrapper_scenario
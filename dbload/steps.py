@@ -0,0 +1,200 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scenarios yielding their queries to the engine.
+
+A scenario written as a generator does not execute queries itself. It
+yields deferred query calls, created by ``query.defer(...)``, and gets
+their results back::
+
+    @scenario
+    def create_sale(con):
+        client = yield create_sale.get_clients_return_random.defer()
+        yield [
+            create_sale.add_sale.defer(emp_id, client.first[0], subject, amount)
+            for emp_id in emp_ids
+        ]
+
+A single yielded step is executed on the scenario connection. A yielded
+list declares steps that do not depend on each other: consecutive steps
+of the same auto ``INSERT``, ``UPDATE`` or ``DELETE`` query with
+explicit parameters are coalesced into one ``executemany`` batch, and the remaining groups run concurrently, see
+:func:`~dbload.fanout.gather`. The list of results is sent back in the
+order of the steps. Failed steps are thrown into the generator, so the
+scenario can handle them with ``try``/``except``.
+
+Latency of every yielded step is recorded as a scenario named
+``<scenario>/<query>``.
+"""
+
+import itertools
+import re
+import time
+from typing import Any, Generator, List, Optional, Union
+
+from jpype.dbapi2 import Connection
+from loguru import logger
+
+from .context_singleton import get_context
+from .fanout import Deferred, gather
+from .metrics_singleton import get_metrics
+from .query_result import QueryResult
+from .exceptions import QueryExecutionError, ScenarioStepTypeError
+
+
+Step = Union[Deferred, List[Deferred]]
+
+# Statements whose batches are equivalent to executing them one by one,
+# statements returning rows would lose their rows in ``executemany``
+dml_regex = re.compile(r"^\s*(?:--[^\n]*\n\s*)*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+returning_regex = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+
+
+def _step_name(step: Deferred) -> str:
+    # Name the query is registered under, e.g. "<query>_return_random"
+    name = getattr(step.function, "_query_name", None)
+    return name or getattr(step.function, "__name__", repr(step.function))
+
+
+def _batchable(step: Deferred) -> bool:
+    """Whether the step is an auto DML query with explicit parameters only.
+
+    Queries returning random rows are never batched, ``executemany``
+    would bypass the selection of the rows.
+    """
+
+    if getattr(step.function, "_is_decorated_by_return_random", False):
+        return False
+    query = get_context().queries.get(_step_name(step))
+    if query is None or not query.auto or not query.sql:
+        return False
+    if not dml_regex.match(query.sql) or returning_regex.search(query.sql):
+        return False
+    if set(step.kwargs) & {"ignore", "feed"}:
+        return False
+    return bool(step.args or step.kwargs)
+
+
+class _Batch:
+    """Consecutive steps of one auto query executed with ``executemany``."""
+
+    def __init__(self, steps: List[Deferred]) -> None:
+        self.steps = steps
+        self.name = _step_name(steps[0])
+
+    def __call__(self, connection: Connection) -> QueryResult:
+        sql = get_context().queries[self.name].sql
+        parameters = [
+            list(s.args) + list(s.kwargs.values()) for s in self.steps
+        ]
+        error: Optional[Exception] = None
+        rows = -1
+        started = time.perf_counter_ns()
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, parameters)
+                rows = cursor.rowcount
+            connection.commit()
+        except Exception as e:
+            error = e
+            raise QueryExecutionError(e) from None
+        finally:
+            get_metrics().record_query(
+                self.name, time.perf_counter_ns() - started, rows, error
+            )
+        return QueryResult(rowcount=rows)
+
+
+def _groups(steps: List[Deferred]) -> List[Union[Deferred, _Batch]]:
+    groups: List[Union[Deferred, _Batch]] = []
+    for batchable, run in itertools.groupby(
+        steps, key=lambda s: _step_name(s) if _batchable(s) else None
+    ):
+        run = list(run)
+        if batchable is not None and len(run) > 1:
+            groups.append(_Batch(run))
+        else:
+            groups.extend(run)
+    return groups
+
+
+def _execute(connection: Connection, step: Step) -> Any:
+    if isinstance(step, Deferred):
+        return step(connection)
+
+    if not isinstance(step, (list, tuple)) or not all(
+        isinstance(s, Deferred) for s in step
+    ):
+        raise ScenarioStepTypeError(step)
+
+    groups = _groups(list(step))
+    if len(groups) == 1:
+        results = [groups[0](connection)]
+    else:
+        results = gather(*groups)
+
+    # Every step of a batch gets the result of the whole batch
+    unpacked: List[Any] = []
+    for group, result in zip(groups, results):
+        count = len(group.steps) if isinstance(group, _Batch) else 1
+        unpacked.extend([result] * count)
+    return unpacked
+
+
+def _label(step: Step) -> str:
+    if isinstance(step, Deferred):
+        return _step_name(step)
+    names = dict.fromkeys(
+        _step_name(s) for s in step if isinstance(s, Deferred)
+    )
+    return "+".join(names)
+
+
+def run_steps(
+    name: str, connection: Connection, generator: Generator
+) -> Any:
+    """Drive generator scenario ``name`` until it returns.
+
+    Returns:
+        Value returned by the generator.
+    """
+
+    metrics = get_metrics()
+    value: Any = None
+    error: Optional[Exception] = None
+    while True:
+        try:
+            if error is not None:
+                step = generator.throw(error)
+            else:
+                step = generator.send(value)
+        except StopIteration as stop:
+            return stop.value
+
+        logger.debug(f"Executing step '{_label(step)}' of '{name}' scenario.")
+        value = error = None
+        started = time.perf_counter_ns()
+        try:
+            value = _execute(connection, step)
+        except ScenarioStepTypeError:
+            generator.close()
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            metrics.record_scenario(
+                f"{name}/{_label(step)}",
+                time.perf_counter_ns() - started,
+                error,
+            )
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+
+from dbload.broker import get_broker, normalize_actor_options, register_actor, shutdown_broker
+from dbload.config_singleton import get_config
+from dbload.context import Context
+from dbload.enqueue import send_many
+from dbload.query_parser import QueryParser
+from dbload.exceptions import ActorOptionError
+
+
+SOURCE = """
+-- name: monthly_report, option: return_random, option: queue=analytics, option: max_concurrency=2
+SELECT * FROM SALES;
+"""
+
+
+def test_actor_options_from_annotations():
+    parsed = QueryParser.parse([SOURCE])
+    assert parsed.monthly_report.options == ["return_random"]
+    assert parsed.monthly_report.actor_options == {"queue": "analytics", "max_concurrency": "2"}
+
+    parsed = QueryParser.parse(["-- name: fast, option: queue=oltp-fast, option: time_limit=1.5m\nSELECT 1;"])
+    assert parsed.fast.actor_options == {"queue": "oltp-fast", "time_limit": "1.5m"}
+
+
+def test_config_overrides_annotations():
+    ctx = Context()
+    ctx.queries.monthly_report = dict(actor_options={"queue": "analytics", "priority": "10"})
+    config = get_config()
+    saved = config.actors
+    config.actors = {"monthly_report": {"priority": 0}}
+    try:
+        assert ctx.actor_options("monthly_report") == {"queue": "analytics", "priority": 0}
+        assert ctx.actor_options("unknown") == {}
+    finally:
+        config.actors = saved
+
+
+def test_normalize_actor_options():
+    assert normalize_actor_options(
+        "a", {"queue": "slow", "priority": "5", "time_limit": "2m", "max_retries": 0}
+    ) == {"queue_name": "slow", "priority": 5, "time_limit": 120000, "max_retries": 0}
+
+    with pytest.raises(ActorOptionError, match="queues"):
+        normalize_actor_options("a", {"queues": "slow"})
+    with pytest.raises(ActorOptionError):
+        normalize_actor_options("a", {"max_concurrency": "many"})
+
+
+def test_register_actor_with_queue_and_priority():
+    broker = get_broker("stub://")
+
+    def options_actor():
+        pass  # pragma: no cover
+
+    actor = register_actor(broker, options_actor, {"queue": "analytics", "priority": 10, "time_limit": 5})
+    assert actor.queue_name == "analytics"
+    assert actor.priority == 10
+    assert actor.options["time_limit"] == 5000
+    assert "analytics" in broker.get_declared_queues()
+
+
+def test_max_concurrency_limits_running_messages():
+    broker = get_broker("local://?threads=6")
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def limited_actor():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    actor = register_actor(broker, limited_actor, {"max_concurrency": 2})
+    send_many(actor, count=12)
+    shutdown_broker(broker)
+
+    assert len(peak) == 12
+    assert max(peak) == 2
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+from dramatiq.brokers.stub import StubBroker
+
+from dbload import query, scenario
+from dbload.broker import get_broker, is_local, is_local_url, register_actors, shutdown_broker
+from dbload.context import Context
+from dbload.enqueue import send_many
+from dbload.exceptions import UnsupportedBrokerError
+
+
+def test_get_broker_schemes():
+    stub = get_broker("stub://")
+    assert isinstance(stub, StubBroker) and not is_local(stub)
+
+    local = get_broker("local://?threads=3")
+    assert is_local(local) and local.threads == 3
+    assert get_broker("local://").threads == 8
+
+    with pytest.raises(UnsupportedBrokerError, match="local"):
+        get_broker("kafka://localhost")
+
+    assert is_local(get_broker("LOCAL://"))
+    assert is_local_url("Local://?threads=2") and is_local_url("stub://")
+    assert not is_local_url("amqp://local:5672")
+
+
+def test_local_broker_executes_messages_in_process():
+    broker = get_broker("local://?threads=4")
+    executed = []
+
+    @dramatiq.actor(broker=broker, actor_name="local_actor")
+    def local_actor(value):
+        executed.append((value, threading.current_thread().name))
+
+    params = [[i] for i in range(50)]
+
+    class Params:
+        def __len__(self):
+            return len(params)
+
+        def next(self):
+            return params.pop(0)
+
+    send_many(local_actor, params=Params(), batch_size=20)
+    shutdown_broker(broker)
+
+    assert sorted(v for v, _ in executed) == list(range(50))
+    assert all(name != threading.main_thread().name for _, name in executed)
+    assert broker.worker is None
+
+
+def test_local_broker_does_not_retry_failed_messages():
+    broker = get_broker("local://?threads=2")
+    executed = []
+
+    @dramatiq.actor(broker=broker, actor_name="failing_local_actor")
+    def failing_local_actor():
+        executed.append(1)
+        raise RuntimeError("boom")
+
+    failing_local_actor.send()
+    shutdown_broker(broker, timeout=5)
+
+    assert executed == [1]
+
+
+def test_shutdown_gives_up_after_timeout(mocker):
+    broker = get_broker("local://?threads=1")
+    warning = mocker.patch("dbload.broker.logger.warning")
+
+    @dramatiq.actor(broker=broker, actor_name="slow_local_actor")
+    def slow_local_actor():
+        time.sleep(0.5)
+
+    slow_local_actor.send()
+    slow_local_actor.send()
+    shutdown_broker(broker, timeout=0.1)
+
+    warning.assert_called_once()
+    assert broker.worker is None
+
+
+def test_register_actors():
+    @query
+    def broker_registered_query(cur):
+        pass  # pragma: no cover
+
+    @scenario(infuse=False)
+    def broker_registered_scenario(con):
+        pass  # pragma: no cover
+
+    ctx = Context()
+    ctx.queries.broker_registered_query = dict(function=broker_registered_query)
+    ctx.scenarios.broker_registered_scenario = dict(function=broker_registered_scenario)
+
+    broker = get_broker("stub://")
+    register_actors(broker, ctx)
+    assert broker.get_declared_actors() == {"broker_registered_query", "broker_registered_scenario"}
@@ -1,3 +1,6 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from importlib import resources
 
 import pytest
@@ -33,11 +36,15 @@ def connection(cursor):
     class Connection(dbapi2.Connection):
         def __init__(self):
             self._cur = cursor
-            pass
+            self._closed = False
+            self._num_commit_called = 0
 
         def cursor(self):
             return self._cur
 
+        def commit(self):
+            self._num_commit_called += 1
+
     return Connection()
 
 
@@ -49,3 +56,23 @@ def sources():
     with resources.open_text("dbload.resources", "ms-sql.sql") as f:
         source = f.read()
     return [source]
+
+
+@pytest.fixture
+def fanout(connection):
+    """Make gather() run on the fake connection."""
+
+    from dbload.fanout import _FanOut
+
+    class Pool:
+        @contextmanager
+        def connection(self, timeout=None):
+            yield connection
+
+    saved = (_FanOut.pool, _FanOut.executor, _FanOut.pid)
+    _FanOut.pool = Pool()
+    _FanOut.executor = ThreadPoolExecutor(max_workers=4)
+    _FanOut.pid = os.getpid()
+    yield
+    _FanOut.executor.shutdown()
+    _FanOut.pool, _FanOut.executor, _FanOut.pid = saved
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from dbload.connection import ConnectionPool
+from dbload.exceptions import PoolExhaustedError
+
+
+def test_connections_are_opened_concurrently(mocker):
+    opening = []
+
+    def connect(config):
+        opening.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return mocker.Mock()
+
+    mocker.patch("dbload.connection.get_connection", side_effect=connect)
+    pool = ConnectionPool(size=4)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=pool.acquire) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert time.perf_counter() - started < 0.5
+    assert pool.opened == 4 and pool.in_use == 4
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire(timeout=0.01)
+
+
+def test_failed_connect_gives_the_slot_back(mocker):
+    connect = mocker.patch(
+        "dbload.connection.get_connection", side_effect=[ConnectionError("down"), mocker.Mock()]
+    )
+    pool = ConnectionPool(size=1)
+
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+    with pool.connection(timeout=0.01) as connection:
+        assert connection is not None
+    assert connect.call_count == 2 and pool.opened == 1
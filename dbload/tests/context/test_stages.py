@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+from mapz import Mapz
+
+from dbload import query
+from dbload.metrics_singleton import get_metrics
+from dbload.context import Context
+from dbload.query_parser import QueryParser
+from dbload.scenario import _run_stages
+
+
+SOURCE = """
+-- name: create_schema, scenario: setup
+CREATE SCHEMA S;
+
+-- name: create_a, scenario: setup[10]
+CREATE TABLE S.A (ID INT);
+
+-- name: create_b, scenario: setup[10]
+CREATE TABLE S.B (ID INT);
+
+-- name: index_a, scenario: setup[20]
+CREATE INDEX S.A_IDX ON S.A (ID);
+"""
+
+
+def _setup_tuples(source):
+    parsed = QueryParser.parse([source])
+    return sorted(
+        (
+            (name, order, "setup" in params.staged)
+            for name, params in parsed.items()
+            for _, order in params.scenarios
+        ),
+        key=lambda i: i[1],
+    )
+
+
+def test_same_order_queries_form_a_stage():
+    stages = Context._group_stages(_setup_tuples(SOURCE))
+
+    assert [s.queries for s in stages] == [
+        ["create_schema"],
+        ["create_a", "create_b"],
+        ["index_a"],
+    ]
+    assert [s.staged for s in stages] == [False, True, True]
+    assert [s.order for s in stages] == [0, 10, 20]
+
+
+def test_queries_without_order_stay_sequential():
+    source = SOURCE.replace("[10]", "").replace("[20]", "")
+    stages = Context._group_stages(_setup_tuples(source))
+
+    assert [s.queries for s in stages] == [
+        ["create_schema"], ["create_a"], ["create_b"], ["index_a"]
+    ]
+
+
+def test_stage_runs_concurrently(connection, fanout):
+    threads = []
+
+    @query
+    def stage_slow_a(cur):
+        time.sleep(0.1)
+        threads.append(threading.current_thread().name)
+
+    @query
+    def stage_slow_b(cur):
+        time.sleep(0.1)
+        threads.append(threading.current_thread().name)
+
+    stages = [Mapz(order=5, staged=True, queries=["stage_slow_a", "stage_slow_b"])]
+    started = time.perf_counter()
+    _run_stages("stage_setup", connection, stages, ignore=False)
+
+    assert time.perf_counter() - started < 0.19
+    assert len(set(threads)) == 2
+    assert get_metrics().snapshot().scenarios["stage_setup[5]"].executions == 1
+
+
+def test_failed_stage_stops_unless_ignored(connection, fanout):
+    ran = []
+
+    @query
+    def stage_failing(cur):
+        raise RuntimeError("boom")
+
+    @query
+    def stage_ok(cur):
+        ran.append(1)
+
+    @query
+    def stage_next(cur):
+        ran.append(2)
+
+    stages = [
+        Mapz(order=1, staged=True, queries=["stage_failing", "stage_ok"]),
+        Mapz(order=2, staged=False, queries=["stage_next"]),
+    ]
+    with pytest.raises(Exception):
+        _run_stages("stage_fail", connection, stages, ignore=False)
+    assert ran == [1]
+    assert get_metrics().snapshot().scenarios["stage_fail[1]"].errors
+
+    _run_stages("stage_fail", connection, stages, ignore=True)
+    assert ran == [1, 1, 2]
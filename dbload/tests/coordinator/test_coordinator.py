@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from dbload import scenario
+from dbload.coordinator import BrokerChannel, Coordinator, LocalChannel, Node, RunPlan
+from dbload.runner import Runner
+from dbload.exceptions import CoordinationError
+
+from ..runner.test_runner import FakePool
+
+
+@scenario(infuse=False)
+def coordinated_scenario(con):
+    time.sleep(0.001)
+
+
+@pytest.fixture
+def channel():
+    channel = LocalChannel()
+    yield channel
+    channel.close()
+
+
+def _serve(channel, node_id, connection, starts):
+    def factory(options):
+        starts.put(time.time())
+        return Runner(pool=FakePool(connection), **options)
+
+    Node(channel, node_id, runner_factory=factory, interval=0.05, timeout=10).serve()
+
+
+def test_nodes_start_together_and_results_are_merged(channel, connection):
+    import multiprocessing
+
+    mp = multiprocessing.get_context("fork")
+    starts = mp.Queue()
+    nodes = [
+        mp.Process(target=_serve, args=(channel, f"node-{i}", connection, starts))
+        for i in range(3)
+    ]
+    for node in nodes:
+        node.start()
+
+    plan = RunPlan(scenarios=["coordinated_scenario"], users=4, iterations=31, seed=7)
+    coordinator = Coordinator(channel, plan, nodes=3, lead=0.2, timeout=10)
+    sources = set()
+    coordinator.on_snapshot(lambda source, snapshot: sources.add(source))
+    coordinator.run()
+    for node in nodes:
+        node.join(timeout=10)
+
+    assert sorted(coordinator.node_ids) == ["node-0", "node-1", "node-2"]
+    assert sources == set(coordinator.node_ids)
+    assert coordinator.snapshot().scenarios["coordinated_scenario"].executions == 31
+    assert coordinator.elapsed > 0
+    # Runners were created once the plan arrived, well before the start
+    prepared = [starts.get(timeout=1) for _ in nodes]
+    assert max(prepared) < coordinator.started_at
+
+
+def test_plan_is_split_between_nodes():
+    plan = RunPlan(scenarios=["s"], users=10, iterations=7, shape="ramp(0, 8, 1m)")
+    options = [plan.runner_options(i, 4) for i in range(4)]
+
+    assert [o["users"] for o in options] == [3, 3, 2, 2]
+    assert [o["iterations"] for o in options] == [2, 2, 2, 1]
+    assert options[0]["shape"].target(60) == 2
+    assert RunPlan.from_dict(plan.to_dict()) == plan
+
+
+def _serve_other_workload(channel):
+    try:
+        Node(channel, "stale", runner_factory=lambda options: None, timeout=10).serve()
+    except CoordinationError:
+        pass
+
+
+def test_node_with_different_workload_aborts_the_run(channel):
+    import multiprocessing
+
+    node = multiprocessing.get_context("fork").Process(target=_serve_other_workload, args=(channel,))
+    node.start()
+
+    plan = RunPlan(scenarios=["coordinated_scenario"], workload="not-this-one")
+    coordinator = Coordinator(channel, plan, nodes=1, timeout=10)
+    with pytest.raises(CoordinationError, match="different workload"):
+        coordinator.start()
+    node.join(timeout=10)
+
+
+def test_coordinator_times_out_without_nodes(channel):
+    coordinator = Coordinator(channel, RunPlan(), nodes=2, timeout=0.2)
+    with pytest.raises(CoordinationError, match="2 nodes to join"):
+        coordinator.start()
+
+
+def test_broker_channel_roundtrip():
+    dramatiq = pytest.importorskip("dramatiq")
+    from dramatiq.brokers.stub import StubBroker
+
+    channel = BrokerChannel(StubBroker())
+    channel.send("dbload.coordinator", dict(kind="join", node="a"))
+
+    assert channel.receive("dbload.coordinator", 1) == dict(kind="join", node="a")
+    assert channel.receive("dbload.coordinator", 0.2) is None
+    channel.close()
@@ -0,0 +1,61 @@
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+from dramatiq.brokers.stub import StubBroker
+
+from dbload.enqueue import send_many
+from dbload.feed import open_feed
+
+
+@pytest.fixture
+def actor():
+    broker = StubBroker()
+    broker.emit_after("process_boot")
+
+    @dramatiq.actor(broker=broker, actor_name="bulk_actor")
+    def bulk_actor(emp_id=None, amount=None):
+        pass  # pragma: no cover
+
+    yield bulk_actor
+    broker.close()
+
+
+def messages(actor):
+    from dramatiq import Message
+
+    queue = actor.broker.queues["default"]
+    return [Message.decode(queue.get_nowait()) for _ in range(queue.qsize())]
+
+
+def test_send_many_in_batches(actor):
+    progress = []
+    result = send_many(actor, count=2500, batch_size=1000, progress=progress.append)
+
+    assert result.sent == 2500
+    assert result.batches == 3
+    assert progress == [1000, 2000, 2500]
+    assert result.rate > 0
+    assert actor.broker.queues["default"].qsize() == 2500
+
+
+def test_send_many_with_params_file(actor, tmp_path):
+    path = tmp_path / "sales.csv"
+    path.write_text("EMP_ID,AMOUNT\n1,100\n2,200\n3,300\n")
+
+    result = send_many(actor, params=open_feed(path))
+    assert result.sent == 3
+    assert [m.args for m in messages(actor)] == [(1, 100), (2, 200), (3, 300)]
+
+    # Sequential feed starts over when more messages are requested
+    send_many(actor, count=4, params=open_feed(path), batch_size=3)
+    assert [m.args[0] for m in messages(actor)] == [1, 2, 3, 1]
+
+
+def test_send_many_as_groups(actor):
+    result = send_many(actor, count=10, batch_size=4, group=True)
+    assert result.batches == 3
+    assert len(messages(actor)) == 10
+
+
+def test_send_single_by_default(actor):
+    assert send_many(actor).sent == 1
@@ -0,0 +1,67 @@
+import urllib.request
+
+import pytest
+
+from dbload.exporter import MetricsExporter, MetricsPusher, render_openmetrics
+from dbload.metrics import Metrics
+
+
+@pytest.fixture
+def exporter():
+    local = Metrics()
+    local.record_query("select_all", 2_000_000, rows=3)
+    local.register_gauge("pool.in_use", lambda: 2)
+
+    exporter = MetricsExporter(local, host="127.0.0.1", port=0)
+    exporter.start()
+    yield exporter
+    exporter.stop()
+
+
+def scrape(exporter):
+    url = f"http://127.0.0.1:{exporter.port}/metrics"
+    with urllib.request.urlopen(url) as response:
+        assert response.headers["Content-Type"].startswith(
+            "application/openmetrics-text"
+        )
+        return response.read().decode()
+
+
+def test_render_openmetrics():
+    metrics = Metrics()
+    metrics.record_query("q", 3_000_000, error=KeyError())
+    text = render_openmetrics(metrics.snapshot())
+
+    assert 'dbload_query_executions_total{query="q"} 1' in text
+    assert 'dbload_query_errors_total{query="q",error="KeyError"} 1' in text
+    assert 'dbload_query_latency_seconds_bucket{query="q",le="0.0025"} 0' in text
+    assert 'dbload_query_latency_seconds_bucket{query="q",le="0.005"} 1' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_scrape_merges_pushed_processes(exporter):
+    worker = Metrics()
+    worker.record_query("select_all", 1_000_000, rows=7)
+    worker.register_gauge("pool.in_use", lambda: 3)
+    MetricsPusher(worker, f"http://127.0.0.1:{exporter.port}/push").push()
+
+    text = scrape(exporter)
+    assert 'dbload_query_executions_total{query="select_all"} 2' in text
+    assert 'dbload_query_rows_total{query="select_all"} 10' in text
+    assert "dbload_pool_in_use 5.0" in text
+    assert "dbload_processes 2" in text
+
+
+def test_unknown_path(exporter):
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/nope")
+
+
+def test_pushes_only_from_loopback():
+    from dbload.exporter import _is_loopback
+
+    assert _is_loopback("127.0.0.1")
+    assert _is_loopback("::1")
+    assert _is_loopback("::ffff:127.0.0.1")
+    assert not _is_loopback("10.0.0.7")
+    assert not _is_loopback("::ffff:10.0.0.7")
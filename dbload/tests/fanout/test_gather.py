@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from dbload import gather, query, return_random
+from dbload.query_result import QueryResult
+from dbload.exceptions import QueryExecutionError
+
+from ..runner.test_runner import FakePool
+
+
+def test_gather_runs_queries_concurrently(connection):
+    @query
+    def fanout_slow_query(cur, value):
+        time.sleep(0.1)
+        return (value, threading.current_thread().name)
+
+    started = time.perf_counter()
+    results = gather(
+        fanout_slow_query.defer(1),
+        fanout_slow_query.defer(value=2),
+        pool=FakePool(connection),
+    )
+    elapsed = time.perf_counter() - started
+
+    assert [r[0] for r in results] == [1, 2]
+    assert results[0][1] != results[1][1]
+    assert elapsed < 0.19
+
+
+def test_gather_errors(connection):
+    @query
+    def fanout_failing_query(cur):
+        raise RuntimeError("boom")
+
+    @query
+    def fanout_ok_query(cur):
+        return "ok"
+
+    pool = FakePool(connection)
+    with pytest.raises(QueryExecutionError):
+        gather(fanout_ok_query.defer(), fanout_failing_query.defer(), pool=pool)
+
+    ok, failed = gather(
+        fanout_ok_query.defer(), fanout_failing_query.defer(), pool=pool, return_exceptions=True
+    )
+    assert ok == "ok" and isinstance(failed, QueryExecutionError)
+
+    assert gather(fanout_failing_query.defer(ignore=True), pool=pool) == [None]
+
+
+def test_defer_keeps_return_random(connection):
+    @return_random
+    @query
+    def fanout_rows_query(cur):
+        return QueryResult(rows=[(1,), (2,), (3,)])
+
+    result, = gather(fanout_rows_query.defer(), pool=FakePool(connection))
+    assert len(result.rows) == 1
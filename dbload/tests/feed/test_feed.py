@@ -0,0 +1,90 @@
+import pytest
+
+from dbload import query, get_context
+from dbload.query_result import QueryResult
+from dbload.feed import CsvFeed, open_feed
+from dbload.exceptions import FeedExhaustedError, UnsupportedFeedError
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "ids.csv"
+    path.write_text("id,name,score\n1,alice,0.5\n2,bob,1.5\n\n3,carol,2.5\n")
+    return path
+
+
+def test_sequential_loops(csv_path):
+    feed = open_feed(csv_path)
+    assert isinstance(feed, CsvFeed)
+    assert len(feed) == 3
+    assert feed.header == ["id", "name", "score"]
+    assert [feed() for _ in range(4)] == [
+        [1, "alice", 0.5],
+        [2, "bob", 1.5],
+        [3, "carol", 2.5],
+        [1, "alice", 0.5],
+    ]
+
+
+def test_sequential_no_loop(csv_path):
+    feed = open_feed(csv_path, loop=False, columns=["name"])
+    assert [feed() for _ in range(3)] == [["alice"], ["bob"], ["carol"]]
+    with pytest.raises(FeedExhaustedError):
+        feed()
+
+
+def test_partitioned(csv_path):
+    feed = open_feed(csv_path, types=[int, str, float])
+    first = feed.partition(0, 2)
+    second = feed.partition(1, 2)
+    assert [first()[0] for _ in range(3)] == [1, 3, 1]
+    assert [second()[0] for _ in range(2)] == [2, 2]
+
+
+def test_random(csv_path):
+    feed = open_feed(csv_path, mode="random")
+    assert all(feed()[0] in (1, 2, 3) for _ in range(20))
+
+
+def test_unsupported(tmp_path, csv_path):
+    with pytest.raises(UnsupportedFeedError):
+        open_feed(tmp_path / "data.xlsx")
+    with pytest.raises(UnsupportedFeedError):
+        open_feed(csv_path, mode="shuffled")
+
+
+def test_auto_query_takes_parameters_from_feed(cursor, csv_path, mocker):
+    @query(auto=True)
+    def feed_driven_query(cur):
+        pass  # pragma: no cover
+
+    get_context().queries.feed_driven_query.sql = "SELECT ?, ?, ?"
+    execute = mocker.patch.object(cursor, "execute")
+    mocker.patch.object(QueryResult, "from_cursor")
+    cursor._connection = mocker.Mock()
+
+    feed_driven_query(cursor, feed=open_feed(csv_path))
+    execute.assert_called_once_with("SELECT ?, ?, ?", [1, "alice", 0.5])
+
+
+def test_type_names_and_header_only(tmp_path, csv_path):
+    feed = open_feed(csv_path, types=["str", "str", "float"])
+    assert feed() == ["1", "alice", 0.5]
+    with pytest.raises(UnsupportedFeedError):
+        open_feed(csv_path, types=["decimal"])
+
+    header_only = tmp_path / "header.csv"
+    header_only.write_text("id,name\n")
+    feed = open_feed(header_only)
+    assert feed.header == ["id", "name"] and len(feed) == 0
+    with pytest.raises(FeedExhaustedError):
+        feed()
+
+
+def test_partitioned_mode_is_rejected_in_config(csv_path):
+    from mapz import Mapz
+
+    from dbload.context import Context
+
+    with pytest.raises(UnsupportedFeedError, match="partition"):
+        Context()._attach_feed("q", Mapz(path=str(csv_path), mode="partitioned"))
@@ -0,0 +1,116 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from dbload import scenario
+from dbload.load_shape import LoadShape, Ramp, Sine, Spike, Step, parse_shape
+from dbload.metrics_singleton import get_metrics
+from dbload.runner import Runner
+from dbload.exceptions import LoadShapeError
+
+from ..runner.test_runner import FakePool
+
+
+def test_parse_shapes():
+    ramp = parse_shape("ramp(10, 500, 10m)")
+    assert isinstance(ramp, Ramp)
+    assert ramp.target(0) == 10
+    assert ramp.target(300) == 255
+    assert ramp.target(3600) == 500
+    assert ramp.duration is None
+
+    step = parse_shape("step(10, 50, 2m, 500, 1h)")
+    assert isinstance(step, Step)
+    assert [step.target(t) for t in (0, 119, 120, 600, 36000)] == [10, 10, 60, 260, 500]
+    assert step.duration == 3600 and step.max_users == 500
+
+    spike = parse_shape("spike(50, 500, 5m, 30s)")
+    assert isinstance(spike, Spike)
+    assert [spike.target(t) for t in (0, 269, 270, 299, 300)] == [50, 50, 500, 500, 50]
+
+    sine = parse_shape("sine(250, 200, 24h)")
+    assert isinstance(sine, Sine)
+    assert sine.target(6 * 3600) == pytest.approx(450)
+    assert sine.max_users == 450
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "ramp(10, 500)",
+        "wave(1, 2, 3)",
+        "ramp(a, 500, 10m)",
+        "ramp 10",
+        "step(10, 50, 0, 500)",
+        "spike(50, 500, 0s, 0s)",
+        "sine(250, 200, 0h)",
+    ],
+)
+def test_parse_invalid(spec):
+    with pytest.raises(LoadShapeError):
+        parse_shape(spec)
+
+
+def test_runner_follows_shape(connection):
+    @scenario(infuse=False)
+    def shaped_scenario(con):
+        pass
+
+    runner = Runner(
+        ["shaped_scenario"],
+        shape=parse_shape("step(1, 2, 0.2s, 5, 0.5s)"),
+        think_time=0.01,
+        pool=FakePool(connection),
+    )
+    assert runner.users == 5
+    assert runner.duration == 0.5
+
+    seen = []
+    runner.start()
+    while runner.is_running():
+        seen.append((runner.target_users, runner.active_users))
+        time.sleep(0.01)
+        if runner.elapsed >= runner.duration:
+            runner.stop()
+    runner.wait()
+
+    targets = [t for t, _ in seen]
+    assert targets[0] == 1 and max(targets) == 5
+    assert all(active <= 5 for _, active in seen)
+    assert max(active for _, active in seen) > 1
+
+
+def test_idle_users_do_not_hold_connections(connection):
+    class OneOfThree(LoadShape):
+        duration = 0.2
+        max_users = 3
+
+        def target(self, t):
+            return 1
+
+    class CountingPool(FakePool):
+        borrowed = 0
+
+        @contextmanager
+        def connection(self, timeout=None):
+            CountingPool.borrowed += 1
+            yield self._connection
+
+    @scenario(infuse=False)
+    def idle_users_scenario(con):
+        pass
+
+    runner = Runner(
+        ["idle_users_scenario"],
+        shape=OneOfThree(),
+        think_time=0.01,
+        pool=CountingPool(connection),
+    )
+    runner.start()
+    time.sleep(0.2)
+    runner.stop()
+    runner.wait()
+
+    assert runner.users == 3
+    assert CountingPool.borrowed == 1
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from dbload.metrics import Histogram, Metrics, Snapshot
+
+
+@pytest.mark.parametrize("value", [0, 1, 31, 32, 33, 1000, 123456, 10 ** 9])
+def test_bucket_bounds(value):
+    i = Histogram.index(value)
+    assert Histogram.lower_bound(i) <= value <= Histogram.upper_bound(i)
+    # Relative error of a bucket is bounded
+    assert Histogram.upper_bound(i) - Histogram.lower_bound(i) <= max(value / 32, 1)
+
+
+def test_percentiles():
+    h = Histogram()
+    for v in range(1, 1001):
+        h.record(v)
+    assert h.count == 1000
+    assert h.min == 1 and h.max == 1000
+    assert h.percentile(50) == pytest.approx(500, rel=0.05)
+    assert h.percentile(99) == pytest.approx(990, rel=0.05)
+    assert h.count_le(100) == pytest.approx(100, abs=4)
+
+
+def test_merge_and_subtract():
+    a, b = Histogram(), Histogram()
+    for v in (10, 20, 30):
+        a.record(v)
+    early = a.copy()
+    for v in (1000, 2000):
+        a.record(v)
+        b.record(v)
+
+    delta = a.subtract(early)
+    assert delta.count == 2
+    assert delta.percentile(100) == pytest.approx(2000, rel=0.05)
+
+    merged = early.copy().merge(b)
+    assert merged.count == 5
+    assert merged.min == 10 and merged.max == 2000
+
+
+def test_per_thread_recorders_are_merged():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(100):
+            metrics.record_query("q", 1_000_000, rows=2)
+        metrics.record_query("q", 1_000_000, error=ValueError())
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    metrics.register_gauge("pool.in_use", lambda: 3)
+    snapshot = metrics.snapshot()
+    q = snapshot.queries["q"]
+    assert q.executions == 404
+    assert q.rows == 800
+    assert q.errors == {"ValueError": 4}
+    assert snapshot.gauges["pool.in_use"] == 3
+
+    restored = Snapshot.from_dict(snapshot.to_dict())
+    assert restored.queries["q"].latency.count == 404
+
+    metrics.reset()
+    assert metrics.snapshot().queries == {}
+
+
+def test_snapshot_while_threads_record():
+    import time
+
+    metrics = Metrics()
+    stop = threading.Event()
+    # Every error type is a new key in the errors of the live stats
+    errors = [type(f"Error{i}", (Exception,), {})() for i in range(50_000)]
+
+    def write(index):
+        i = 0
+        while not stop.is_set():
+            i += 1
+            metrics.record_query("q", i * 1000, 1, errors[(i * 4 + index) % len(errors)])
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for w in writers:
+        w.start()
+    try:
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            metrics.snapshot()
+    finally:
+        stop.set()
+        for w in writers:
+            w.join()
+
+
+def test_reset_drops_old_recorders():
+    metrics = Metrics()
+    metrics.record_query("before", 1000)
+    recorded = threading.Event()
+    reset = threading.Event()
+
+    def write():
+        metrics.record_query("before", 1000)
+        recorded.set()
+        reset.wait()
+        metrics.record_query("after", 1000)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    recorded.wait()
+    metrics.reset()
+    reset.set()
+    writer.join()
+
+    snapshot = metrics.snapshot()
+    assert "before" not in snapshot.queries
+    assert snapshot.queries["after"].executions == 1
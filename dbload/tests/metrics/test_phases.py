@@ -0,0 +1,105 @@
+from jpype import dbapi2
+
+from dbload import gather, query, get_context
+from dbload.dashboard import phase_table
+from dbload.exporter import render_openmetrics
+from dbload.metrics import Metrics, Snapshot
+from dbload.metrics_singleton import get_metrics
+from dbload.query_result import QueryResult
+
+
+def test_phases_are_recorded_and_merged():
+    metrics = Metrics()
+    metrics.record_query("q", 3_000_000, phases=dict(acquire=1_000_000, execute=2_000_000))
+    metrics.record_query("q", 1_000_000, phases=dict(execute=1_000_000))
+
+    snapshot = metrics.snapshot()
+    phases = snapshot.queries["q"].phases
+    assert phases["acquire"].count == 1
+    assert phases["execute"].count == 2
+    assert phases["execute"].total == 3000
+
+    text = render_openmetrics(snapshot)
+    assert 'dbload_query_phase_seconds_count{query="q",phase="execute"} 2' in text
+    assert "execute" in phase_table(snapshot).get_string()
+
+    restored = Snapshot.from_dict(snapshot.to_dict())
+    assert restored.queries["q"].phases["execute"].total == 3000
+    assert snapshot.merge(restored).queries["q"].phases["acquire"].count == 2
+
+
+def test_auto_query_records_phases(mocker):
+    class Cursor(dbapi2.Cursor):
+        def __init__(self):
+            self._closed = False
+            self._rowcount = -1
+            self._resultSet = object()
+            self._description = [("id",)]
+            self._connection = mocker.Mock(_converters={int: lambda v: v * 10})
+
+        def execute(self, operation, parameters=None):
+            self._executed = (operation, parameters)
+
+        def fetchall(self, *, types=None, converters=None):
+            assert converters is None
+            return [[1], [None]]
+
+    @query(auto=True)
+    def phased_query(cur):
+        pass  # pragma: no cover
+
+    get_context().queries.phased_query.sql = "SELECT ?"
+    get_metrics().reset()
+
+    cursor = Cursor()
+    result = phased_query(cursor, 5)
+
+    assert cursor._executed == ("SELECT ?", [5])
+    assert result.rows == [[10], [None]]
+    cursor._connection.commit.assert_called_once()
+
+    phases = get_metrics().snapshot().queries["phased_query"].phases
+    assert set(phases) == {"execute", "fetch", "convert", "commit"}
+
+
+def test_query_function_reports_fetch_phases(cursor, mocker):
+    @query
+    def manual_phased_query(cur):
+        return QueryResult.from_cursor(cur)
+
+    get_metrics().reset()
+    manual_phased_query(cursor)
+
+    phases = get_metrics().snapshot().queries["manual_phased_query"].phases
+    assert set(phases) == {"fetch", "convert"}
+
+
+def test_nested_query_keeps_outer_phases(cursor):
+    @query
+    def inner_phased_query(cur):
+        return QueryResult.from_cursor(cur)
+
+    @query
+    def outer_phased_query(cur):
+        inner_phased_query(cur)
+        return QueryResult.from_cursor(cur)
+
+    get_metrics().reset()
+    outer_phased_query(cursor)
+
+    phases = get_metrics().snapshot().queries["outer_phased_query"].phases
+    assert set(phases) == {"fetch", "convert"}
+
+
+def test_gather_records_acquire_phase(cursor, fanout):
+    @query
+    def gathered_phased_query(cur):
+        return QueryResult.from_cursor(cur)
+
+    get_metrics().reset()
+    gather(gathered_phased_query.defer())
+    gathered_phased_query(cursor)
+
+    phases = get_metrics().snapshot().queries["gathered_phased_query"].phases
+    assert phases["acquire"].count == 1
+    assert phases["fetch"].count == 2
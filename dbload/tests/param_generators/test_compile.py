@@ -0,0 +1,40 @@
+import pytest
+
+from dbload.param_generators import compile_generator, compile_generators
+from dbload.exceptions import ParameterGeneratorError
+
+
+def test_int_within_bounds():
+    gen = compile_generator("int(2,5)")
+    values = {gen() for _ in range(200)}
+    assert values <= {2, 3, 4, 5}
+
+
+def test_choice_and_seq():
+    assert compile_generator("choice(red,green)")() in ("red", "green")
+    seq = compile_generator("seq(10)")
+    assert [seq(), seq(), seq()] == [10, 11, 12]
+
+
+def test_faker_provider():
+    assert isinstance(compile_generator("faker.name")(), str)
+    assert 1 <= compile_generator("faker.random_int(1,3)")() <= 3
+
+
+def test_compile_many_keeps_order():
+    generate = compile_generators([("A", "const(1)"), ("B", "const('x')")])
+    assert generate() == [1, "x"]
+    assert compile_generators([]) is None
+
+
+@pytest.mark.parametrize("spec", ["nope(1)", "faker.not_a_provider", "int(1"])
+def test_bad_spec(spec):
+    with pytest.raises(ParameterGeneratorError):
+        compile_generator(spec)
+
+
+def test_keyword_and_quoted_arguments():
+    year = compile_generator("faker.date(pattern='%Y')")()
+    assert len(year) == 4 and year.isdigit()
+    assert compile_generator("choice('a,b', c)")() in ("a,b", "c")
+    assert compile_generator("int(low=3, high=3)")() == 3
@@ -0,0 +1,26 @@
+from dbload.query_parser import QueryParser
+
+
+SOURCE = """
+-- name: add_sale, param: EMP_ID=int(1,100), scenario: load
+-- param: SUBJECT=faker.sentence, AMOUNT=int(2,9999)
+INSERT INTO SALES (EMP_ID, SUBJECT, AMOUNT) VALUES (?, ?, ?);
+
+-- name: count_sales
+SELECT COUNT(*) FROM SALES;
+"""
+
+
+def test_params_from_name_and_param_lines():
+    parsed = QueryParser.parse([SOURCE])
+    assert parsed.add_sale.params == [
+        ("EMP_ID", "int(1,100)"),
+        ("SUBJECT", "faker.sentence"),
+        ("AMOUNT", "int(2,9999)"),
+    ]
+    assert parsed.add_sale.scenarios == [("load", 0)]
+
+
+def test_no_params():
+    parsed = QueryParser.parse([SOURCE])
+    assert parsed.count_sales.params == []
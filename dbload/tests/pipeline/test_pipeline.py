@@ -0,0 +1,86 @@
+import itertools
+import random
+import time
+
+import pytest
+
+from dbload import get_context, scenario
+from dbload.context import Context
+from dbload.metrics import Metrics
+from dbload.pipeline import Pipeline, attach_pipelines, detach_pipelines
+from dbload.exceptions import PipelineProducerError
+
+
+def test_pipeline_produces_values_in_order_of_one_producer():
+    counter = itertools.count()
+    pipeline = Pipeline("counter", lambda: next(counter), depth=10)
+    try:
+        assert [pipeline.get(timeout=1) for _ in range(20)] == list(range(20))
+    finally:
+        pipeline.stop()
+
+
+def test_pipeline_backpressure_and_gauges():
+    metrics = Metrics()
+    pipeline = Pipeline("bounded", lambda: 1, producers=2, depth=5, metrics=metrics)
+    try:
+        pipeline.get(timeout=1)
+        time.sleep(0.2)
+        gauges = metrics.snapshot().gauges
+        assert gauges["pipeline.bounded.depth"] == 5
+        assert gauges["pipeline.bounded.blocked"] >= 1
+        assert gauges["pipeline.bounded.starved"] <= 1
+    finally:
+        pipeline.stop()
+
+
+def test_pipeline_producer_failure():
+    def failing():
+        raise ValueError("bad generator")
+
+    pipeline = Pipeline("failing", failing, depth=2)
+    try:
+        with pytest.raises(PipelineProducerError, match="bad generator"):
+            pipeline.get(timeout=1)
+    finally:
+        pipeline.stop()
+
+
+def test_pipeline_processes_do_not_repeat_values():
+    pipeline = Pipeline("random", lambda: random.random(), producers=2, depth=20, mode="processes")
+    try:
+        values = [pipeline.get(timeout=5) for _ in range(40)]
+    finally:
+        pipeline.stop()
+    assert len(set(values)) == len(values)
+
+
+def test_scenario_params_come_from_pipeline(connection):
+    counter = itertools.count()
+    seen = []
+
+    @scenario(infuse=False, params=lambda: dict(value=next(counter)))
+    def pipeline_params_scenario(con, value):
+        seen.append(value)
+
+    ctx = get_context()
+    pipelines = attach_pipelines(ctx, depth=4)
+    try:
+        assert "pipeline_params_scenario" in [p.name for p in pipelines]
+        for _ in range(3):
+            pipeline_params_scenario(connection)
+        pipeline_params_scenario(connection, value=-1)
+    finally:
+        detach_pipelines(ctx)
+
+    assert seen == [0, 1, 2, -1]
+    assert ctx.scenarios.pipeline_params_scenario.pipeline is None
+
+
+def test_attach_skips_queries_with_feeds():
+    ctx = Context()
+    ctx.queries.generated = dict(generate=lambda: [1])
+    ctx.queries.fed = dict(generate=lambda: [1], feed=lambda: [2])
+    pipelines = attach_pipelines(ctx)
+    assert [p.name for p in pipelines] == ["generated"]
+    detach_pipelines(ctx)
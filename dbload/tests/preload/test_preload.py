@@ -0,0 +1,62 @@
+import multiprocessing
+
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+from dramatiq.cli import import_broker
+
+from dbload import query, scenario
+from dbload import preload as preload_module
+from dbload.context import Context
+from dbload.preload import is_preloaded, preload
+
+
+@query
+def preload_query(cur):
+    pass  # pragma: no cover
+
+
+@scenario(infuse=False)
+def preload_scenario(con):
+    pass  # pragma: no cover
+
+
+@pytest.fixture
+def workload(monkeypatch):
+    monkeypatch.setattr(preload_module, "_broker", None)
+    monkeypatch.setattr(dramatiq.broker, "global_broker", None)
+
+    ctx = Context()
+    ctx.queries.preload_query = dict(function=preload_query)
+    ctx.scenarios.preload_scenario = dict(function=preload_scenario)
+    ctx._is_infused = True
+    return ctx
+
+
+def test_preload_registers_actors_once(workload):
+    assert not is_preloaded()
+    broker = preload(workload, url="stub://")
+
+    assert is_preloaded()
+    assert dramatiq.get_broker() is broker
+    assert broker.get_declared_actors() == {"preload_query", "preload_scenario"}
+    assert preload(workload, url="stub://") is broker
+
+
+def _child(results):
+    module, broker = import_broker("dbload.preload:preload")
+    results.put((id(broker), sorted(broker.get_declared_actors())))
+
+
+def test_forked_workers_reuse_preloaded_broker(workload):
+    broker = preload(workload, url="stub://")
+
+    mp = multiprocessing.get_context("fork")
+    results = mp.Queue()
+    child = mp.Process(target=_child, args=(results,))
+    child.start()
+    broker_id, actors = results.get(timeout=10)
+    child.join()
+
+    assert broker_id == id(broker)
+    assert actors == ["preload_query", "preload_scenario"]
@@ -0,0 +1,100 @@
+import io
+from contextlib import contextmanager
+
+import pytest
+
+from dbload import query
+from dbload.replay import Replayer, ReplayRecord, read_log
+from dbload.exceptions import QueryExecutionError, ReplayLogFormatError
+
+
+class FakePool:
+    def __init__(self, connection):
+        self._connection = connection
+
+    @contextmanager
+    def connection(self, timeout=None):
+        yield self._connection
+
+
+def test_read_jsonl():
+    log = io.StringIO(
+        '{"ts": 10.0, "session": "a", "query": "q1", "params": [1]}\n'
+        "\n"
+        '{"ts": "1970-01-01T00:00:11+00:00", "session": "b", "sql": "SELECT 1"}\n'
+    )
+    records = list(read_log(log))
+    assert records == [
+        ReplayRecord(10.0, "a", "q1", [1]),
+        ReplayRecord(11.0, "b", "SELECT 1", []),
+    ]
+
+
+def test_read_csv():
+    log = io.StringIO('ts,session,statement,params\n1.5,s1,q1,"[1, ""x""]"\n')
+    assert list(read_log(log, "csv")) == [ReplayRecord(1.5, "s1", "q1", [1, "x"])]
+
+
+def test_read_malformed():
+    with pytest.raises(ReplayLogFormatError):
+        list(read_log(io.StringIO('{"session": "a"}\n')))
+
+
+def test_replay_keeps_session_order(connection):
+    calls = []
+
+    @query
+    def replayed_query(cur, value):
+        calls.append(value)
+
+    records = [
+        ReplayRecord(0.000, "s1", "replayed_query", [1]),
+        ReplayRecord(0.001, "s1", "replayed_query", [2]),
+        ReplayRecord(0.002, "s1", "replayed_query", [3]),
+    ]
+    replayer = Replayer(FakePool(connection), connections=4, speed=10.0)
+    stats = replayer.run(iter(records))
+
+    assert calls == [1, 2, 3]
+    assert stats.executed == 3
+    assert stats.sessions == 1
+
+
+def test_replay_stops_on_error(connection):
+    @query
+    def failing_replayed_query(cur):
+        raise RuntimeError("boom")
+
+    records = [ReplayRecord(0.0, "s1", "failing_replayed_query", [])]
+    with pytest.raises(QueryExecutionError):
+        Replayer(FakePool(connection), connections=1, speed=0).run(iter(records))
+
+
+def test_replay_counts_ignored_errors(connection):
+    @query
+    def flaky_replayed_query(cur, value):
+        if value % 2:
+            raise RuntimeError("boom")
+
+    records = [ReplayRecord(0.0, "s1", "flaky_replayed_query", [i]) for i in range(4)]
+    stats = Replayer(FakePool(connection), connections=1, speed=0, ignore=True).run(iter(records))
+
+    assert stats.executed == 4
+    assert stats.errors == 2
+
+
+def test_replay_fails_when_pool_is_unreachable():
+    class BrokenPool:
+        @contextmanager
+        def connection(self, timeout=None):
+            raise ConnectionError("database is down")
+            yield  # pragma: no cover
+
+    @query
+    def unreachable_replayed_query(cur):
+        pass  # pragma: no cover
+
+    # Many more records than the inboxes hold
+    records = [ReplayRecord(0.0, f"s{i}", "unreachable_replayed_query", []) for i in range(100)]
+    with pytest.raises(ConnectionError):
+        Replayer(BrokenPool(), connections=2, speed=0, queue_size=2).run(iter(records))
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from dbload import query, scenario
+from dbload.aio import AsyncConnection, AsyncRunner, run_scenario
+from dbload.metrics_singleton import get_metrics
+from dbload.exceptions import ConnectionTypeError, ScenarioExecutionError
+
+
+class CountingPool:
+    """Fake pool that tracks the largest number of borrowed connections."""
+
+    def __init__(self, connection, size):
+        self._connection = connection
+        self.size = size
+        self.in_use = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        with self._lock:
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield self._connection
+        finally:
+            with self._lock:
+                self.in_use -= 1
+
+
+def test_many_coroutine_users_share_small_pool(connection):
+    @query
+    def aio_blocking_query(cur):
+        threading.Event().wait(0.002)
+        return threading.current_thread().name
+
+    @scenario(infuse=False)
+    async def aio_scenario(con):
+        assert isinstance(con, AsyncConnection)
+        name = await con.query(aio_blocking_query)
+        assert name.startswith("dbload-executor")
+
+    pool = CountingPool(connection, size=3)
+    runner = AsyncRunner(
+        ["aio_scenario"], users=500, iterations=1000, think_time=0.01, pool=pool
+    )
+    runner.run()
+
+    assert get_metrics().snapshot().scenarios["aio_scenario"].executions == 1000
+    assert get_metrics().snapshot().queries["aio_blocking_query"].executions == 1000
+    assert pool.peak <= 3
+
+
+def test_sync_scenarios_run_on_executor(connection):
+    threads = set()
+
+    @scenario(infuse=False)
+    def aio_sync_scenario(con):
+        threads.add(threading.current_thread().name)
+
+    runner = AsyncRunner(
+        ["aio_sync_scenario"], users=20, iterations=50, pool=CountingPool(connection, 2)
+    )
+    runner.run()
+
+    assert len(threads) <= 2
+    assert get_metrics().snapshot().scenarios["aio_sync_scenario"].executions == 50
+
+
+def test_async_scenario_errors(connection):
+    @scenario(infuse=False)
+    async def aio_failing_scenario(con):
+        raise RuntimeError("boom")
+
+    with pytest.raises(ConnectionTypeError):
+        asyncio.run(aio_failing_scenario(connection))
+
+    with pytest.raises(ScenarioExecutionError):
+        run_scenario(aio_failing_scenario)
+
+    run_scenario(aio_failing_scenario, ignore=True)
+    stats = get_metrics().snapshot().scenarios["aio_failing_scenario"]
+    assert stats.errors == {"RuntimeError": 2}
+
+
+def test_async_scenario_takes_params(connection):
+    received = []
+
+    @scenario(infuse=False, params=lambda: dict(value=len(received)))
+    async def aio_params_scenario(con, value):
+        received.append(value)
+
+    run_scenario(aio_params_scenario)
+    run_scenario(aio_params_scenario)
+    run_scenario(aio_params_scenario, value=7)
+
+    assert received == [0, 1, 7]
@@ -0,0 +1,65 @@
+import time
+
+from dbload import scenario
+from dbload.find_max import SaturationFinder, saturation_table
+from dbload.metrics import Metrics
+from dbload.thresholds import parse_threshold
+
+from .test_runner import FakePool
+
+
+def test_finds_knee_of_saturated_resource(connection):
+    # Modelled resource serving 4 requests at a time, 10 ms each: beyond
+    # 4 users throughput stays flat and requests queue up
+    metrics = Metrics()
+    now = [0.0]
+
+    def sleep(seconds):
+        users = finder._level.users
+        latency_ns = 10_000_000 * max(users / 4, 1)
+        for _ in range(int(min(users, 4) * 100 * seconds)):
+            metrics.record_scenario("modelled_scenario", int(latency_ns))
+        now[0] += seconds
+
+    @scenario(infuse=False)
+    def modelled_scenario(con):
+        time.sleep(0.001)
+
+    finder = SaturationFinder(
+        ["modelled_scenario"],
+        max_users=16,
+        step_duration=10,
+        settle=1,
+        min_gain=0.2,
+        pool=FakePool(connection),
+        metrics=metrics,
+        clock=lambda: now[0],
+        sleep=sleep,
+    )
+    result = finder.run()
+
+    assert not finder.runner.is_running()
+    assert result.knee.users == 4
+    assert result.knee.throughput == 400
+    assert [s.users for s in result.steps] == [1, 2, 4, 8, 6, 5]
+    assert [s.verdict for s in result.steps] == ["ok", "ok", "ok", "plateau", "plateau", "plateau"]
+    assert "knee" in saturation_table(result).get_string()
+
+
+def test_slo_breach_stops_growth(connection):
+    @scenario(infuse=False)
+    def slow_scenario(con):
+        time.sleep(0.002)
+
+    finder = SaturationFinder(
+        ["slow_scenario"],
+        max_users=4,
+        step_duration=0.1,
+        settle=0.0,
+        slo=[parse_threshold("p50 < 0.1ms")],
+        pool=FakePool(connection),
+    )
+    result = finder.run()
+
+    assert result.knee is None
+    assert [s.verdict for s in result.steps] == ["slo"]
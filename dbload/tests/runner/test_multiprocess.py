@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+
+import pytest
+
+from dbload import scenario
+from dbload.load_shape import parse_shape
+from dbload.multiprocess import ProcessRunner
+
+from .test_runner import FakePool
+
+
+def test_processes_split_work_and_merge_metrics(connection, mocker):
+    @scenario(infuse=False)
+    def multiprocess_scenario(con):
+        pids.put(os.getpid())
+
+    pids = multiprocessing.get_context("fork").SimpleQueue()
+    # Children cannot share the fixture connection, give them a fake pool
+    mocker.patch(
+        "dbload.runner.ConnectionPool", side_effect=lambda size: FakePool(connection)
+    )
+
+    snapshots = []
+    runner = ProcessRunner(
+        ["multiprocess_scenario"], processes=3, users=4, iterations=30, interval=0.05
+    )
+    runner.on_snapshot(lambda source, snapshot: snapshots.append(source))
+    runner.run()
+
+    stats = runner.snapshot().scenarios["multiprocess_scenario"]
+    assert stats.executions == 30
+    assert {"process-0", "process-1", "process-2"} <= set(snapshots)
+    assert runner.elapsed > 0
+    # Scenarios ran in the children only, every one of them took a share
+    executed_by = set()
+    while not pids.empty():
+        executed_by.add(pids.get())
+    assert executed_by == {child.pid for child in runner._children}
+    assert os.getpid() not in executed_by
+
+
+def test_child_options_are_split():
+    @scenario(infuse=False)
+    def multiprocess_options_scenario(con):
+        pass
+
+    runner = ProcessRunner(
+        ["multiprocess_options_scenario"],
+        processes=4,
+        users=10,
+        iterations=7,
+        warmup_iterations=4,
+        shape=parse_shape("ramp(0, 8, 1m)"),
+    )
+    options = [runner._child_options(i) for i in range(4)]
+    assert [o["iterations"] for o in options] == [2, 2, 2, 1]
+    assert [o["warmup_iterations"] for o in options] == [1, 1, 1, 1]
+    assert options[0]["shape"].target(60) == 2
+    assert runner.users == 8
+
+
+@pytest.mark.parametrize("flag", ["--processes", "-j"])
+def test_run_command_parses_processes(flag):
+    from dbload.cli import run
+
+    ctx = run.make_context("run", [flag, "4", "-p", "sap-hana"])
+    assert ctx.params["processes"] == 4
+    assert ctx.params["predefined"] == "sap-hana"
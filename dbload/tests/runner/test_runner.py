@@ -0,0 +1,129 @@
+import io
+from contextlib import contextmanager
+
+import pytest
+
+from dbload import scenario
+from dbload.dashboard import Dashboard, sparkline, summary_table
+from dbload.metrics import Metrics
+from dbload.metrics_singleton import get_metrics
+from dbload.runner import Runner
+from dbload.exceptions import ScenarioNotFoundError
+
+
+class FakePool:
+    size = 2
+    in_use = 0
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    @contextmanager
+    def connection(self, timeout=None):
+        yield self._connection
+
+    def close(self):
+        pass
+
+
+def test_runner_iterations(connection):
+    calls = []
+
+    @scenario(infuse=False)
+    def runner_iterations_scenario(con):
+        calls.append(con)
+
+    runner = Runner(
+        ["runner_iterations_scenario"],
+        users=3,
+        iterations=10,
+        pool=FakePool(connection),
+    )
+    runner.run()
+
+    assert len(calls) == 10
+    stats = get_metrics().snapshot().scenarios["runner_iterations_scenario"]
+    assert stats.executions == 10
+
+
+def test_runner_survives_scenario_errors(connection):
+    @scenario(infuse=False)
+    def runner_failing_scenario(con):
+        raise RuntimeError("boom")
+
+    runner = Runner(
+        ["runner_failing_scenario"], iterations=3, pool=FakePool(connection)
+    )
+    runner.run()
+
+    stats = get_metrics().snapshot().scenarios["runner_failing_scenario"]
+    assert stats.errors == {"RuntimeError": 3}
+
+
+def test_runner_unknown_scenario():
+    with pytest.raises(ScenarioNotFoundError):
+        Runner(["no_such_scenario"])
+
+
+def test_sparkline():
+    assert sparkline([0, 1, 2, 4]) == "▁▂▄█"
+    assert sparkline([]) == ""
+
+
+def test_dashboard_render():
+    metrics = Metrics()
+    metrics.record_query("select_all", 2_000_000, rows=1)
+    metrics.register_gauge("pool.size", lambda: 4)
+    metrics.register_gauge("pool.in_use", lambda: 1)
+
+    stream = io.StringIO()
+    Dashboard(metrics, stream=stream).draw()
+    output = stream.getvalue()
+    assert "select_all" in output
+    assert "pool 1/4" in output
+
+    assert "select_all" in str(summary_table(metrics.snapshot(), elapsed=1.0))
+
+
+def test_runner_warmup_iterations(connection):
+    @scenario(infuse=False)
+    def runner_warmup_scenario(con):
+        pass
+
+    ended = []
+    runner = Runner(
+        ["runner_warmup_scenario"],
+        users=2,
+        iterations=10,
+        warmup_iterations=5,
+        pool=FakePool(connection),
+    )
+    runner.on_warmup_end(ended.append)
+    runner.run()
+
+    assert not runner.warming_up
+    assert runner.measured_from >= runner.started_at
+    assert len(ended) == 1 and ended[0] is runner.warmup_snapshot
+    warmup = runner.warmup_snapshot.scenarios["runner_warmup_scenario"]
+    measured = get_metrics().snapshot().scenarios["runner_warmup_scenario"]
+    assert warmup.executions == 5
+    assert measured.executions == 10
+
+
+def test_runner_warmup_duration(connection):
+    @scenario(infuse=False)
+    def runner_timed_warmup_scenario(con):
+        pass
+
+    runner = Runner(
+        ["runner_timed_warmup_scenario"],
+        duration=0.2,
+        warmup=0.2,
+        think_time=0.01,
+        pool=FakePool(connection),
+    )
+    runner.run()
+
+    assert runner.warmup_snapshot.scenarios["runner_timed_warmup_scenario"].executions
+    assert get_metrics().snapshot().scenarios["runner_timed_warmup_scenario"].executions
+    assert runner.finished_at - runner.started_at >= 0.4
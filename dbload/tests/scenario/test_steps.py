@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from dbload import get_context, query, return_random, scenario
+from dbload.metrics_singleton import get_metrics
+from dbload.exceptions import QueryExecutionError, ScenarioExecutionError
+
+
+def test_generator_scenario_receives_results(connection):
+    @query
+    def steps_lookup(cur, value):
+        return value * 2
+
+    @scenario(infuse=False)
+    def steps_scenario(con):
+        doubled = yield steps_lookup.defer(21)
+        return doubled
+
+    assert steps_scenario(connection) == 42
+    scenarios = get_metrics().snapshot().scenarios
+    assert scenarios["steps_scenario/steps_lookup"].executions == 1
+    assert scenarios["steps_scenario"].executions == 1
+
+
+def test_independent_steps_run_concurrently(connection, fanout):
+    @query
+    def steps_slow(cur, value):
+        time.sleep(0.1)
+        return value, threading.current_thread().name
+
+    @scenario(infuse=False)
+    def steps_concurrent_scenario(con):
+        results = yield [steps_slow.defer(1), steps_slow.defer(2)]
+        return results
+
+    started = time.perf_counter()
+    results = steps_concurrent_scenario(connection)
+
+    assert time.perf_counter() - started < 0.19
+    assert [r[0] for r in results] == [1, 2]
+    assert results[0][1] != results[1][1]
+
+
+def test_consecutive_inserts_are_batched(connection, cursor, fanout):
+    batches = []
+
+    def executemany(sql, seq):
+        batches.append((sql, list(seq)))
+        cursor._rowcount = len(batches[-1][1])
+
+    cursor.executemany = executemany
+
+    @query(auto=True)
+    def steps_insert(cur):
+        pass  # pragma: no cover
+
+    get_context().queries.steps_insert.sql = "INSERT INTO T VALUES (?, ?)"
+
+    @query
+    def steps_other(cur):
+        return "other"
+
+    @scenario(infuse=False)
+    def steps_batch_scenario(con):
+        results = yield [
+            steps_insert.defer(1, "a"),
+            steps_insert.defer(2, b="b"),
+            steps_other.defer(),
+        ]
+        return results
+
+    first, second, other = steps_batch_scenario(connection)
+
+    assert batches == [("INSERT INTO T VALUES (?, ?)", [[1, "a"], [2, "b"]])]
+    assert first is second and first.rowcount == 2
+    assert other == "other"
+    assert connection._num_commit_called == 1
+    assert get_metrics().snapshot().queries["steps_insert"].rows == 2
+
+
+def test_select_steps_are_not_batched(connection, cursor, fanout):
+    cursor.executemany = lambda sql, seq: pytest.fail("batched")
+    cursor.fetchall = lambda **kwargs: [[7, "John"]]
+    cursor._connection = connection
+
+    @query(auto=True)
+    def steps_find_by_id(cur):
+        pass  # pragma: no cover
+
+    get_context().queries.steps_find_by_id.sql = "-- lookup\nSELECT ID, NAME FROM T WHERE ID = ?"
+
+    @scenario(infuse=False)
+    def steps_select_scenario(con):
+        results = yield [steps_find_by_id.defer(1), steps_find_by_id.defer(2)]
+        return results
+
+    first, second = steps_select_scenario(connection)
+
+    assert first is not second
+    assert first.rows == second.rows == [[7, "John"]]
+    assert cursor._num_execute_called == 2
+    assert get_metrics().snapshot().queries["steps_find_by_id"].executions == 2
+
+
+def test_random_rows_are_not_batched(connection, cursor, fanout):
+    cursor.executemany = lambda sql, seq: pytest.fail("batched")
+    cursor.fetchall = lambda **kwargs: [[1], [2], [3]]
+    cursor._connection = connection
+
+    @return_random
+    @query(auto=True)
+    def steps_pick(cur):
+        pass  # pragma: no cover
+
+    get_context().queries.steps_pick.sql = "SELECT ID FROM T WHERE A = ?"
+
+    @scenario(infuse=False)
+    def steps_random_scenario(con):
+        results = yield [steps_pick.defer(1), steps_pick.defer(2)]
+        return results
+
+    results = steps_random_scenario(connection)
+
+    assert [len(r.rows) for r in results] == [1, 1]
+    scenarios = get_metrics().snapshot().scenarios
+    assert scenarios["steps_random_scenario/steps_pick_return_random"].executions == 1
+
+
+def test_failed_step_is_thrown_into_scenario(connection):
+    @query
+    def steps_failing(cur):
+        raise RuntimeError("boom")
+
+    @scenario(infuse=False)
+    def steps_handling_scenario(con):
+        try:
+            yield steps_failing.defer()
+        except QueryExecutionError:
+            return "handled"
+
+    @scenario(infuse=False)
+    def steps_unhandled_scenario(con):
+        yield steps_failing.defer()
+
+    assert steps_handling_scenario(connection) == "handled"
+    with pytest.raises(ScenarioExecutionError):
+        steps_unhandled_scenario(connection)
+    assert get_metrics().snapshot().scenarios["steps_unhandled_scenario/steps_failing"].errors
+
+
+def test_yielding_wrong_type(connection):
+    @scenario(infuse=False)
+    def steps_wrong_scenario(con):
+        yield "SELECT 1"
+
+    with pytest.raises(ScenarioExecutionError, match="query.defer"):
+        steps_wrong_scenario(connection)
@@ -0,0 +1,107 @@
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+from dramatiq.brokers.stub import StubBroker
+
+from dbload.rate_scheduler import Rate, RateScheduler, broker_publisher, broker_queue_depth
+from dbload.exceptions import ScheduleRateError
+
+
+@pytest.fixture
+def broker():
+    broker = StubBroker()
+    broker.emit_after("process_boot")
+
+    @dramatiq.actor(broker=broker, actor_name="bp_actor")
+    def bp_actor():
+        pass  # pragma: no cover
+
+    yield broker
+    broker.close()
+
+
+def scheduler_for(broker, **options):
+    scheduler = RateScheduler(
+        {"bp_actor": Rate(100, jitter="none", burst=100, **options)},
+        broker_publisher(broker),
+        depth=broker_queue_depth(broker),
+        check_interval=0.1,
+    )
+    scheduler.reset(0.0)
+    return scheduler
+
+
+def run(scheduler, start, seconds, tick=0.01):
+    for i in range(1, int(seconds / tick) + 1):
+        scheduler.step(start + i * tick)
+
+
+def depth(broker):
+    return broker.queues["default"].qsize()
+
+
+def test_policy_options():
+    assert Rate(1, max_depth=10).policy == "throttle"
+    assert Rate(1, max_lag="30s").max_lag == 30.0
+    with pytest.raises(ScheduleRateError):
+        Rate(1, policy="shed")
+    with pytest.raises(ScheduleRateError):
+        Rate(1, policy="drop", max_depth=1)
+
+
+def test_without_policy_queue_grows(broker):
+    scheduler = scheduler_for(broker)
+    run(scheduler, 0.0, 5)
+    assert depth(broker) == pytest.approx(500, abs=2)
+
+
+def test_throttle_defers_and_recovers(broker):
+    scheduler = scheduler_for(broker, max_depth=50, policy="throttle")
+    run(scheduler, 0.0, 5)
+
+    stats = scheduler.stats()["bp_actor"]
+    # Publishing stops within one check interval after the limit
+    assert 50 <= depth(broker) <= 61
+    assert stats.deferred > 0
+    assert stats.dropped > 0
+    assert stats.depth == depth(broker)
+
+    # Workers drain the queue, deferred messages are sent afterwards
+    broker.flush("default")
+    run(scheduler, 5.0, 0.2)
+    assert depth(broker) >= 100
+
+
+def test_shed_drops(broker):
+    scheduler = scheduler_for(broker, max_depth=50, policy="shed")
+    run(scheduler, 0.0, 5)
+
+    stats = scheduler.stats()["bp_actor"]
+    assert depth(broker) <= 61
+    assert stats.dropped == pytest.approx(500 - depth(broker), abs=2)
+    assert stats.deferred == 0
+
+
+def test_coalesce_sends_one_message_per_tick(broker):
+    scheduler = RateScheduler(
+        {"bp_actor": Rate(1000, jitter="none", max_depth=50, policy="coalesce")},
+        broker_publisher(broker),
+        depth=broker_queue_depth(broker),
+        check_interval=0.1,
+    )
+    scheduler.reset(0.0)
+    run(scheduler, 0.0, 1)
+
+    stats = scheduler.stats()["bp_actor"]
+    # After the limit is hit, every 10ms tick sends one of ten messages
+    assert depth(broker) < 200
+    assert stats.dropped == pytest.approx(1000 - depth(broker), abs=2)
+
+
+def test_consumer_lag(broker):
+    scheduler = scheduler_for(broker, max_lag=2.0)
+    run(scheduler, 0.0, 0.5)
+    # Nothing is consumed, so the lag is infinite
+    stats = scheduler.stats()["bp_actor"]
+    assert stats.lag == float("inf")
+    assert stats.deferred > 0
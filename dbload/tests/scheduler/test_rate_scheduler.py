@@ -0,0 +1,92 @@
+import pytest
+from mapz import Mapz
+
+from dbload.rate_scheduler import Rate, RateScheduler, is_rate, parse_rate, split_schedule
+from dbload.exceptions import ScheduleRateError
+
+
+def test_parse_rate():
+    assert parse_rate("300/s") == 300
+    assert parse_rate("30 / m") == 0.5
+    assert parse_rate("7.2/h") == pytest.approx(0.002)
+    with pytest.raises(ScheduleRateError):
+        parse_rate("300")
+
+
+def test_split_schedule():
+    crontabs, rates = split_schedule(
+        Mapz(
+            create_sale="300/s",
+            update_client=dict(rate="20/m", jitter="none", burst=5),
+            teardown="0 3 * * *",
+        )
+    )
+    assert crontabs == {"teardown": "0 3 * * *"}
+    assert rates["create_sale"] == Rate(300, "poisson", 300)
+    assert rates["update_client"] == Rate(1 / 3, "none", 5)
+    assert not is_rate("*/5 * * * *")
+
+    with pytest.raises(ScheduleRateError):
+        split_schedule(Mapz(create_sale=dict(rate="1/s", bursts=2)))
+    with pytest.raises(ScheduleRateError, match="positive"):
+        split_schedule(Mapz(create_sale="0/s"))
+    with pytest.raises(ScheduleRateError):
+        Rate(-1)
+
+
+def run(scheduler, seconds, tick=0.01, start=0.0):
+    sent = {}
+    steps = int(seconds / tick)
+    for i in range(1, steps + 1):
+        for name, count in scheduler.step(start + i * tick).items():
+            sent[name] = sent.get(name, 0) + count
+    return sent
+
+
+def test_even_rate():
+    published = []
+    scheduler = RateScheduler(
+        {"a": Rate(100, jitter="none")},
+        lambda name, count: published.append(count),
+    )
+    scheduler.reset(0.0)
+    sent = run(scheduler, 10)
+    assert sent["a"] == pytest.approx(1000, abs=1)
+    # Messages are spread over the ticks, not sent in bursts
+    assert max(published) <= 2
+
+
+def test_poisson_rate():
+    scheduler = RateScheduler({"a": Rate(300)}, lambda name, count: None, seed=1)
+    scheduler.reset(0.0)
+    sent = run(scheduler, 20)
+    assert sent["a"] == pytest.approx(6000, rel=0.05)
+    assert scheduler.stats()["a"].sent == sent["a"]
+
+
+def test_catch_up_is_limited_to_burst():
+    published = []
+    scheduler = RateScheduler(
+        {"a": Rate(100, jitter="none", burst=50)},
+        lambda name, count: published.append(count),
+    )
+    scheduler.reset(0.0)
+    run(scheduler, 1)
+
+    # Scheduler was stalled for 10 seconds
+    due = scheduler.step(11.0)
+    assert due == {"a": 50}
+    assert scheduler.stats()["a"].skipped == pytest.approx(950, abs=2)
+
+    # and continues at the normal rate afterwards
+    assert run(scheduler, 1, start=11.0)["a"] == pytest.approx(100, abs=2)
+
+
+def test_failed_publish_is_not_counted():
+    def publish(name, count):
+        raise ConnectionError("broker is down")
+
+    scheduler = RateScheduler({"a": Rate(100, jitter="none")}, publish)
+    scheduler.reset(0.0)
+    run(scheduler, 1)
+    assert scheduler.stats()["a"].sent == 0
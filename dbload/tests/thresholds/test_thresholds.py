@@ -0,0 +1,81 @@
+import pytest
+
+from dbload.metrics import Metrics
+from dbload.thresholds import (
+    ThresholdMonitor,
+    evaluate,
+    parse_threshold,
+    threshold_table,
+)
+from dbload.exceptions import ThresholdSyntaxError
+
+
+@pytest.mark.parametrize(
+    "text,target,metric,op,value",
+    [
+        ("create_sale.p99 < 20ms", "create_sale", "p99", "<", 20.0),
+        ("error_rate < 0.1%", None, "error_rate", "<", 0.001),
+        ("throughput > 5000/s", None, "throughput", ">", 5000.0),
+        ("q.p99.9 <= 1.5s", "q", "p99.9", "<=", 1500.0),
+        ("mean<300us", None, "mean", "<", 0.3),
+        ("errors == 0", None, "errors", "==", 0.0),
+    ],
+)
+def test_parse(text, target, metric, op, value):
+    t = parse_threshold(text)
+    assert (t.target, t.metric, t.op) == (target, metric, op)
+    assert t.value == pytest.approx(value)
+
+
+@pytest.mark.parametrize(
+    "text", ["p99 20ms", "latency < 5ms", "error_rate < 5ms", "p101 < 1ms", "throughput > 5%"]
+)
+def test_parse_invalid(text):
+    with pytest.raises(ThresholdSyntaxError):
+        parse_threshold(text)
+
+
+def _metrics():
+    metrics = Metrics()
+    for i in range(100):
+        metrics.record_scenario("s", 10_000_000, error=ValueError() if i < 2 else None)
+        metrics.record_query("q", 1_000_000)
+    return metrics
+
+
+def test_evaluate():
+    thresholds = [
+        parse_threshold(text)
+        for text in (
+            "s.p99 < 20ms",
+            "q.max < 0.5ms",
+            "error_rate < 1%",
+            "throughput > 50/s",
+            "missing.p50 < 1ms",
+        )
+    ]
+    measured, violations = evaluate(thresholds, _metrics().snapshot(), elapsed=1.0)
+    assert [v.threshold.text for v in violations] == [
+        "q.max < 0.5ms",
+        "error_rate < 1%",
+        "missing.p50 < 1ms",
+    ]
+    assert dict((t.text, a) for t, a in measured)["error_rate < 1%"] == pytest.approx(0.02)
+    assert "FAILED" in threshold_table(measured).get_string()
+
+    # In the middle of the run missing data and throughput are not violations
+    _, violations = evaluate(thresholds, _metrics().snapshot(), elapsed=1.0, final=False)
+    assert len(violations) == 2
+
+
+def test_monitor_aborts_once_after_grace():
+    calls = []
+    monitor = ThresholdMonitor(
+        [parse_threshold("p50 < 5ms")], _metrics(), grace=10, on_violation=calls.append
+    )
+    monitor.check(elapsed=5)
+    assert calls == []
+    monitor.check(elapsed=11)
+    monitor.check(elapsed=12)
+    assert len(calls) == 1
+    assert monitor.violations[0].actual == pytest.approx(10, rel=0.05)
@@ -0,0 +1,58 @@
+from dbload.trace import TraceRecorder, merge_traces, read_trace, summarize
+
+
+def test_record_and_read(tmp_path):
+    recorder = TraceRecorder(tmp_path / "trace-1.bin", capacity=10)
+    recorder.record("select_all", 100, 2_000_000, rows=5)
+    recorder.record("add_sale", 50, 1_000_000, error=ValueError("bad"))
+    recorder.close()
+
+    records = read_trace(tmp_path / "trace-1.bin")
+    assert [r.query for r in records] == ["add_sale", "select_all"]
+    assert records[0].error == "ValueError"
+    assert records[1].rows == 5
+    assert records[1].error == ""
+
+
+def test_ring_keeps_latest(tmp_path):
+    recorder = TraceRecorder(tmp_path / "ring.bin", capacity=3)
+    for i in range(5):
+        recorder.record("q", i, 10)
+    recorder.close()
+
+    assert [r.start_ns for r in read_trace(tmp_path / "ring.bin")] == [2, 3, 4]
+
+
+def test_merge_and_summarize(tmp_path):
+    for pid, starts in ((1, (1, 3)), (2, (2, 4))):
+        recorder = TraceRecorder(tmp_path / f"trace-{pid}.bin", capacity=10)
+        for start in starts:
+            recorder.record("q", start, start * 1_000_000, rows=1)
+        recorder.close()
+
+    paths = [tmp_path / "trace-1.bin", tmp_path / "trace-2.bin"]
+    assert [r.start_ns for r in merge_traces(paths)] == [1, 2, 3, 4]
+
+    summary = summarize(merge_traces(paths))
+    assert summary["q"]["count"] == 4
+    assert summary["q"]["rows"] == 4
+    assert summary["q"]["max_ms"] == 4.0
+
+
+def test_concurrent_records_keep_count(tmp_path):
+    import threading
+
+    recorder = TraceRecorder(tmp_path / "threads.bin", capacity=10_000)
+
+    def write():
+        for i in range(1000):
+            recorder.record("q", i, 10)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    recorder.close()
+
+    assert len(read_trace(tmp_path / "threads.bin")) == 4000
@@ -0,0 +1,286 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Service level thresholds that make a run fail.
+
+Thresholds are declared as short expressions in the ``thresholds`` list
+of the config file::
+
+    "thresholds": [
+        "create_sale.p99 < 20ms",
+        "error_rate < 0.1%",
+        "throughput > 5000/s"
+    ]
+
+The optional prefix names a scenario or a query. Without it the
+threshold applies to all scenarios together (or all queries, when no
+scenarios were executed). Supported metrics are percentiles (``p50``,
+``p99``, ``p99.9``, ...), ``mean``, ``max``, ``error_rate``, ``errors``
+and ``throughput``.
+"""
+
+import operator
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+from prettytable import PrettyTable
+
+from .metrics import Histogram, Metrics, Snapshot, Stats
+from .exceptions import ThresholdSyntaxError
+
+
+# Exit code of "dbload run" when thresholds are violated
+THRESHOLDS_FAILED_EXIT_CODE = 99
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+}
+
+# Multipliers converting values with units into ms, fractions and ops/s
+UNITS = {
+    "latency": {None: 1.0, "ms": 1.0, "s": 1000.0, "us": 0.001, "µs": 0.001},
+    "error_rate": {None: 1.0, "%": 0.01},
+    "throughput": {None: 1.0, "/s": 1.0, "/m": 1 / 60},
+    "errors": {None: 1.0},
+}
+
+threshold_regex = re.compile(
+    r"^\s*(?:(?P<target>[\w.$-]+)\.)?"
+    r"(?P<metric>p\d+(?:\.\d+)?|mean|max|error_rate|errors|throughput)"
+    r"\s*(?P<op><=|>=|==|<|>)\s*"
+    r"(?P<value>\d+(?:\.\d*)?|\.\d+)\s*(?P<unit>ms|s|us|µs|%|/s|/m)?\s*$"
+)
+
+
+@dataclass
+class Threshold:
+    """Parsed threshold.
+
+    Attributes:
+        text (str): Original declaration.
+        target (str): Scenario or query name, ``None`` for the whole run.
+        metric (str): Name of the metric, e.g. ``p99`` or ``error_rate``.
+        op (str): Comparison operator.
+        value (float): Limit in ms for latency, as a fraction for error
+            rate and in operations per second for throughput.
+    """
+
+    text: str
+    target: Optional[str]
+    metric: str
+    op: str
+    value: float
+
+    @property
+    def kind(self) -> str:
+        if self.metric in ("error_rate", "errors", "throughput"):
+            return self.metric
+        return "latency"
+
+    def check(self, actual: float) -> bool:
+        return OPERATORS[self.op](actual, self.value)
+
+
+@dataclass
+class Violation:
+    threshold: Threshold
+    actual: float
+
+
+def parse_threshold(text: str) -> Threshold:
+    """Parse threshold declaration like ``create_sale.p99 < 20ms``.
+
+    Raises:
+        ThresholdSyntaxError: when the declaration cannot be parsed.
+    """
+
+    m = threshold_regex.match(text)
+    if not m:
+        raise ThresholdSyntaxError(text, "expected '[name.]metric <op> value[unit]'")
+
+    t = Threshold(
+        text=text.strip(),
+        target=m.group("target"),
+        metric=m.group("metric"),
+        op=m.group("op"),
+        value=float(m.group("value")),
+    )
+    units = UNITS[t.kind]
+    unit = m.group("unit")
+    if unit not in units:
+        raise ThresholdSyntaxError(text, f"unit '{unit}' does not apply to {t.metric}")
+    t.value *= units[unit]
+    if t.metric.startswith("p") and not 0 < float(t.metric[1:]) <= 100:
+        raise ThresholdSyntaxError(text, "percentile must be between 0 and 100")
+    return t
+
+
+def parse_thresholds(texts: List[str]) -> List[Threshold]:
+    return [parse_threshold(text) for text in texts or []]
+
+
+def _stats_of(threshold: Threshold, snapshot: Snapshot) -> Optional[Stats]:
+    if threshold.target is not None:
+        return snapshot.scenarios.get(threshold.target) or snapshot.queries.get(
+            threshold.target
+        )
+    merged = Stats()
+    for s in (snapshot.scenarios or snapshot.queries).values():
+        merged.merge(s)
+    return merged
+
+
+def measure(threshold: Threshold, snapshot: Snapshot, elapsed: float) -> Optional[float]:
+    """Get value of the threshold's metric, ``None`` if there is no data."""
+
+    stats = _stats_of(threshold, snapshot)
+    if stats is None or not stats.executions:
+        return None
+
+    if threshold.metric == "error_rate":
+        return stats.error_rate
+    if threshold.metric == "errors":
+        return float(stats.error_count)
+    if threshold.metric == "throughput":
+        return stats.executions / elapsed if elapsed else 0.0
+
+    h: Histogram = stats.latency
+    if threshold.metric == "mean":
+        return h.mean / 1000
+    if threshold.metric == "max":
+        return h.max / 1000
+    return h.percentile(float(threshold.metric[1:])) / 1000
+
+
+def evaluate(
+    thresholds: List[Threshold],
+    snapshot: Snapshot,
+    elapsed: float,
+    final: bool = True,
+) -> Tuple[List[Tuple[Threshold, Optional[float]]], List[Violation]]:
+    """Evaluate thresholds against a snapshot.
+
+    Thresholds without data are violated only in the ``final``
+    evaluation. Throughput is only meaningful for the whole run and is
+    checked in the ``final`` evaluation only.
+
+    Returns:
+        Tuple of all measured values and the list of violations.
+    """
+
+    measured = []
+    violations = []
+    for t in thresholds:
+        actual = measure(t, snapshot, elapsed)
+        measured.append((t, actual))
+        if not final and (actual is None or t.kind == "throughput"):
+            continue
+        if actual is None or not t.check(actual):
+            violations.append(Violation(t, actual if actual is not None else float("nan")))
+    return measured, violations
+
+
+def threshold_table(measured: List[Tuple[Threshold, Optional[float]]]) -> PrettyTable:
+    """Build table with the result of every threshold."""
+
+    pt = PrettyTable(["Threshold", "Actual", "Result"])
+    for t, actual in measured:
+        if actual is None:
+            shown, ok = "no data", False
+        else:
+            if t.kind == "latency":
+                shown = f"{actual:.2f}ms"
+            elif t.kind == "error_rate":
+                shown = f"{actual * 100:.3f}%"
+            elif t.kind == "throughput":
+                shown = f"{actual:.1f}/s"
+            else:
+                shown = f"{actual:.0f}"
+            ok = t.check(actual)
+        pt.add_row([t.text, shown, "ok" if ok else "FAILED"])
+    pt.align = "l"
+    pt.align["Actual"] = "r"
+    return pt
+
+
+class ThresholdMonitor:
+    """Evaluate thresholds periodically while the run is in progress.
+
+    Args:
+        thresholds (List[Threshold]): Thresholds to check.
+        metrics (Metrics): Metrics of the run.
+        interval (float): Seconds between evaluations.
+        grace (float): Seconds after start during which violations do
+            not abort the run, so that percentiles can settle.
+        on_violation (Callable): Called once with the violations found
+            by the first failed evaluation, e.g. to abort the run.
+        snapshot (Callable): Alternative source of snapshots.
+    """
+
+    def __init__(
+        self,
+        thresholds: List[Threshold],
+        metrics: Optional[Metrics] = None,
+        interval: float = 1.0,
+        grace: float = 0.0,
+        on_violation: Optional[Callable[[List[Violation]], None]] = None,
+        snapshot: Optional[Callable[[], Snapshot]] = None,
+    ) -> None:
+        self.thresholds = thresholds
+        self.interval = interval
+        self.grace = grace
+        self.on_violation = on_violation
+        self._take_snapshot = snapshot or metrics.snapshot
+        self.violations: List[Violation] = []
+        self._started = time.time()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self, elapsed: float) -> List[Violation]:
+        """Evaluate thresholds once in the middle of the run."""
+
+        _, violations = evaluate(
+            self.thresholds, self._take_snapshot(), elapsed, final=False
+        )
+        if violations and elapsed >= self.grace and not self.violations:
+            self.violations = violations
+            for v in violations:
+                logger.warning(f"Threshold '{v.threshold.text}' violated: {v.actual}")
+            if self.on_violation is not None:
+                self.on_violation(violations)
+        return violations
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check(time.time() - self._started)
+
+    def start(self) -> None:
+        self._started = time.time()
+        self._thread = threading.Thread(
+            target=self._loop, name="dbload-thresholds", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
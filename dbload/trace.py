@@ -0,0 +1,290 @@
+# Copyright 2020-2021 Dynatrace LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact binary trace of executed statements.
+
+Every executed query is recorded as a fixed-size binary record in a
+per-process ring file. The file is memory-mapped, so recording a
+statement costs a single ``struct.pack_into`` call instead of a
+formatted log line.
+
+File layout::
+
+    header:  magic(4s) version(H) record_size(H) capacity(Q) count(Q) pid(Q)
+    records: query_id(I) start_ns(q) duration_ns(q) rows(q) error(i) worker(I)
+
+``count`` is the total number of records ever written. When it exceeds
+``capacity`` the oldest records are overwritten. Names of queries and
+errors are stored next to the trace in a ``.names`` text file, since
+records only carry their numeric ids.
+"""
+
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from .exceptions import TraceFileFormatError
+
+
+MAGIC = b"DBLT"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQQ")
+RECORD = struct.Struct("<IqqqiI")
+# Offset of the "count" field in the header
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 16
+
+
+@dataclass
+class TraceRecord:
+    query: str
+    start_ns: int
+    duration_ns: int
+    rows: int
+    error: str
+    worker: int
+
+
+def _id(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+class TraceRecorder:
+    """Append-only recorder into a memory-mapped ring file.
+
+    Args:
+        path (str): Path to the trace file. Created or truncated.
+        capacity (int): Maximum number of records kept in the file.
+    """
+
+    def __init__(self, path: Union[str, Path], capacity: int = 1_000_000):
+        self.path = Path(path)
+        self.capacity = max(capacity, 1)
+        self.pid = os.getpid()
+
+        size = HEADER.size + RECORD.size * self.capacity
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("wb") as f:
+            f.truncate(size)
+        self._file = self.path.open("r+b")
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        HEADER.pack_into(
+            self._mm, 0, MAGIC, VERSION, RECORD.size, self.capacity, 0, self.pid
+        )
+
+        self._names_path = self.path.with_suffix(".names")
+        self._names = self._names_path.open("w")
+        self._known: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # ``next()`` on itertools.count is atomic under the GIL
+        self._counter = itertools.count()
+        # Records may finish out of order, the header count only grows
+        self._count_lock = threading.Lock()
+        self._written = 0
+
+    def _intern(self, kind: str, name: str) -> int:
+        """Get numeric id of a name, writing it to the names file once."""
+
+        key = f"{kind}{name}"
+        ident = self._known.get(key)
+        if ident is None:
+            ident = _id(name)
+            with self._lock:
+                if key not in self._known:
+                    self._names.write(f"{kind}\t{ident}\t{name}\n")
+                    self._names.flush()
+                    self._known[key] = ident
+        return ident
+
+    def record(
+        self,
+        query: str,
+        start_ns: int,
+        duration_ns: int,
+        rows: int = -1,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Append one record to the ring."""
+
+        n = next(self._counter)
+        error_code = 0
+        if error is not None:
+            error_code = self._intern("e", type(error).__name__) & 0x7FFFFFFF
+        RECORD.pack_into(
+            self._mm,
+            HEADER.size + (n % self.capacity) * RECORD.size,
+            self._intern("q", query),
+            start_ns,
+            duration_ns,
+            rows,
+            error_code,
+            threading.get_native_id() & 0xFFFFFFFF,
+        )
+        with self._count_lock:
+            if n + 1 > self._written:
+                self._written = n + 1
+                COUNT.pack_into(self._mm, COUNT_OFFSET, self._written)
+
+    def close(self) -> None:
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+        self._names.close()
+
+
+class _TracerHolder:
+    """Per-process holder of the active recorder."""
+
+    recorder: Optional[TraceRecorder] = None
+    pid: Optional[int] = None
+
+
+def start_tracing(
+    directory: Union[str, Path], capacity: int = 1_000_000
+) -> TraceRecorder:
+    """Start recording into ``<directory>/trace-<pid>.bin``."""
+
+    pid = os.getpid()
+    path = Path(directory) / f"trace-{pid}.bin"
+    _TracerHolder.recorder = TraceRecorder(path, capacity)
+    _TracerHolder.pid = pid
+    logger.debug(f"Recording statement trace into '{path}'.")
+    return _TracerHolder.recorder
+
+
+def get_tracer() -> Optional[TraceRecorder]:
+    """Get recorder of the current process, if tracing is enabled.
+
+    Tracing is enabled by the ``trace`` config setting pointing to a
+    directory. Forked processes get their own trace file on first use.
+    """
+
+    if _TracerHolder.pid == os.getpid():
+        return _TracerHolder.recorder
+
+    from .config_singleton import get_config
+
+    cfg = get_config()
+    if not cfg.trace:
+        _TracerHolder.recorder = None
+        _TracerHolder.pid = os.getpid()
+        return None
+
+    return start_tracing(cfg.trace, cfg.trace_capacity)
+
+
+def _read_names(path: Path) -> Tuple[Dict[int, str], Dict[int, str]]:
+    queries: Dict[int, str] = {}
+    errors: Dict[int, str] = {0: ""}
+    names_path = path.with_suffix(".names")
+    if names_path.exists():
+        for line in names_path.read_text().splitlines():
+            kind, ident, name = line.split("\t", 2)
+            if kind == "q":
+                queries[int(ident)] = name
+            else:
+                errors[int(ident) & 0x7FFFFFFF] = name
+    return queries, errors
+
+
+def read_trace(path: Union[str, Path]) -> List[TraceRecord]:
+    """Read all records kept in a trace file, ordered by start time.
+
+    Raises:
+        TraceFileFormatError: when the file is not a trace file.
+    """
+
+    path = Path(path)
+    data = path.read_bytes()
+    if len(data) < HEADER.size:
+        raise TraceFileFormatError(path)
+    magic, version, record_size, capacity, count, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise TraceFileFormatError(path)
+
+    queries, errors = _read_names(path)
+    kept = min(count, capacity)
+    first = count - kept
+
+    records = []
+    for n in range(first, count):
+        qid, start, duration, rows, error, worker = RECORD.unpack_from(
+            data, HEADER.size + (n % capacity) * RECORD.size
+        )
+        records.append(
+            TraceRecord(
+                query=queries.get(qid, str(qid)),
+                start_ns=start,
+                duration_ns=duration,
+                rows=rows,
+                error=errors.get(error, str(error)),
+                worker=worker,
+            )
+        )
+    records.sort(key=lambda r: r.start_ns)
+    return records
+
+
+def merge_traces(paths: List[Union[str, Path]]) -> Iterator[TraceRecord]:
+    """Merge several per-process traces into one time-ordered stream."""
+
+    return heapq.merge(
+        *(read_trace(p) for p in paths), key=lambda r: r.start_ns
+    )
+
+
+def _percentile(ordered: List[int], p: float) -> int:
+    if not ordered:
+        return 0
+    index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(records: Iterator[TraceRecord]) -> Dict[str, Dict]:
+    """Summarize records per query.
+
+    Returns:
+        Dict keyed by query name with ``count``, ``errors``, ``rows``,
+        ``mean_ms``, ``p50_ms``, ``p99_ms`` and ``max_ms``.
+    """
+
+    durations: Dict[str, List[int]] = {}
+    summary: Dict[str, Dict] = {}
+    for r in records:
+        s = summary.get(r.query)
+        if s is None:
+            s = summary[r.query] = dict(count=0, errors=0, rows=0)
+            durations[r.query] = []
+        s["count"] += 1
+        s["errors"] += 1 if r.error else 0
+        s["rows"] += max(r.rows, 0)
+        durations[r.query].append(r.duration_ns)
+
+    for name, values in durations.items():
+        values.sort()
+        s = summary[name]
+        s["mean_ms"] = sum(values) / len(values) / 1e6
+        s["p50_ms"] = _percentile(values, 50) / 1e6
+        s["p99_ms"] = _percentile(values, 99) / 1e6
+        s["max_ms"] = values[-1] / 1e6
+    return summary